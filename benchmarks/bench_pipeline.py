@@ -0,0 +1,204 @@
+"""Benchmark every stage of the report pipeline at several export sizes.
+
+Synthetic exports of each size are generated with a fixed seed, then
+every stage is timed on its own, taking the fastest of a few repeats,
+and its peak memory use is measured with tracemalloc in a separate run
+so that tracing doesn't affect the timings.
+
+Stages:
+
+- divide_up_csv_lines: Splitting the export text into workouts and sets.
+- preprocess_sets: Building the sets DataFrame from the divided lines.
+- preprocess_data: Parsing the export file into both DataFrames.
+- get_all_exercises_dfs: Aggregating the sets per exercise and workout.
+- generate_plots: Rendering the plots of the ten most trained exercises.
+- store_save: Saving all DataFrames of the export to the training store.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --sizes 100 10000 1000000
+
+Compare with, or replace, the stored baseline with '--compare' or
+'--save' followed by benchmarks/baseline.json. Saved results record the
+commit they were measured at. The stored baseline was measured at the
+original code, before any of the optimizations, on the same synthetic
+exports. It has no store_save stage, since there was no store yet.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+
+from strengthstats.analysis.preprocessor import (
+    divide_up_csv_lines,
+    get_all_exercises_dfs,
+    preprocess_data,
+    preprocess_sets,
+    preprocess_workouts,
+)
+from strengthstats.analysis.store import TrainingStore
+from strengthstats.analysis.synthetic import generate_export
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+MIB = 1024 * 1024
+
+
+def time_stage(func: Callable[[], Any], repeats: int) -> float:
+    """Return the fastest wall-clock time of func over repeats runs."""
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def peak_memory(func: Callable[[], Any]) -> float:
+    """Return the peak memory allocated while running func, in MiB."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak / MIB
+
+
+def git_commit() -> str | None:
+    """Return the commit of the benchmarked checkout, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_size(
+    n_sets: int, repeats: int, plot_workers: int, tempdir: str
+) -> dict[str, dict[str, float]]:
+    """Benchmark all stages on an export with n_sets sets."""
+    from strengthstats.analysis.visualizer import render_plot_jobs
+
+    # Imported here, since importing the app creates its data folder
+    from strengthstats.webapp.app import plan_plots
+
+    export_path = os.path.join(tempdir, f"export_{n_sets}.csv")
+    generate_export(export_path, n_sets, seed=n_sets)
+
+    sets_csv, workouts_csv = divide_up_csv_lines(export_path)
+    workouts_df = preprocess_workouts(workouts_csv)
+    sets_df, parsed_workouts_df = preprocess_data(export_path)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    store = TrainingStore(os.path.join(tempdir, f"store_{n_sets}.sqlite3"))
+
+    def render_plots() -> None:
+        # A new directory every time, so that no plot is skipped as
+        # unchanged
+        plots_dir = tempfile.mkdtemp(dir=tempdir)
+        plot_jobs = plan_plots(sets_df, exercise_dfs, plots_dir)
+        render_plot_jobs(plot_jobs[:10], workers=plot_workers)
+        shutil.rmtree(plots_dir)
+
+    stages: dict[str, Callable[[], Any]] = {
+        "divide_up_csv_lines": lambda: divide_up_csv_lines(export_path),
+        "preprocess_sets": lambda: preprocess_sets(sets_csv, workouts_df),
+        "preprocess_data": lambda: preprocess_data(export_path),
+        "get_all_exercises_dfs": lambda: get_all_exercises_dfs(sets_df),
+        "generate_plots": render_plots,
+        "store_save": lambda: store.save(
+            "benchmark", "digest", sets_df, parsed_workouts_df, exercise_dfs
+        ),
+    }
+
+    results = {}
+    for stage, func in stages.items():
+        results[stage] = {
+            "seconds": time_stage(func, repeats),
+            "peak_mib": peak_memory(func),
+        }
+        print(
+            f"{n_sets:>10} {stage:<22} {results[stage]['seconds']:>10.4f} s"
+            f" {results[stage]['peak_mib']:>10.1f} MiB",
+            file=sys.stderr,
+        )
+
+    return results
+
+
+def compare(
+    results: dict[str, dict[str, dict[str, float]]],
+    baseline: dict[str, dict[str, dict[str, float]]],
+) -> None:
+    """Print the results relative to a baseline, per size and stage."""
+    print(f"{'sets':>10} {'stage':<22} {'time':>10} {'memory':>10}")
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            time_ratio = result["seconds"] / base["seconds"]
+            memory_ratio = result["peak_mib"] / max(base["peak_mib"], 1e-6)
+            print(f"{size:>10} {stage:<22} {time_ratio:>9.2f}x {memory_ratio:>9.2f}x")
+
+
+def main() -> None:
+    """Run the benchmarks with options from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--plot-workers", type=int, default=1)
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        results = {
+            str(n_sets): bench_size(n_sets, args.repeats, args.plot_workers, tempdir)
+            for n_sets in args.sizes
+        }
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                    "machine": platform.machine(),
+                    "cpus": os.cpu_count(),
+                    "repeats": args.repeats,
+                    "plot_workers": args.plot_workers,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
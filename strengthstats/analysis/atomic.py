@@ -0,0 +1,96 @@
+"""Atomic replacement of directories of derived files.
+
+Derived files, like columnar files, ingestion states or rendered
+reports, are written to a temporary directory next to their final
+location, which then replaces the old directory in two renames. Readers
+never see a partially written directory, only the old one, the new one
+or briefly none. Single files, like rendered plots, are written to a
+temporary file next to them instead, which replaces them in one rename,
+so readers see either the old or the new file.
+
+Several writers may replace the same directory at the same time, e.g.
+a report job and a request both loading the export of a user. The
+directories they write hold the same content, or content that readers
+check against a digest or key, so a writer that loses the race drops
+its temporary directory instead of failing.
+
+This module only uses the standard library, so that light modules of
+the web app can use it.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def make_temp_dir(directory: str) -> str:
+    """Create a temporary directory next to directory to write into.
+
+    Return:
+        The path of the temporary directory, to pass to
+        'replace_directory'.
+    """
+    parent_dir = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent_dir, exist_ok=True)
+
+    return tempfile.mkdtemp(dir=parent_dir, prefix=".tmp-")
+
+
+def replace_directory(tmp_dir: str, directory: str) -> bool:
+    """Put a directory from 'make_temp_dir' in place of directory.
+
+    Return:
+        Whether tmp_dir is now in place, as opposed to dropped because
+        another writer put its directory in place at the same time.
+    """
+    old_dir = f"{tmp_dir}-old"
+    try:
+        os.rename(directory, old_dir)
+    except FileNotFoundError:
+        # Nothing to replace yet, or another writer moved it away
+        pass
+
+    try:
+        os.rename(tmp_dir, directory)
+    except OSError:
+        logger.info(f"Another writer replaced {directory} at the same time")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        replaced = False
+    else:
+        replaced = True
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    return replaced
+
+
+@contextmanager
+def replacing_file(path: str) -> Iterator[str]:
+    """Write a file to a temporary path, then put it in place of path.
+
+    The temporary file is in the same directory, and has the same
+    extension as path, e.g. for writers that pick the format by it. If
+    writing raises, the temporary file is removed and path is left
+    unchanged.
+
+    Yield:
+        The path of the temporary file to write to.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".tmp-", suffix=os.path.splitext(name)[1]
+    )
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,186 @@
+"""Content-addressed cache of DataFrames parsed from exports.
+
+Parsing a StrengthLog export and aggregating it into exercise
+DataFrames is the most expensive part of generating a report. Since
+the result only depends on the content of the export, it is stored on
+disk under a hash of that content, so a reload of the report or a
+re-upload of an identical file only needs to hash the file and load
+the DataFrames back.
+
+Each cache entry is a directory named after the content hash, with
+one pickle file per DataFrame. Pickled DataFrames are stored as their
+internal column blocks, so loading them is a binary copy and needs no
+parsing. The total size of the cache is bounded, and the least
+recently used entries are evicted first.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+from pandas import DataFrame
+
+from strengthstats.analysis.constants import ET
+
+logger = logging.getLogger(__name__)
+
+# Bump when the schema of cached DataFrames or ingestion states changes
+CACHE_FORMAT_VERSION = 5
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SETS_FILE = "sets.pkl"
+WORKOUTS_FILE = "workouts.pkl"
+
+
+def hash_export(data_path: str) -> str:
+    """Return a hex digest identifying the content of an export.
+
+    Args:
+        data_path: Path to a StrengthLog app exported CSV.
+
+    Return:
+        SHA-256 hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _exercises_file(exercise_type: ET) -> str:
+    """Return the name of the file for exercises of the given type."""
+    return f"exercises_{exercise_type.name}.pkl"
+
+
+def save_frames(
+    directory: str,
+    sets_df: DataFrame,
+    workouts_df: DataFrame,
+    exercise_dfs: dict[ET, DataFrame],
+) -> None:
+    """Write the DataFrames of a parsed export to a directory."""
+    sets_df.to_pickle(os.path.join(directory, SETS_FILE))
+    workouts_df.to_pickle(os.path.join(directory, WORKOUTS_FILE))
+    for exercise_type, exercise_df in exercise_dfs.items():
+        exercise_df.to_pickle(os.path.join(directory, _exercises_file(exercise_type)))
+
+
+def load_frames(directory: str) -> tuple[DataFrame, DataFrame, dict[ET, DataFrame]]:
+    """Read the DataFrames of a parsed export written by save_frames."""
+    sets_df = pd.read_pickle(os.path.join(directory, SETS_FILE))
+    workouts_df = pd.read_pickle(os.path.join(directory, WORKOUTS_FILE))
+    exercise_dfs = {
+        exercise_type: pd.read_pickle(
+            os.path.join(directory, _exercises_file(exercise_type))
+        )
+        for exercise_type in ET
+    }
+
+    return sets_df, workouts_df, exercise_dfs
+
+
+def _directory_size(path: str) -> int:
+    """Return the total size in bytes of the files in a directory."""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class ExportCache:
+    """Size-bounded LRU cache of parsed exports keyed by content."""
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        """Create a cache holding at most max_bytes in cache_dir."""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, digest: str) -> str:
+        """Return the directory of the cache entry for a digest."""
+        return os.path.join(self.cache_dir, f"{digest}-v{CACHE_FORMAT_VERSION}")
+
+    def get(
+        self, digest: str
+    ) -> tuple[DataFrame, DataFrame, dict[ET, DataFrame]] | None:
+        """Load the DataFrames of a cached export.
+
+        Args:
+            digest: Content hash of the export, from 'hash_export'.
+
+        Return:
+            The sets DataFrame, the workouts DataFrame and the exercise
+            DataFrames per exercise type, or None if not cached.
+        """
+        entry_dir = self._entry_dir(digest)
+        if not os.path.isdir(entry_dir):
+            return None
+
+        try:
+            frames = load_frames(entry_dir)
+        except Exception:
+            logger.warning(f"Discarding unreadable cache entry {entry_dir}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        # The modification time of the entry marks when it was last used
+        os.utime(entry_dir)
+
+        return frames
+
+    def put(
+        self,
+        digest: str,
+        sets_df: DataFrame,
+        workouts_df: DataFrame,
+        exercise_dfs: dict[ET, DataFrame],
+    ) -> None:
+        """Store the DataFrames of a parsed export in the cache.
+
+        Args:
+            digest: Content hash of the export, from 'hash_export'.
+            sets_df: DataFrame with one set per row.
+            workouts_df: DataFrame with one workout per row.
+            exercise_dfs: Exercise DataFrames per exercise type.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_dir = self._entry_dir(digest)
+
+        # Write to a temporary directory first so that readers never see
+        # a partially written entry.
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            save_frames(tmp_dir, sets_df, workouts_df, exercise_dfs)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another request stored the same export in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=entry_dir)
+
+    def evict(self, keep: str | None = None) -> None:
+        """Remove least recently used entries until within max_bytes.
+
+        Args:
+            keep: Entry directory that should not be evicted.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and not entry.name.startswith("."):
+                entries.append(
+                    (entry.stat().st_mtime, _directory_size(entry.path), entry.path)
+                )
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total_bytes -= size
+            logger.info(f"Evicted cache entry {path}")
@@ -0,0 +1,233 @@
+"""Memory-mapped columnar files of parsed exports.
+
+The DataFrames of a parsed export are written as one binary .npy file
+per column, in the fixed-width dtype of the column, together with a
+JSON layout of the DataFrame. Opening them memory-maps the column files
+and wraps them in a DataFrame without copying, so the data is only read
+from disk as it is used, and all processes serving the same user share
+the pages of the files in the page cache instead of each holding a
+private copy.
+
+Columns are encoded as:
+
+- Plain NumPy columns (integers, floats, booleans and dates): as is.
+- Nullable columns like 'Int32': a values file and a mask file.
+- Categorical columns, like the exercise names: a file with the codes,
+  with the categories (the exercise-name dictionary) in the layout.
+- Other columns, like strings: dictionary encoded like categoricals,
+  and converted back to their dtype when opened, which copies them.
+
+Files are mapped copy-on-write, so the DataFrames can be changed like
+any other without affecting the files or other processes.
+"""
+
+import json
+import logging
+import os
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from strengthstats.analysis.atomic import make_temp_dir, replace_directory
+from strengthstats.analysis.constants import ET
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the files changes
+COLUMNAR_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+LAYOUT_FILE = "layout.json"
+INDEX_COLUMN = "__index__"
+
+
+def _frame_dirs() -> list[str]:
+    """Return the names of the directories of the DataFrames."""
+    return [
+        "sets",
+        "workouts",
+        *(f"exercises_{exercise_type.name}" for exercise_type in ET),
+    ]
+
+
+def write_frames(
+    directory: str,
+    digest: str,
+    sets_df: DataFrame,
+    workouts_df: DataFrame,
+    exercise_dfs: dict[ET, DataFrame],
+) -> None:
+    """Replace the columnar files of a user with a parsed export.
+
+    The files are written to a temporary directory that then replaces
+    the old one, so that readers never see a partially written export.
+
+    Args:
+        directory: Directory of the columnar files, e.g. in the user
+        folder.
+        digest: Content hash of the export the DataFrames are from.
+        sets_df: Sets DataFrame of the export.
+        workouts_df: Workouts DataFrame of the export.
+        exercise_dfs: Exercise DataFrames of the export.
+    """
+    tmp_dir = make_temp_dir(directory)
+    frames = [sets_df, workouts_df, *(exercise_dfs[t] for t in ET)]
+    for name, df in zip(_frame_dirs(), frames):
+        write_columns(os.path.join(tmp_dir, name), df)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump({"version": COLUMNAR_FORMAT_VERSION, "digest": digest}, f)
+
+    if replace_directory(tmp_dir, directory):
+        logger.info(f"Wrote columnar files of export {digest} to {directory}")
+
+
+def read_digest(directory: str) -> str | None:
+    """Return the hash of the export in a columnar directory, if any."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != COLUMNAR_FORMAT_VERSION:
+        return None
+
+    return str(manifest["digest"])
+
+
+def open_frames(
+    directory: str, digest: str | None = None
+) -> tuple[DataFrame, DataFrame, dict[ET, DataFrame]] | None:
+    """Memory-map the DataFrames of a parsed export.
+
+    Args:
+        directory: Directory passed to 'write_frames'.
+        digest: If given, only open the DataFrames if they are from the
+        export with this content hash.
+
+    Return:
+        The sets, workouts and exercise DataFrames, or None if there
+        are no (matching or readable) columnar files.
+    """
+    stored_digest = read_digest(directory)
+    if stored_digest is None or (digest is not None and stored_digest != digest):
+        return None
+
+    try:
+        sets_df, workouts_df, *exercise_frames = [
+            read_columns(os.path.join(directory, name)) for name in _frame_dirs()
+        ]
+    except (OSError, ValueError, KeyError):
+        logger.warning(f"Ignoring unreadable columnar files in {directory}")
+        return None
+
+    return sets_df, workouts_df, dict(zip(ET, exercise_frames))
+
+
+def write_columns(directory: str, df: DataFrame) -> None:
+    """Write every column of a DataFrame to its own .npy file.
+
+    Args:
+        directory: Directory to create for the files.
+        df: DataFrame with unique column names.
+    """
+    os.makedirs(directory)
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df.iloc[:, position]
+        file_prefix = os.path.join(directory, str(position))
+        columns.append({"name": column, **_write_array(file_prefix, values)})
+
+    layout: dict[str, Any] = {"columns": columns, "index_name": df.index.name}
+    if isinstance(df.index, pd.RangeIndex):
+        layout["range_index"] = [df.index.start, df.index.stop, df.index.step]
+    else:
+        prefix = os.path.join(directory, INDEX_COLUMN)
+        layout["index"] = _write_array(prefix, df.index)
+    with open(os.path.join(directory, LAYOUT_FILE), "w") as f:
+        json.dump(layout, f)
+
+
+def read_columns(directory: str) -> DataFrame:
+    """Memory-map the files of a DataFrame from 'write_columns'."""
+    with open(os.path.join(directory, LAYOUT_FILE)) as f:
+        layout = json.load(f)
+
+    arrays = {
+        column["name"]: _read_array(os.path.join(directory, str(position)), column)
+        for position, column in enumerate(layout["columns"])
+    }
+    if "range_index" in layout:
+        start, stop, step = layout["range_index"]
+        index = pd.RangeIndex(start, stop, step, name=layout["index_name"])
+    else:
+        index = pd.Index(
+            _read_array(os.path.join(directory, INDEX_COLUMN), layout["index"]),
+            name=layout["index_name"],
+            copy=False,
+        )
+
+    # Without copying, every column keeps its own memory-mapped array
+    return DataFrame(arrays, index=index, copy=False)
+
+
+def _write_array(file_prefix: str, values: pd.Series | pd.Index) -> dict[str, Any]:
+    """Write the values of a column and return how they are encoded."""
+    dtype = values.dtype
+    array = values.array
+    if isinstance(array, pd.Categorical):
+        np.save(f"{file_prefix}.npy", array.codes)
+        return {
+            "encoding": "categorical",
+            "categories": array.categories.tolist(),
+            "ordered": bool(array.ordered),
+        }
+    if isinstance(array, pd.arrays.IntegerArray | pd.arrays.FloatingArray):
+        np.save(
+            f"{file_prefix}.npy",
+            array.to_numpy(dtype=str(dtype).lower(), na_value=0),
+        )
+        np.save(f"{file_prefix}.mask.npy", array.isna())
+        return {"encoding": "masked"}
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        plain = values.to_numpy()
+        # Unpickled arrays can have metadata on their dtype, which NumPy
+        # warns about and doesn't save, so view them without it
+        np.save(f"{file_prefix}.npy", plain.view(np.dtype(plain.dtype.str)))
+        return {"encoding": "plain"}
+
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    np.save(f"{file_prefix}.npy", codes)
+    return {
+        "encoding": "dictionary",
+        "dtype": str(dtype),
+        "categories": [str(value) for value in uniques],
+    }
+
+
+def _read_array(file_prefix: str, column: dict[str, Any]) -> Any:
+    """Memory-map the values of a column written by '_write_array'."""
+    data = _map(f"{file_prefix}.npy")
+    encoding = column["encoding"]
+    if encoding == "plain":
+        return data
+    if encoding == "masked":
+        mask = _map(f"{file_prefix}.mask.npy")
+        if data.dtype.kind == "f":
+            return pd.arrays.FloatingArray(data, mask, copy=False)
+        return pd.arrays.IntegerArray(data, mask, copy=False)
+    categorical = pd.Categorical.from_codes(
+        data,
+        categories=column["categories"],
+        ordered=column.get("ordered", False),
+    )
+    if encoding == "categorical":
+        return categorical
+
+    return pd.array(np.asarray(categorical, dtype=object), dtype=column["dtype"])
+
+
+def _map(path: str) -> np.ndarray[Any, Any]:
+    """Memory-map a .npy file copy-on-write, as a plain ndarray view."""
+    data: np.ndarray[Any, Any] = np.load(path, mmap_mode="c")
+    return data.view(np.ndarray)
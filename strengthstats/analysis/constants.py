@@ -2,6 +2,9 @@
 
 from enum import Enum, auto
 
+# Line separating the header of an export from the workouts
+DIVIDING_LINE = "Name,Date,Body weight,Shape,Sleep,Calories,Stress"
+
 
 class ET(Enum):
     """Class holding names of exercise types."""
@@ -0,0 +1,112 @@
+"""Downsampling of long series before they are plotted.
+
+A plot a few hundred pixels wide can't show more than about as many
+points, so series of users with years of training are reduced to a
+point budget first. Points are picked with the Largest-Triangle-Three-
+Buckets (LTTB) algorithm: the first and last points are kept, the rest
+of the series is split into equally sized buckets, and from every
+bucket the point forming the largest triangle with the point picked
+from the previous bucket and the average of the next bucket is kept.
+This keeps the peaks and dips that give a series its visual shape,
+unlike taking every n-th point or averaging.
+
+Series that are not longer than a threshold are left untouched.
+"""
+
+import logging
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# LTTB keeps the first and last point, and at least one in between
+MIN_POINTS = 3
+
+
+def lttb_indices(
+    x: np.ndarray[Any, Any], y: np.ndarray[Any, Any], n_out: int
+) -> np.ndarray[Any, Any]:
+    """Pick the points of a series to keep with LTTB.
+
+    Args:
+        x: Increasing x values of the series, numbers or datetime64.
+        y: The y values of the series. Missing values count as zero
+        when picking points.
+        n_out: Number of points to keep, at least 3.
+
+    Return:
+        The sorted indices of the kept points.
+
+    Raises:
+        ValueError: If n_out is less than 3.
+    """
+    if n_out < MIN_POINTS:
+        raise ValueError(f"At least {MIN_POINTS} points must be kept")
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = np.nan_to_num(np.asarray(y, dtype="float64"))
+    # Bucket edges of the points between the first and the last one
+    edges = np.linspace(1, n - 1, n_out - 1).astype("int64")
+    # Averages of every bucket, with the last point as the bucket after
+    # the last one
+    sums_x = np.add.reduceat(x[: n - 1], edges[:-1])
+    sums_y = np.add.reduceat(y[: n - 1], edges[:-1])
+    sizes = np.diff(edges)
+    next_x = np.append(sums_x[1:] / sizes[1:], x[-1])
+    next_y = np.append(sums_y[1:] / sizes[1:], y[-1])
+
+    indices = np.empty(n_out, dtype="int64")
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        prev_x, prev_y = x[previous], y[previous]
+        # Twice the area of the triangles, the factor doesn't matter
+        areas = np.abs(
+            (prev_x - next_x[bucket]) * (y[start:stop] - prev_y)
+            - (prev_x - x[start:stop]) * (next_y[bucket] - prev_y)
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+
+    return indices
+
+
+def downsample_indices(
+    x: np.ndarray[Any, Any],
+    y: np.ndarray[Any, Any],
+    max_points: int,
+    threshold: int | None = None,
+) -> np.ndarray[Any, Any]:
+    """Pick the points of a series to plot within a point budget.
+
+    Args:
+        x: Increasing x values of the series, numbers or datetime64.
+        y: The y values of the series.
+        max_points: Number of points to reduce long series to.
+        threshold: Series with at most this many points are kept as
+        they are, max_points by default.
+
+    Return:
+        The sorted indices of the points to plot.
+    """
+    if len(x) <= (max_points if threshold is None else threshold):
+        return np.arange(len(x))
+
+    indices = lttb_indices(x, y, max_points)
+    logger.debug(f"Downsampled a series of {len(x)} points to {len(indices)}")
+
+    return indices
+
+
+def _as_float(x: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    """Return x values as floats, dates as days since the epoch."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return (x - np.datetime64("1970-01-01")) / np.timedelta64(1, "D")
+    return x.astype("float64")
@@ -0,0 +1,13 @@
+"""Exceptions raised when an export can't be analysed."""
+
+
+class ExportError(Exception):
+    """Base class for problems with a StrengthLog export."""
+
+
+class NotAnExportError(ExportError):
+    """Raised when a file is not a StrengthLog app export."""
+
+
+class NoWorkoutsError(ExportError):
+    """Raised when an export does not contain any workouts."""
@@ -0,0 +1,345 @@
+"""Incremental ingestion of repeatedly uploaded exports.
+
+Users typically export their full StrengthLog history again every time
+they want an updated report, so each new export is mostly the same as
+the previous one with a few new workouts. Exports list the newest
+workout first, so new workouts are added at the start of the file.
+
+Instead of parsing everything again, a fingerprint of every workout
+block is kept together with the DataFrames from the previous ingestion.
+Workouts are ingested oldest first, and workout indices count from the
+oldest workout, unlike in 'preprocess_data', which numbers them in the
+order of the file. An export is first streamed through once, keeping
+only the fingerprint and byte offset of each block. When the export
+comes after an earlier one, the longest run of unchanged oldest
+workouts is skipped, and only the blocks of the newer workouts are read
+again and appended. Workout indices of the unchanged workouts stay the
+same. Otherwise all blocks are read again by offset, oldest first, so
+that only one block at a time is held in memory.
+
+Weekly and monthly rollups of the exercises are kept with the state as
+well, and only the periods that new workouts fall in are rolled up
+again. The same goes for the estimated one-rep maxes and personal
+records, which are extended with the sets of the new workouts.
+
+If any previously ingested workout was changed or removed, the export
+is ingested from scratch instead.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Callable, Iterable
+from typing import IO, NamedTuple
+
+import pandas as pd
+from pandas import DataFrame
+
+from strengthstats.analysis.atomic import make_temp_dir, replace_directory
+from strengthstats.analysis.cache import CACHE_FORMAT_VERSION, load_frames, save_frames
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.exceptions import NoWorkoutsError
+from strengthstats.analysis.instrumentation import instrument
+from strengthstats.analysis.preprocessor import (
+    WorkoutBlock,
+    get_all_exercises_dfs,
+    index_workout_blocks,
+    preprocess_blocks,
+    read_workout_blocks,
+    share_exercise_categories,
+)
+from strengthstats.analysis.records import compute_records, extend_records
+from strengthstats.analysis.rollups import Period, compute_rollups, refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "state.json"
+RECORDS_FILE = "records.pkl"
+# Rows of one workout are all in the old frames or all in the tail, and
+# already ordered by exercise name there, so a stable sort keeps that
+EXERCISE_SORT_COLUMNS = ["Date", "workout_index"]
+
+
+def fingerprint_block(block: WorkoutBlock) -> str:
+    """Return a fingerprint of the raw content of a workout block."""
+    digest = hashlib.blake2b(digest_size=16)
+    for row in (block.workout, *block.sets):
+        digest.update("\x1f".join(row).encode())
+        digest.update(b"\x1e")
+
+    return digest.hexdigest()
+
+
+class IngestionState(NamedTuple):
+    """What is kept about the previously ingested export of a user."""
+
+    fingerprints: list[str]
+    set_rows: int
+    frames: tuple[DataFrame, DataFrame, dict[ET, DataFrame]]
+    rollups: dict[Period, DataFrame]
+    records: DataFrame
+
+
+class ExportIndex(NamedTuple):
+    """Fingerprints and positions of the workout blocks of an export."""
+
+    # Both oldest first
+    fingerprints: list[str]
+    offsets: list[int]
+    set_rows: int
+
+
+def index_export(export: IO[bytes]) -> ExportIndex:
+    """Fingerprint every workout block of an export in a single pass.
+
+    Args:
+        export: Binary file object with a StrengthLog app exported CSV.
+
+    Return:
+        The fingerprints and byte offsets of the blocks, oldest first,
+        and the number of set lines in the export.
+
+    Raises:
+        NotAnExportError: If the file is not a StrengthLog export.
+    """
+    fingerprints: list[str] = []
+    offsets: list[int] = []
+    set_rows = 0
+    for offset, block in index_workout_blocks(export):
+        fingerprints.append(fingerprint_block(block))
+        offsets.append(offset)
+        set_rows += len(block.sets)
+
+    return ExportIndex(fingerprints[::-1], offsets[::-1], set_rows)
+
+
+@instrument(rows=lambda frames: len(frames[0]))
+def ingest_export(
+    data_path: str,
+    state_dir: str,
+    on_aggregate: Callable[[], None] | None = None,
+) -> tuple[DataFrame, DataFrame, dict[ET, DataFrame]]:
+    """Ingest an export, only parsing workouts not seen before.
+
+    Workouts are ingested oldest first, so workout index 0 is the
+    oldest workout and the frames list sets and workouts in
+    chronological order, unlike a full parse of the export.
+
+    Args:
+        data_path: Path to a StrengthLog app exported CSV.
+        state_dir: Directory where the state of the previous ingestion
+        for the same user is kept.
+        on_aggregate: Called when parsing is done and aggregation of
+        the exercises starts, e.g. to report progress.
+
+    Return:
+        The sets DataFrame, the workouts DataFrame and the exercise
+        DataFrames per exercise type, for the whole export.
+
+    Raises:
+        NotAnExportError: If the file is not a StrengthLog export.
+        NoWorkoutsError: If the export does not contain any workouts.
+    """
+    state = _load_state(state_dir)
+
+    with open(data_path, "rb") as f:
+        index = index_export(f)
+
+        if state is not None:
+            unchanged = 0
+            for fingerprint, previous in zip(index.fingerprints, state.fingerprints):
+                if fingerprint != previous:
+                    break
+                unchanged += 1
+            if unchanged == len(state.fingerprints):
+                if unchanged == len(index.fingerprints):
+                    logger.info("No new workouts in export")
+                    return state.frames
+
+                tail = read_workout_blocks(f, index.offsets[unchanged:])
+                frames, rollups, records_df = _append_tail(state, tail, on_aggregate)
+                new_workouts = len(index.fingerprints) - unchanged
+                logger.info(f"Appended {new_workouts} new workouts")
+                _save_state(state_dir, index, frames, rollups, records_df)
+                return frames
+
+            logger.info("Previously ingested workouts changed, ingesting all")
+
+        sets_df, workouts_df = preprocess_blocks(read_workout_blocks(f, index.offsets))
+
+    if workouts_df.empty:
+        raise NoWorkoutsError("The CSV file does not contain any workouts")
+
+    if on_aggregate is not None:
+        on_aggregate()
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    rollups = {period: compute_rollups(exercise_dfs, period) for period in Period}
+    frames = (sets_df, workouts_df, exercise_dfs)
+    _save_state(state_dir, index, frames, rollups, compute_records(sets_df))
+
+    return frames
+
+
+def load_rollups(state_dir: str) -> dict[Period, DataFrame] | None:
+    """Load the rollups kept with the state of the last ingestion.
+
+    Args:
+        state_dir: Directory passed to 'ingest_export'.
+
+    Return:
+        The rollups of the last ingested export per period, or None if
+        there is no usable state.
+    """
+    try:
+        with open(os.path.join(state_dir, STATE_FILE)) as f:
+            state = json.load(f)
+        if state.get("version") != CACHE_FORMAT_VERSION:
+            return None
+        return _read_rollups(state_dir)
+    except Exception:
+        return None
+
+
+def load_records(state_dir: str) -> DataFrame | None:
+    """Load the records kept with the state of the last ingestion.
+
+    Args:
+        state_dir: Directory passed to 'ingest_export'.
+
+    Return:
+        The records of the last ingested export, like 'compute_records'
+        gives them, or None if there is no usable state.
+    """
+    try:
+        with open(os.path.join(state_dir, STATE_FILE)) as f:
+            state = json.load(f)
+        if state.get("version") != CACHE_FORMAT_VERSION:
+            return None
+        records_df: DataFrame = pd.read_pickle(os.path.join(state_dir, RECORDS_FILE))
+        return records_df
+    except Exception:
+        return None
+
+
+def _append_tail(
+    state: IngestionState,
+    tail: Iterable[WorkoutBlock],
+    on_aggregate: Callable[[], None] | None,
+) -> tuple[
+    tuple[DataFrame, DataFrame, dict[ET, DataFrame]], dict[Period, DataFrame], DataFrame
+]:
+    """Parse new workouts and append them to previous frames.
+
+    Args:
+        state: State of the previous ingestion.
+        tail: Blocks of the workouts newer than all of the previous
+        ones, oldest first.
+        on_aggregate: Called when parsing is done and aggregation of
+        the exercises starts.
+
+    Return:
+        The combined frames, the rollups with the periods of the tail
+        refreshed, and the records extended with the sets of the tail.
+    """
+    sets_df, workouts_df, exercise_dfs = state.frames
+
+    tail_sets_df, tail_workouts_df = preprocess_blocks(
+        tail, first_workout=len(state.fingerprints), first_set_row=state.set_rows
+    )
+    share_exercise_categories(sets_df, tail_sets_df)
+    all_sets_df = pd.concat([sets_df, tail_sets_df])
+    # Keys first seen in the tail are added after 'Date', move it last
+    all_sets_df["Date"] = all_sets_df.pop("Date")
+    all_workouts_df = pd.concat([workouts_df, tail_workouts_df])
+
+    if on_aggregate is not None:
+        on_aggregate()
+    # Aggregate a slice of the combined frame, so that the tail has all
+    # columns even if some keys only appear in older workouts.
+    tail_rows = slice(len(sets_df), None)
+    tail_exercise_dfs = get_all_exercises_dfs(all_sets_df.iloc[tail_rows])
+    records_df = extend_records(state.records, all_sets_df.iloc[tail_rows])
+    for exercise_type in ET:
+        share_exercise_categories(
+            all_sets_df, exercise_dfs[exercise_type], tail_exercise_dfs[exercise_type]
+        )
+    all_exercise_dfs = {
+        exercise_type: pd.concat(
+            [exercise_dfs[exercise_type], tail_exercise_dfs[exercise_type]]
+        )
+        .sort_values(EXERCISE_SORT_COLUMNS, kind="stable")
+        .reset_index(drop=True)
+        for exercise_type in ET
+    }
+    rollups = {
+        period: refresh_rollups(
+            state.rollups[period], all_exercise_dfs, tail_workouts_df["Date"], period
+        )
+        for period in Period
+    }
+
+    return (all_sets_df, all_workouts_df, all_exercise_dfs), rollups, records_df
+
+
+def _load_state(state_dir: str) -> IngestionState | None:
+    """Load the state of the previous ingestion, if there is one."""
+    state_path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get("version") != CACHE_FORMAT_VERSION:
+            logger.info(f"Ignoring outdated ingestion state in {state_dir}")
+            return None
+        frames = load_frames(state_dir)
+        rollups = _read_rollups(state_dir)
+        records_df = pd.read_pickle(os.path.join(state_dir, RECORDS_FILE))
+    except Exception:
+        logger.warning(f"Ignoring unreadable ingestion state in {state_dir}")
+        return None
+
+    return IngestionState(
+        state["fingerprints"], state["set_rows"], frames, rollups, records_df
+    )
+
+
+def _rollups_file(period: Period) -> str:
+    """Return the name of the file for rollups of the given period."""
+    return f"rollups_{period.name}.pkl"
+
+
+def _read_rollups(state_dir: str) -> dict[Period, DataFrame]:
+    """Read the rollups of every period from an ingestion state."""
+    return {
+        period: pd.read_pickle(os.path.join(state_dir, _rollups_file(period)))
+        for period in Period
+    }
+
+
+def _save_state(
+    state_dir: str,
+    index: ExportIndex,
+    frames: tuple[DataFrame, DataFrame, dict[ET, DataFrame]],
+    rollups: dict[Period, DataFrame],
+    records_df: DataFrame,
+) -> None:
+    """Replace the stored ingestion state with a new one."""
+    tmp_dir = make_temp_dir(state_dir)
+    save_frames(tmp_dir, *frames)
+    for period, rollups_df in rollups.items():
+        rollups_df.to_pickle(os.path.join(tmp_dir, _rollups_file(period)))
+    records_df.to_pickle(os.path.join(tmp_dir, RECORDS_FILE))
+    with open(os.path.join(tmp_dir, STATE_FILE), "w") as f:
+        json.dump(
+            {
+                "version": CACHE_FORMAT_VERSION,
+                "fingerprints": index.fingerprints,
+                "set_rows": index.set_rows,
+            },
+            f,
+        )
+
+    replace_directory(tmp_dir, state_dir)
@@ -0,0 +1,294 @@
+"""Timing, row count and memory instrumentation of pipeline stages.
+
+Pipeline functions are wrapped with the 'instrument' decorator, or
+blocks of code with the 'track' context manager, to record for every
+stage:
+
+- A histogram of how long the stage took.
+- How many rows the stage produced in total.
+- The largest peak of memory allocated while the stage ran, if memory
+  tracing is enabled. Tracing uses tracemalloc, which slows allocations
+  down noticeably, so it is off by default. Since tracemalloc is global
+  to the process, peaks of stages running concurrently in several
+  threads are approximate.
+
+The metrics are kept in memory for the lifetime of the process and can
+be rendered in the Prometheus text format with 'render_prometheus'.
+With 'collect_stages', the stages run by the current thread within a
+block can also be collected, e.g. to log a breakdown per request.
+
+When instrumentation is disabled with 'configure', the wrappers only
+check a flag before calling the wrapped function.
+"""
+
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, NamedTuple, ParamSpec, TypeVar
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+METRIC_PREFIX = "strengthstats_stage"
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class StageRecord:
+    """Measurements of one run of a stage."""
+
+    def __init__(self, stage: str) -> None:
+        """Start a record without any measurements."""
+        self.stage = stage
+        self.seconds = 0.0
+        self.rows: int | None = None
+        self.peak_bytes: int | None = None
+
+
+class _StageMetrics:
+    """Aggregated measurements of all runs of a stage."""
+
+    def __init__(self) -> None:
+        """Start with empty metrics."""
+        self.bucket_counts = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.seconds_sum = 0.0
+        self.rows = 0
+        self.peak_bytes = 0
+
+
+class _Settings(NamedTuple):
+    """What is instrumented."""
+
+    enabled: bool
+    trace_memory: bool
+
+
+_settings = _Settings(enabled=True, trace_memory=False)
+_metrics: dict[str, _StageMetrics] = {}
+_metrics_lock = threading.Lock()
+_local = threading.local()
+# Memory in use at the start of, and the peak of, every running stage,
+# per thread running stages
+_peak_stacks: dict[int, list[tuple[int, int]]] = {}
+_peak_lock = threading.Lock()
+
+
+def configure(enabled: bool = True, trace_memory: bool = False) -> None:
+    """Turn instrumentation and memory tracing on or off."""
+    global _settings
+
+    if trace_memory and enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not (trace_memory and enabled) and _settings.trace_memory:
+        tracemalloc.stop()
+    _settings = _Settings(enabled=enabled, trace_memory=trace_memory and enabled)
+
+
+def reset() -> None:
+    """Forget all recorded metrics."""
+    with _metrics_lock:
+        _metrics.clear()
+
+
+@contextmanager
+def track(stage: str) -> Iterator[StageRecord]:
+    """Record the duration of a block of code as a stage.
+
+    The yielded record can be given the number of rows the stage
+    processed, by setting its 'rows' attribute.
+    """
+    record = StageRecord(stage)
+    if not _settings.enabled:
+        yield record
+        return
+
+    trace_memory = _settings.trace_memory
+    if trace_memory:
+        _start_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        if trace_memory:
+            record.peak_bytes = _stop_peak()
+        _record(record)
+
+
+def instrument(
+    stage: str | None = None, rows: Callable[[Any], int] | None = None
+) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorate a function to record every call to it as a stage.
+
+    Args:
+        stage: Name of the stage, the name of the function by default.
+        rows: Function counting the rows in the return value.
+    """
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _settings.enabled:
+                return func(*args, **kwargs)
+            with track(name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record.rows = rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def collect_stages() -> Iterator[list[StageRecord]]:
+    """Collect the records of the stages run by this thread in a block.
+
+    Stages are collected in the order in which they finish, so nested
+    stages come before the stages enclosing them.
+    """
+    records = start_collecting()
+    try:
+        yield records
+    finally:
+        stop_collecting(records)
+
+
+def start_collecting() -> list[StageRecord]:
+    """Start collecting the stages run by this thread.
+
+    Same as 'collect_stages', for when the start and the end of the
+    collection are not in the same block.
+
+    Return:
+        The list that records of stages are appended to until it is
+        passed to 'stop_collecting'.
+    """
+    records: list[StageRecord] = []
+    collectors = getattr(_local, "collectors", None)
+    if collectors is None:
+        collectors = _local.collectors = []
+    collectors.append(records)
+
+    return records
+
+
+def stop_collecting(records: list[StageRecord]) -> None:
+    """Stop collecting stages into a list from 'start_collecting'."""
+    _local.collectors.remove(records)
+
+
+def format_stages(records: list[StageRecord]) -> str:
+    """Describe the duration and rows of stages on one line."""
+    parts = []
+    for record in records:
+        part = f"{record.stage} {record.seconds * 1000:.1f} ms"
+        if record.rows is not None:
+            part += f" ({record.rows} rows)"
+        parts.append(part)
+
+    return ", ".join(parts)
+
+
+def render_prometheus() -> str:
+    """Render the recorded metrics in the Prometheus text format."""
+    with _metrics_lock:
+        metrics = {
+            stage: (list(m.bucket_counts), m.count, m.seconds_sum, m.rows, m.peak_bytes)
+            for stage, m in sorted(_metrics.items())
+        }
+
+    lines = [
+        f"# HELP {METRIC_PREFIX}_duration_seconds Time spent in pipeline stages.",
+        f"# TYPE {METRIC_PREFIX}_duration_seconds histogram",
+    ]
+    for stage, (bucket_counts, count, seconds_sum, _, _) in metrics.items():
+        label = _label(stage)
+        for bound, bucket_count in zip(DURATION_BUCKETS, bucket_counts):
+            lines.append(
+                f'{METRIC_PREFIX}_duration_seconds_bucket{{{label},le="{bound}"}}'
+                f" {bucket_count}"
+            )
+        lines.append(
+            f'{METRIC_PREFIX}_duration_seconds_bucket{{{label},le="+Inf"}} {count}'
+        )
+        lines.append(f"{METRIC_PREFIX}_duration_seconds_sum{{{label}}} {seconds_sum}")
+        lines.append(f"{METRIC_PREFIX}_duration_seconds_count{{{label}}} {count}")
+
+    lines += [
+        f"# HELP {METRIC_PREFIX}_rows_total Rows produced by pipeline stages.",
+        f"# TYPE {METRIC_PREFIX}_rows_total counter",
+    ]
+    for stage, (_, _, _, rows, _) in metrics.items():
+        lines.append(f"{METRIC_PREFIX}_rows_total{{{_label(stage)}}} {rows}")
+
+    lines += [
+        f"# HELP {METRIC_PREFIX}_peak_bytes Largest memory peak of pipeline stages.",
+        f"# TYPE {METRIC_PREFIX}_peak_bytes gauge",
+    ]
+    for stage, (_, _, _, _, peak_bytes) in metrics.items():
+        lines.append(f"{METRIC_PREFIX}_peak_bytes{{{_label(stage)}}} {peak_bytes}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _label(stage: str) -> str:
+    """Return the stage label of a metric, escaped."""
+    escaped = stage.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'stage="{escaped}"'
+
+
+def _record(record: StageRecord) -> None:
+    """Add the measurements of one run of a stage to the metrics."""
+    with _metrics_lock:
+        metrics = _metrics.get(record.stage)
+        if metrics is None:
+            metrics = _metrics[record.stage] = _StageMetrics()
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if record.seconds <= bound:
+                metrics.bucket_counts[i] += 1
+        metrics.count += 1
+        metrics.seconds_sum += record.seconds
+        metrics.rows += record.rows or 0
+        metrics.peak_bytes = max(metrics.peak_bytes, record.peak_bytes or 0)
+
+    for records in getattr(_local, "collectors", ()):
+        records.append(record)
+
+
+def _start_peak() -> None:
+    """Start measuring the memory peak of a stage.
+
+    tracemalloc has a single peak for the whole process, which is reset
+    when a stage starts. The peak reached so far is saved first in the
+    innermost stage of every thread, and taken into account when those
+    stages end. Allocations are traced for all threads, so the peak of
+    a stage includes what stages running at the same time allocated.
+    """
+    with _peak_lock:
+        current, peak = tracemalloc.get_traced_memory()
+        for stack in _peak_stacks.values():
+            start, enclosing_peak = stack[-1]
+            stack[-1] = (start, max(enclosing_peak, peak))
+        _peak_stacks.setdefault(threading.get_ident(), []).append((current, current))
+        tracemalloc.reset_peak()
+
+
+def _stop_peak() -> int:
+    """Return the bytes allocated at the peak since '_start_peak'."""
+    thread_id = threading.get_ident()
+    with _peak_lock:
+        stack = _peak_stacks[thread_id]
+        start, peak = stack.pop()
+        if not stack:
+            del _peak_stacks[thread_id]
+        return max(peak, tracemalloc.get_traced_memory()[1]) - start
@@ -0,0 +1,53 @@
+"""Names of the files of rendered plots.
+
+Plots are saved in a plots directory as '<exercise>.png', next to a
+'<exercise>.fingerprint' file with the fingerprint of the data they were
+rendered from. Exercise names are user data, so characters that can't
+be in file names, or would escape the directory, are percent-encoded.
+
+This module doesn't import matplotlib, so that serving plots doesn't
+need the plotting stack.
+"""
+
+import os
+
+PLOT_EXTENSION = ".png"
+FINGERPRINT_EXTENSION = ".fingerprint"
+# Characters not allowed in file names on common file systems, and '%'
+# itself so that encoded names can't collide with other names
+UNSAFE_CHARS = frozenset('%/\\:*?"<>|')
+
+
+def plot_file_stem(exercise_name: str) -> str:
+    """Return the name of the files of an exercise, without extension.
+
+    Unsafe characters, control characters and a leading dot are
+    percent-encoded, other characters are kept as they are.
+    """
+    stem = "".join(
+        f"%{ord(char):02X}" if char in UNSAFE_CHARS or ord(char) < 32 else char
+        for char in exercise_name
+    )
+    if stem.startswith("."):
+        stem = f"%2E{stem[1:]}"
+
+    return stem
+
+
+def plot_path(dst_dir: str, exercise_name: str) -> str:
+    """Return the path of the plot of an exercise."""
+    return os.path.join(dst_dir, plot_file_stem(exercise_name) + PLOT_EXTENSION)
+
+
+def fingerprint_path(dst_dir: str, exercise_name: str) -> str:
+    """Return the path of the file with the fingerprint of a plot."""
+    return os.path.join(dst_dir, plot_file_stem(exercise_name) + FINGERPRINT_EXTENSION)
+
+
+def read_fingerprint(dst_dir: str, exercise_name: str) -> str | None:
+    """Return the fingerprint stored next to a plot, if there is one."""
+    try:
+        with open(fingerprint_path(dst_dir, exercise_name)) as f:
+            return f.read()
+    except OSError:
+        return None
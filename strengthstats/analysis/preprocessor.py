@@ -19,20 +19,183 @@ The three types:
   set of a given exercise in a given workout.
 """
 
+import codecs
 import csv
 import logging
-import sys
+from collections.abc import Callable, Iterable, Iterator
 from io import StringIO
-from typing import Any
+from typing import IO, Any, NamedTuple, cast
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
-from strengthstats.analysis.constants import ET
+from strengthstats.analysis.constants import DIVIDING_LINE, ET
+from strengthstats.analysis.exceptions import NotAnExportError, NoWorkoutsError
+from strengthstats.analysis.instrumentation import instrument
 
 logger = logging.getLogger(__name__)
 
+WORKOUT_COLUMNS = [
+    "Index",
+    "Name",
+    "Date",
+    "Body weight",
+    "Shape",
+    "Sleep",
+    "Calories",
+    "Stress",
+]
+WORKOUT_DTYPES = {
+    "Index": "int64",
+    "Name": "string",
+    "Date": "string",
+    "Body weight": "int16",
+    "Shape": "int8",
+    "Sleep": "int8",
+    "Calories": "int8",
+    "Stress": "int8",
+}
+
+
+class WorkoutBlock(NamedTuple):
+    """One workout in a StrengthLog export and the sets logged in it."""
+
+    workout: list[str]
+    sets: list[list[str]]
+
+
+def iter_workout_blocks(export: IO[str] | IO[bytes]) -> Iterator[WorkoutBlock]:
+    """Parse a StrengthLog export one workout at a time.
+
+    The export is read line by line in a single pass, so only the
+    workout currently being parsed is held in memory. Both text and
+    binary file objects are accepted, which means an upload stream can
+    be passed in directly without saving it to disk first.
+
+    Args:
+        export: File object with a StrengthLog app exported CSV.
+
+    Yield:
+        One block per workout, with the fields of the workout line and
+        the fields of each set line belonging to that workout.
+
+    Raises:
+        NotAnExportError: If the export has no line dividing the header
+        from the workouts.
+    """
+    if isinstance(export.read(0), bytes):
+        lines: Iterable[str] = codecs.iterdecode(cast(IO[bytes], export), "utf-8-sig")
+    else:
+        lines = cast(IO[str], export)
+
+    for _, block in _iter_blocks(lines, lambda: 0):
+        yield block
+
+
+def index_workout_blocks(export: IO[bytes]) -> Iterator[tuple[int, WorkoutBlock]]:
+    """Parse a binary export one workout at a time, with block offsets.
+
+    Same as 'iter_workout_blocks', but the byte offset at which each
+    block starts is yielded as well, so that blocks can be read again
+    later with 'read_workout_blocks', in any order, without keeping
+    them in memory.
+
+    Args:
+        export: Binary file object with a StrengthLog app exported CSV.
+
+    Yield:
+        The byte offset of each block in the file, and the block.
+
+    Raises:
+        NotAnExportError: If the export has no line dividing the header
+        from the workouts.
+    """
+    lines = _CountingLines(export)
+    yield from _iter_blocks(lines, lambda: lines.position)
+
+
+def read_workout_blocks(
+    export: IO[bytes], offsets: Iterable[int]
+) -> Iterator[WorkoutBlock]:
+    """Read the workout blocks at the given offsets of an export.
+
+    Args:
+        export: Binary file object with a StrengthLog app exported CSV.
+        offsets: Byte offsets from 'index_workout_blocks', in the order
+        the blocks should be read.
+
+    Yield:
+        The block at each offset.
+    """
+    for offset in offsets:
+        export.seek(offset)
+        lines = _CountingLines(export)
+        _, block = next(_iter_blocks(lines, lambda: lines.position, header=False))
+        yield block
+
+
+class _CountingLines:
+    """Decode the lines of a binary file, counting the bytes read."""
+
+    def __init__(self, export: IO[bytes]) -> None:
+        """Start counting from the current position of the file."""
+        self.position = export.tell()
+        self._export = export
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield the decoded lines, counting the bytes of each one."""
+        for line in self._export:
+            self.position += len(line)
+            yield self._decoder.decode(line)
+
+
+def _iter_blocks(
+    lines: Iterable[str], position: Callable[[], int], header: bool = True
+) -> Iterator[tuple[int, WorkoutBlock]]:
+    """Parse workout blocks from the lines of an export.
+
+    Args:
+        lines: Lines of the export.
+        position: Returns the position after the lines read so far.
+        header: Whether the lines start with the header of the export,
+        rather than at a workout block.
+
+    Yield:
+        The position at which each block starts, and the block.
+    """
+    reader = csv.reader(lines)
+
+    if header:
+        dividing_fields = DIVIDING_LINE.split(",")
+        for row in reader:
+            if row == dividing_fields:
+                break
+        else:
+            raise NotAnExportError(
+                "The CSV file does not appear to be a StrengthLog app export file"
+            )
+
+    workout: list[str] | None = None
+    sets: list[list[str]] = []
+    row_start = block_start = position()
+    for row in reader:
+        if not row:
+            if workout is not None:
+                yield block_start, WorkoutBlock(workout, sets)
+            workout = None
+            sets = []
+        elif workout is None:
+            workout = row
+            block_start = row_start
+        else:
+            sets.append(row)
+        row_start = position()
+
+    if workout is not None:
+        yield block_start, WorkoutBlock(workout, sets)
+
 
 def divide_up_csv_lines(data_path: str) -> tuple[str, str]:
     """Extract lines in CSV relevant to either workouts or sets.
@@ -47,17 +210,16 @@ def divide_up_csv_lines(data_path: str) -> tuple[str, str]:
     with open(data_path, "r") as f:
         raw_content = f.read()
 
-    dividing_line = "Name,Date,Body weight,Shape,Sleep,Calories,Stress"
     try:
-        raw_workout_data = raw_content.strip().split(dividing_line)[1]
+        raw_workout_data = raw_content.strip().split(DIVIDING_LINE)[1]
     except IndexError:
-        logger.error("The CSV file does not appear to be a StrengthLog app export file")
-        sys.exit(1)
+        raise NotAnExportError(
+            "The CSV file does not appear to be a StrengthLog app export file"
+        )
 
     raw_workouts = raw_workout_data.split("\n\n")
     if len(raw_workouts) < 1:
-        logger.error("The CSV file does not contain any workouts")
-        sys.exit(1)
+        raise NoWorkoutsError("The CSV file does not contain any workouts")
 
     workouts_lines: list[str] = []
     sets_lines: list[str] = []
@@ -86,33 +248,13 @@ def preprocess_workouts(workouts_csv: str) -> DataFrame:
     Return:
         DataFrame with one set per row, and its associated data.
     """
-    column_names = [
-        "Index",
-        "Name",
-        "Date",
-        "Body weight",
-        "Shape",
-        "Sleep",
-        "Calories",
-        "Stress",
-    ]
-    workouts_s = StringIO(workouts_csv)
-    workouts_df = pd.read_csv(
-        workouts_s,
-        header=None,
-        names=column_names,
-        index_col="Index",
-        dtype={
-            "Name": "string",
-            "Date": "string",
-            "Body weight": "int16",
-            "Shape": "int8",
-            "Sleep": "int8",
-            "Calories": "int8",
-            "Stress": "int8",
-        },
-    )
+    return _build_workouts_df(csv.reader(StringIO(workouts_csv)))
+
 
+def _build_workouts_df(rows: Iterable[list[str]]) -> DataFrame:
+    """Create the workouts DataFrame from index-prefixed rows."""
+    workouts_df = DataFrame(list(rows), columns=WORKOUT_COLUMNS)
+    workouts_df = workouts_df.astype(WORKOUT_DTYPES).set_index("Index")
     workouts_df["Date"] = pd.to_datetime(workouts_df["Date"])
 
     return workouts_df
@@ -132,54 +274,216 @@ def preprocess_sets(sets_csv: str, workouts_df: DataFrame) -> DataFrame:
         DataFrame with one set per row, and its associated data.
         Matching the original CSV file.
     """
-    sets_s = StringIO(sets_csv)
-    reader = csv.reader(sets_s)
-    records: list[dict[str, Any]] = []
-    for row in reader:
-        record: dict[str, Any] = {}
-        record["workout_index"] = row[0]
-        record["Exercise"] = row[1]
-        for i in range(2, len(row), 2):
-            record[row[i]] = row[i + 1]
-        records.append(record)
-
-    sets_df = DataFrame(records)
-
-    # We only deal with sets that have reps
-    sets_df = sets_df[sets_df["reps"].notna()]
-    sets_df = DataFrame(sets_df)  # Help mypy
-
-    sets_df["workout_index"] = pd.to_numeric(sets_df["workout_index"])
-    sets_df["Set"] = pd.to_numeric(sets_df["Set"], downcast="integer")
-
-    sets_df["Exercise"] = sets_df["Exercise"].astype("string")
-    sets_df["Exercise"] = sets_df["Exercise"].map(lambda x: x.replace("Exercise, ", ""))
-
-    if "reps" in sets_df.columns:
-        sets_df["reps"] = pd.to_numeric(sets_df["reps"], downcast="integer")
-
-    if "bodyweight" in sets_df.columns:
-        sets_df["bodyweight"] = pd.to_numeric(sets_df["bodyweight"])
-    if "weight" in sets_df.columns:
-        sets_df["weight"] = pd.to_numeric(sets_df["weight"])
-    if "extraWeight" in sets_df.columns:
-        sets_df["extraWeight"] = pd.to_numeric(sets_df["extraWeight"])
-    if "time" in sets_df.columns:
-        sets_df["time"] = sets_df["time"].astype("string")
-    if "distanceMeter" in sets_df.columns:
-        sets_df["distanceMeter"] = pd.to_numeric(sets_df["distanceMeter"])
-    if "height" in sets_df.columns:
-        sets_df["height"] = pd.to_numeric(sets_df["height"])
-
-    sets_df = sets_df.merge(
-        workouts_df["Date"],
-        left_on="workout_index",
-        right_index=True,
+    return _build_sets_df(csv.reader(StringIO(sets_csv)), workouts_df)
+
+
+def _build_sets_df(rows: Iterable[list[str]], workouts_df: DataFrame) -> DataFrame:
+    """Create the sets DataFrame from index-prefixed set rows."""
+    set_columns = SetColumns()
+    for row in rows:
+        set_columns.append(int(row[0]), row[1:])
+
+    return set_columns.to_dataframe(workouts_df)
+
+
+class SetColumns:
+    """Column-wise accumulator for the set rows of an export.
+
+    Set rows in the export alternate between keys and values after the
+    exercise name. Instead of building one dict per row, the values of
+    each known key are written straight into a typed NumPy array, one
+    array per key, which grow by doubling. Keys that are not known in
+    advance are kept in sparse overflow columns.
+    """
+
+    numeric_keys = (
+        "Set",
+        "reps",
+        "weight",
+        "extraWeight",
+        "bodyweight",
+        "distanceMeter",
+        "height",
     )
+    text_keys = ("time",)
+
+    def __init__(self, capacity: int = 1024) -> None:
+        """Preallocate columns for 'capacity' set rows."""
+        self._size = 0
+        self._capacity = capacity
+        self._workout_index = np.zeros(capacity, dtype=np.int64)
+        self._exercise = np.full(capacity, None, dtype=object)
+        self._numeric = {key: np.full(capacity, np.nan) for key in self.numeric_keys}
+        self._text = {
+            key: np.full(capacity, None, dtype=object) for key in self.text_keys
+        }
+        self._overflow: dict[str, dict[int, str]] = {}
+        # Keys in order of first appearance, which is the column order
+        self._seen_keys: dict[str, None] = {}
+
+    def __len__(self) -> int:
+        """Return the number of set rows appended so far."""
+        return self._size
+
+    def append(self, workout_index: int, row: list[str]) -> None:
+        """Append one set row, starting with the exercise field.
+
+        Args:
+            workout_index: Index of the workout the set belongs to.
+            row: Fields of the set line, exercise name first and then
+            alternating keys and values.
+        """
+        if self._size == self._capacity:
+            self._grow()
+        i = self._size
+        self._workout_index[i] = workout_index
+        self._exercise[i] = row[0]
+
+        seen_keys = self._seen_keys
+        for j in range(1, len(row) - 1, 2):
+            key = row[j]
+            value = row[j + 1]
+            if key not in seen_keys:
+                seen_keys[key] = None
+            if not value:
+                continue
+            numeric_column = self._numeric.get(key)
+            if numeric_column is not None:
+                numeric_column[i] = float(value)
+            elif key in self._text:
+                self._text[key][i] = value
+            else:
+                self._overflow.setdefault(key, {})[i] = value
+
+        self._size += 1
+
+    def _grow(self) -> None:
+        """Double the capacity of all preallocated columns."""
+        extra = self._capacity
+        self._workout_index = np.concatenate(
+            [self._workout_index, np.zeros(extra, dtype=np.int64)]
+        )
+        self._exercise = np.concatenate(
+            [self._exercise, np.full(extra, None, dtype=object)]
+        )
+        for key, column in self._numeric.items():
+            self._numeric[key] = np.concatenate([column, np.full(extra, np.nan)])
+        for key, column in self._text.items():
+            self._text[key] = np.concatenate(
+                [column, np.full(extra, None, dtype=object)]
+            )
+        self._capacity += extra
+
+    def to_dataframe(self, workouts_df: DataFrame, first_row: int = 0) -> DataFrame:
+        """Create the sets DataFrame from the accumulated columns.
+
+        Only sets that have reps are kept. The workout date is looked up
+        by position, since workout indices are a dense range.
+
+        Args:
+            workouts_df: DataFrame with one workout per row.
+            first_row: Index label of the first appended set row.
+
+        Return:
+            DataFrame with one set per row, and its associated data.
+        """
+        size = self._size
+        # We only deal with sets that have reps
+        keep = np.flatnonzero(~np.isnan(self._numeric["reps"][:size]))
+        index = pd.Index(keep + first_row)
+
+        workout_index = self._workout_index[keep]
+        # Factorize the raw names to strip the prefix once per exercise
+        exercise_codes, exercise_names = pd.factorize(self._exercise[keep])
+        columns: dict[str, Any] = {
+            "workout_index": pd.to_numeric(workout_index, downcast="integer"),
+            "Exercise": pd.Categorical.from_codes(
+                exercise_codes,
+                categories=pd.Index(exercise_names).str.removeprefix("Exercise, "),
+            ),
+        }
+        for key in self._seen_keys:
+            if key in self._numeric:
+                values = self._numeric[key][keep]
+                if key in ("Set", "reps"):
+                    columns[key] = pd.to_numeric(values, downcast="integer")
+                else:
+                    columns[key] = _as_integer_if_exact(values)
+            elif key == "time":
+                columns[key] = parse_durations(self._text[key][keep])
+            elif key in self._text:
+                columns[key] = pd.array(self._text[key][keep], dtype="string")
+            else:
+                overflow = np.full(size, np.nan, dtype=object)
+                for i, value in self._overflow[key].items():
+                    overflow[i] = value
+                columns[key] = overflow[keep]
+
+        first_workout = workouts_df.index[0] if len(workouts_df) else 0
+        columns["Date"] = workouts_df["Date"].to_numpy()[workout_index - first_workout]
+
+        return DataFrame(columns, index=index)
+
+
+def _as_integer_if_exact(values: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    """Return values as int64 if all are present and integral."""
+    if len(values) and not np.isnan(values).any() and (values % 1 == 0).all():
+        return values.astype(np.int64)
+    return values
+
+
+def parse_durations(durations: np.ndarray[Any, Any]) -> pd.arrays.IntegerArray:
+    """Convert 'HH:MM:SS' durations to whole seconds.
+
+    Durations in the export are all formatted the same way, so they are
+    converted by viewing their characters as a matrix of digits, with
+    one row per duration. Anything that is not formatted like that is
+    converted the slower way, by splitting it up at the colons.
 
-    return sets_df
+    Args:
+        durations: Array of duration strings, or None where missing.
+
+    Return:
+        Nullable int32 array with the number of seconds.
+    """
+    present = pd.notna(durations)
+    seconds = np.zeros(len(durations), dtype=np.int32)
+
+    text = durations[present].astype("U")
+    if text.dtype.itemsize == 8 * 4:
+        characters = np.frombuffer(text.astype("S8").tobytes(), dtype=np.uint8)
+        digits = characters.reshape(-1, 8).astype(np.int32) - ord("0")
+    else:
+        digits = np.zeros((0, 8), dtype=np.int32)
+
+    is_formatted = (
+        len(digits) == len(text)
+        and (digits[:, [2, 5]] == ord(":") - ord("0")).all()
+        and (digits[:, [0, 1, 3, 4, 6, 7]] >= 0).all()
+        and (digits[:, [0, 1, 3, 4, 6, 7]] <= 9).all()
+    )
+    if is_formatted:
+        seconds[present] = (
+            (digits[:, 0] * 10 + digits[:, 1]) * 3600
+            + (digits[:, 3] * 10 + digits[:, 4]) * 60
+            + digits[:, 6] * 10
+            + digits[:, 7]
+        )
+    else:
+        seconds[present] = [_duration_seconds(duration) for duration in text]
 
+    return pd.arrays.IntegerArray(seconds, ~present)
 
+
+def _duration_seconds(duration: str) -> int:
+    """Convert a duration such as '1:02:03' or '02:03' to seconds."""
+    seconds = 0
+    for part in duration.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+@instrument(rows=lambda frames: len(frames[0]))
 def preprocess_data(data_path: str) -> tuple[DataFrame, DataFrame]:
     """Pre-process StrengthLog data at path.
 
@@ -190,6 +494,10 @@ def preprocess_data(data_path: str) -> tuple[DataFrame, DataFrame]:
     be added to columns. Indices will be added to the workouts, and
     a corresponding 'workout_index' to the sets.
 
+    Workouts are indexed in the order of the file, so index 0 is the
+    newest workout. 'ingest_export' in 'incremental' indexes them the
+    other way around, oldest first.
+
     Param:
         data_path: Path to CSV file exported from the StrengthLog app.
 
@@ -197,16 +505,71 @@ def preprocess_data(data_path: str) -> tuple[DataFrame, DataFrame]:
         Two DataFrames – one with all sets and associated data,
         and one with all workouts and associated data.
     """
-    sets_csv, workouts_csv = divide_up_csv_lines(data_path)
+    with open(data_path, "rb") as f:
+        return preprocess_export(f)
+
+
+def preprocess_export(export: IO[str] | IO[bytes]) -> tuple[DataFrame, DataFrame]:
+    """Pre-process a StrengthLog export read from a file object.
+
+    Same as 'preprocess_data', but the export is read in a single pass
+    from an open file object, such as the stream of an uploaded file,
+    instead of from a path.
+
+    Args:
+        export: Text or binary file object with a StrengthLog export.
+
+    Return:
+        Two DataFrames – one with all sets and associated data,
+        and one with all workouts and associated data.
 
-    workouts_df = preprocess_workouts(workouts_csv)
-    sets_df = preprocess_sets(sets_csv, workouts_df)
+    Raises:
+        NotAnExportError: If the file is not a StrengthLog export.
+        NoWorkoutsError: If the export does not contain any workouts.
+    """
+    sets_df, workouts_df = preprocess_blocks(iter_workout_blocks(export))
+    if workouts_df.empty:
+        raise NoWorkoutsError("The CSV file does not contain any workouts")
 
     return sets_df, workouts_df
 
 
-def separate_sets_by_exercise_type(sets_df: DataFrame) -> dict[ET, DataFrame]:
-    """Divide sets into separate DataFrames based on exercise type.
+@instrument(rows=lambda frames: len(frames[0]))
+def preprocess_blocks(
+    blocks: Iterable[WorkoutBlock],
+    first_workout: int = 0,
+    first_set_row: int = 0,
+) -> tuple[DataFrame, DataFrame]:
+    """Create the sets and workouts DataFrames from workout blocks.
+
+    The offsets make it possible to parse only the tail of an export,
+    with indices continuing where an earlier parse of the head ended.
+
+    Args:
+        blocks: Workout blocks, as yielded by 'iter_workout_blocks'.
+        first_workout: Workout index of the first block.
+        first_set_row: Number of set lines before the first block,
+        used as offset for the index of the sets DataFrame.
+
+    Return:
+        Two DataFrames – one with all sets and associated data,
+        and one with all workouts and associated data.
+    """
+    workout_rows: list[list[str]] = []
+    set_columns = SetColumns()
+    for index, block in enumerate(blocks, start=first_workout):
+        workout_rows.append([str(index), *block.workout])
+        for row in block.sets:
+            set_columns.append(index, row)
+
+    workouts_df = _build_workouts_df(workout_rows)
+    sets_df = set_columns.to_dataframe(workouts_df, first_row=first_set_row)
+
+    return sets_df, workouts_df
+
+
+def classify_exercise_types(sets_df: DataFrame) -> np.ndarray[Any, Any]:
+    """Return the exercise type of every set, as ET values.
 
     There are five exercise types:
 
@@ -219,29 +582,36 @@ def separate_sets_by_exercise_type(sets_df: DataFrame) -> dict[ET, DataFrame]:
     This division is necessary because the way of calculating 'volume'
     is different in each case.
     """
-    sets_dfs: dict[ET, DataFrame] = {}
-
-    has_time = pd.notna(sets_df["time"])
-    has_reps = pd.notna(sets_df["reps"])
-    has_weight = (pd.notna(sets_df["weight"]) & sets_df["weight"] > 0) | (
-        pd.notna(sets_df["extraWeight"]) & sets_df["extraWeight"] > 0
+    has_time = pd.notna(sets_df["time"]).to_numpy()
+    has_reps = pd.notna(sets_df["reps"]).to_numpy()
+    has_weight = (
+        (pd.notna(sets_df["weight"]) & sets_df["weight"] > 0)
+        | (pd.notna(sets_df["extraWeight"]) & sets_df["extraWeight"] > 0)
+    ).to_numpy()
+
+    return np.select(
+        [
+            has_time & ~has_weight & ~has_reps,
+            ~has_time & ~has_weight & has_reps,
+            has_time & has_weight & ~has_reps,
+            ~has_time & has_weight & has_reps,
+        ],
+        [ET.TIME.value, ET.REPS.value, ET.WTIME.value, ET.WREPS.value],
+        default=ET.OTHER.value,
     )
 
-    time_filter = has_time & ~has_weight & ~has_reps
-    reps_filter = ~has_time & ~has_weight & has_reps
-    weight_time_filter = has_time & has_weight & ~has_reps
-    weight_reps_filter = ~has_time & has_weight & has_reps
 
-    sets_dfs[ET.TIME] = DataFrame(sets_df[time_filter])
-    sets_dfs[ET.REPS] = DataFrame(sets_df[reps_filter])
-    sets_dfs[ET.WTIME] = DataFrame(sets_df[weight_time_filter])
-    sets_dfs[ET.WREPS] = DataFrame(sets_df[weight_reps_filter])
+def separate_sets_by_exercise_type(sets_df: DataFrame) -> dict[ET, DataFrame]:
+    """Divide sets into separate DataFrames based on exercise type.
 
-    sets_dfs[ET.OTHER] = DataFrame(
-        sets_df[~(time_filter | reps_filter | weight_time_filter | weight_reps_filter)]
-    )
+    See 'classify_exercise_types' for how the types are determined.
+    """
+    exercise_types = classify_exercise_types(sets_df)
 
-    return sets_dfs
+    return {
+        exercise_type: DataFrame(sets_df[exercise_types == exercise_type.value])
+        for exercise_type in ET
+    }
 
 
 def add_anyweight_column(sets_df: DataFrame) -> None:
@@ -251,6 +621,33 @@ def add_anyweight_column(sets_df: DataFrame) -> None:
     sets_df["anyWeight"] = sets_df["weight"] + sets_df["extraWeight"]
 
 
+def share_exercise_categories(*dfs: DataFrame) -> None:
+    """Give the 'Exercise' columns of DataFrames the same categories.
+
+    Categories of the first DataFrame keep their codes, and exercises
+    only found in later DataFrames are added after them. This keeps one
+    dictionary of exercise names per user when new data is appended.
+
+    Args:
+        dfs: DataFrames with a categorical 'Exercise' column, which is
+        updated in place.
+    """
+    categories = dfs[0]["Exercise"].cat.categories
+    for df in dfs[1:]:
+        new_categories = df["Exercise"].cat.categories.difference(
+            categories, sort=False
+        )
+        categories = categories.append(new_categories)
+    for df in dfs:
+        df["Exercise"] = df["Exercise"].cat.set_categories(categories)
+
+
+def _seconds(sets_df: DataFrame) -> pd.Series:
+    """Return the duration of sets in seconds as floats."""
+    return sets_df["time"].astype("float64")
+
+
+@instrument(rows=lambda exercise_dfs: sum(map(len, exercise_dfs.values())))
 def get_all_exercises_dfs(sets_df: DataFrame) -> dict[ET, DataFrame]:
     """Generate dict of DataFrames in 'exercise' format.
 
@@ -262,44 +659,87 @@ def get_all_exercises_dfs(sets_df: DataFrame) -> dict[ET, DataFrame]:
         - Total number of reps
         - Total volume lifted
 
+    All exercise types are aggregated in one grouping, with the type as
+    the first key. The rows of each type are therefore contiguous in the
+    result, and each type's DataFrame is a slice of it. Within a
+    workout, rows are ordered by exercise name.
+
     Args:
         sets_df: A DataFrame with one workout-exercise-set per row.
 
     Return:
         Dictionary of all the generated workout-exercise DataFrames.
     """
-    # Divide the sets into categories
-    split_sets_dfs = separate_sets_by_exercise_type(sets_df)
-
-    # Fill in reps and anyWeight columns for all sub-DataFrames.
-    split_sets_dfs[ET.OTHER]["anyWeight"] = np.nan
-    split_sets_dfs[ET.OTHER]["volume"] = np.nan
-    split_sets_dfs[ET.TIME]["anyWeight"] = np.nan
-    split_sets_dfs[ET.TIME]["volume"] = split_sets_dfs[ET.TIME]["time"]
-    split_sets_dfs[ET.REPS]["anyWeight"] = np.nan
-    split_sets_dfs[ET.REPS]["volume"] = split_sets_dfs[ET.REPS]["reps"]
-    add_anyweight_column(split_sets_dfs[ET.WREPS])
-    split_sets_dfs[ET.WREPS]["volume"] = (
-        split_sets_dfs[ET.WREPS]["anyWeight"] * split_sets_dfs[ET.WREPS]["reps"]
+    exercise_types = classify_exercise_types(sets_df)
+
+    is_weighted = (exercise_types == ET.WREPS.value) | (
+        exercise_types == ET.WTIME.value
+    )
+    any_weight = np.where(
+        is_weighted,
+        sets_df["weight"].fillna(0).to_numpy() + sets_df["extraWeight"].fillna(0),
+        np.nan,
     )
-    add_anyweight_column(split_sets_dfs[ET.WTIME])
-    split_sets_dfs[ET.WTIME]["volume"] = (
-        split_sets_dfs[ET.WTIME]["anyWeight"] * split_sets_dfs[ET.WTIME]["time"]
+    reps = sets_df["reps"].to_numpy(dtype="float64")
+    seconds = _seconds(sets_df).to_numpy()
+    volume = np.select(
+        [
+            exercise_types == ET.TIME.value,
+            exercise_types == ET.REPS.value,
+            exercise_types == ET.WTIME.value,
+            exercise_types == ET.WREPS.value,
+        ],
+        [seconds, reps, any_weight * seconds, any_weight * reps],
+        default=np.nan,
     )
 
+    values_df = DataFrame(
+        {
+            "Set": sets_df["Set"],
+            "reps": sets_df["reps"],
+            "anyWeight": any_weight,
+            "volume": volume,
+        },
+        index=sets_df.index,
+    )
+    exercise = sets_df["Exercise"]
+    is_categorical = isinstance(exercise.dtype, pd.CategoricalDtype)
+    if is_categorical:
+        # Categories are in the order exercises were first seen, and
+        # grouping sorts by category, so sort them by name for grouping
+        exercise = exercise.cat.reorder_categories(
+            exercise.cat.categories.sort_values()
+        )
+    grouped_exercise_df = values_df.groupby(
+        [
+            pd.Series(exercise_types, index=sets_df.index, name="exercise_type"),
+            sets_df["Date"],
+            sets_df["workout_index"],
+            exercise,
+        ],
+        observed=True,
+    )
+    all_exercises_df = grouped_exercise_df.agg(
+        sets=pd.NamedAgg(column="Set", aggfunc="max"),
+        total_reps=pd.NamedAgg(column="reps", aggfunc="sum"),
+        max_weight=pd.NamedAgg(column="anyWeight", aggfunc="max"),
+        total_volume=pd.NamedAgg(column="volume", aggfunc="sum"),
+    ).reset_index()
+    if is_categorical:
+        all_exercises_df["Exercise"] = all_exercises_df[
+            "Exercise"
+        ].cat.reorder_categories(sets_df["Exercise"].cat.categories)
+
     # Generate the exercise type DataFrames
+    type_values = [exercise_type.value for exercise_type in ET]
+    starts = np.searchsorted(all_exercises_df["exercise_type"], type_values, "left")
+    stops = np.searchsorted(all_exercises_df["exercise_type"], type_values, "right")
     exercise_dfs: dict[ET, DataFrame] = {}
-    for exercise_type, sets_df in split_sets_dfs.items():
-        grouped_exercise_df = sets_df.groupby(
-            ["Date", "workout_index", "Exercise"],
-        )[["Set", "reps", "anyWeight", "volume"]]
-        exercise_df = grouped_exercise_df.agg(
-            sets=pd.NamedAgg(column="Set", aggfunc="max"),
-            total_reps=pd.NamedAgg(column="reps", aggfunc="sum"),
-            max_weight=pd.NamedAgg(column="anyWeight", aggfunc="max"),
-            total_volume=pd.NamedAgg(column="volume", aggfunc="sum"),
-        )
-        exercise_df = exercise_df.reset_index()
+    for exercise_type, start, stop in zip(ET, starts, stops):
+        # Slices are views of the aggregated columns, given an index of
+        # their own without copying them like 'reset_index' would
+        exercise_df = all_exercises_df.iloc[start:stop, 1:]
+        exercise_df.index = pd.RangeIndex(stop - start)
         exercise_dfs[exercise_type] = exercise_df
 
     return exercise_dfs
@@ -0,0 +1,191 @@
+"""Estimated one-rep maxes and running personal records.
+
+The estimated one-rep max (e1RM) of a set is the weight the lifter
+could presumably lift once, given the weight and reps of the set. It
+is computed for every set of the 'ET.WREPS' type, with the weight being
+the sum of 'weight' and 'extraWeight' like for 'max_weight' in the
+exercise DataFrames.
+
+A set is a personal record (PR) if its e1RM is higher than that of
+every earlier set of the same exercise. Running bests are computed with
+a cumulative max per exercise over chronologically sorted sets, so all
+exercises are handled in one grouped pass.
+
+Records can be extended with the sets of newly appended workouts,
+starting from the best e1RM of each exercise so far instead of going
+through the history again.
+"""
+
+import logging
+from enum import Enum, auto
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.instrumentation import instrument
+from strengthstats.analysis.preprocessor import (
+    classify_exercise_types,
+    share_exercise_categories,
+)
+
+logger = logging.getLogger(__name__)
+
+RECORD_SORT_COLUMNS = ["Date", "workout_index", "Set"]
+# Above this many reps the Brzycki formula is undefined
+BRZYCKI_MAX_REPS = 36
+
+
+class Formula(Enum):
+    """Class holding the formulas for estimating one-rep maxes."""
+
+    EPLEY = auto()
+    BRZYCKI = auto()
+
+
+def estimate_one_rep_max(
+    weight: np.ndarray[Any, Any],
+    reps: np.ndarray[Any, Any],
+    formula: Formula = Formula.EPLEY,
+) -> np.ndarray[Any, Any]:
+    """Estimate the one-rep max of sets.
+
+    - Epley: weight * (1 + reps / 30), and weight itself for one rep.
+    - Brzycki: weight * 36 / (37 - reps), undefined (NaN) above 36 reps.
+
+    Args:
+        weight: Weight of each set.
+        reps: Reps of each set.
+        formula: Formula to estimate with.
+
+    Return:
+        The e1RM of each set, NaN for sets without reps or weight.
+    """
+    weight = np.asarray(weight, dtype="float64")
+    reps = np.asarray(reps, dtype="float64")
+    if formula == Formula.EPLEY:
+        return np.where(reps == 1, weight, weight * (1 + reps / 30))
+
+    with np.errstate(divide="ignore"):
+        return np.where(reps <= BRZYCKI_MAX_REPS, weight * 36 / (37 - reps), np.nan)
+
+
+@instrument(rows=len)
+def compute_records(sets_df: DataFrame, formula: Formula = Formula.EPLEY) -> DataFrame:
+    """Compute the e1RM and running best of every weighted set.
+
+    Args:
+        sets_df: A DataFrame with one workout-exercise-set per row.
+        formula: Formula to estimate one-rep maxes with.
+
+    Return:
+        A DataFrame with one row per 'ET.WREPS' set, sorted by date,
+        with the columns Date, workout_index, Exercise, Set, reps,
+        weight, e1rm, best_e1rm (the best e1RM of the exercise up to
+        and including the set) and is_pr.
+    """
+    return _running_records(_set_e1rms(sets_df, formula))
+
+
+def extend_records(
+    records_df: DataFrame, new_sets_df: DataFrame, formula: Formula = Formula.EPLEY
+) -> DataFrame:
+    """Add the records of newly appended sets to earlier records.
+
+    If none of the new sets are dated before the last earlier set, the
+    new sets are compared against the best e1RM of each exercise so far,
+    without going through earlier sets. Otherwise PRs may have changed
+    anywhere, and the running bests are computed again for all sets.
+
+    Args:
+        records_df: Records from 'compute_records' or 'extend_records'.
+        new_sets_df: Sets DataFrame with only the new sets.
+        formula: Formula to estimate one-rep maxes with, which must be
+        the one the earlier records were computed with.
+
+    Return:
+        Records of the earlier and the new sets, like 'compute_records'
+        would give for all of them.
+    """
+    new_records_df = _set_e1rms(new_sets_df, formula)
+    if new_records_df.empty:
+        return records_df
+
+    # Copy the frames, since their categories are changed in place
+    records_df = records_df.copy(deep=False)
+    new_records_df = new_records_df.copy(deep=False)
+    share_exercise_categories(records_df, new_records_df)
+
+    if not records_df.empty and new_records_df["Date"].min() < records_df["Date"].max():
+        logger.info("New sets are older than earlier records, recomputing all")
+        return _running_records(
+            pd.concat([records_df[new_records_df.columns], new_records_df])
+        )
+
+    previous_best = records_df.groupby("Exercise", observed=True)["best_e1rm"].max()
+    return pd.concat(
+        [records_df, _running_records(new_records_df, previous_best)],
+        ignore_index=True,
+    )
+
+
+def personal_records(records_df: DataFrame) -> DataFrame:
+    """Return the sets that set a new PR, in the order they were set."""
+    return records_df[records_df["is_pr"]].reset_index(drop=True)
+
+
+def _set_e1rms(sets_df: DataFrame, formula: Formula) -> DataFrame:
+    """Return the 'ET.WREPS' sets with their e1RM."""
+    wreps_df = sets_df[classify_exercise_types(sets_df) == ET.WREPS.value]
+    weight = wreps_df["weight"].fillna(0) + wreps_df["extraWeight"].fillna(0)
+    return DataFrame(
+        {
+            "Date": wreps_df["Date"],
+            "workout_index": wreps_df["workout_index"],
+            "Exercise": wreps_df["Exercise"],
+            "Set": wreps_df["Set"],
+            "reps": wreps_df["reps"],
+            "weight": weight,
+            "e1rm": estimate_one_rep_max(
+                weight.to_numpy(), wreps_df["reps"].to_numpy(), formula
+            ),
+        }
+    )
+
+
+def _running_records(
+    records_df: DataFrame, previous_best: pd.Series | None = None
+) -> DataFrame:
+    """Sort sets by date and add their running best e1RM and PR flags.
+
+    Args:
+        records_df: Sets with their e1RM.
+        previous_best: Best e1RM of each exercise before these sets.
+    """
+    records_df = records_df.sort_values(RECORD_SORT_COLUMNS, kind="stable")
+    # Sets without an e1RM never count as a record
+    e1rm = records_df["e1rm"].fillna(-np.inf)
+    by_exercise = e1rm.groupby(records_df["Exercise"], observed=True, sort=False)
+    best = by_exercise.cummax().to_numpy()
+    best_before = (
+        by_exercise.shift(fill_value=-np.inf)
+        .groupby(records_df["Exercise"], observed=True, sort=False)
+        .cummax()
+        .to_numpy()
+    )
+
+    if previous_best is not None:
+        prior = (
+            previous_best.reindex(records_df["Exercise"].astype(object))
+            .fillna(-np.inf)
+            .to_numpy()
+        )
+        best = np.maximum(best, prior)
+        best_before = np.maximum(best_before, prior)
+
+    return records_df.assign(
+        best_e1rm=np.where(np.isneginf(best), np.nan, best),
+        is_pr=e1rm.to_numpy() > best_before,
+    ).reset_index(drop=True)
@@ -0,0 +1,174 @@
+"""Weekly and monthly rollups of the exercise DataFrames.
+
+Trends over months or years don't need every workout, so the exercise
+DataFrames from 'get_all_exercises_dfs' are rolled up per exercise type,
+exercise and calendar period, with for every period:
+
+- workouts: Number of workouts the exercise was done in.
+- sets, total_reps and total_volume: Sums over those workouts.
+- max_weight: Heaviest weight of those workouts.
+
+Weeks start on Monday and months on their first day, and every rollup
+row is labeled with the date its period starts on. All exercise types
+are rolled up in one grouping on (exercise type, exercise, period).
+
+When workouts are added, only the periods they fall in need to be
+rolled up again, see 'refresh_rollups'.
+"""
+
+import logging
+from collections.abc import Iterable
+from enum import Enum, auto
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.instrumentation import instrument
+from strengthstats.analysis.preprocessor import share_exercise_categories
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEYS = ["exercise_type", "Exercise", "period_start"]
+# 1970-01-01, day zero of numpy dates, was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+class Period(Enum):
+    """Class holding the calendar periods that are rolled up."""
+
+    WEEK = auto()
+    MONTH = auto()
+
+
+def period_starts(dates: Any, period: Period) -> np.ndarray[Any, Any]:
+    """Return the start date of the period each date falls in.
+
+    Args:
+        dates: Dates, as anything convertible to datetime64.
+        period: Calendar period.
+
+    Return:
+        The period start dates, as datetime64[ns].
+    """
+    days = np.asarray(dates, dtype="datetime64[D]")
+    starts: np.ndarray[Any, Any]
+    if period == Period.WEEK:
+        weekdays = (days.astype("int64") + EPOCH_WEEKDAY) % 7
+        starts = days - weekdays.astype("timedelta64[D]")
+    else:
+        starts = days.astype("datetime64[M]").astype("datetime64[D]")
+
+    return starts.astype("datetime64[ns]")
+
+
+@instrument(rows=len)
+def compute_rollups(exercise_dfs: dict[ET, DataFrame], period: Period) -> DataFrame:
+    """Roll up the exercise DataFrames per calendar period.
+
+    Args:
+        exercise_dfs: Exercise DataFrames per exercise type.
+        period: Calendar period to roll up.
+
+    Return:
+        A DataFrame with the columns exercise_type (as ET values),
+        Exercise, period_start, workouts, sets, total_reps, max_weight
+        and total_volume, sorted on the first three.
+    """
+    exercises_df = pd.concat(
+        [
+            exercise_df.assign(exercise_type=exercise_type.value)
+            for exercise_type, exercise_df in exercise_dfs.items()
+        ],
+        ignore_index=True,
+    )
+
+    return _roll_up(exercises_df, period)
+
+
+def refresh_rollups(
+    rollups_df: DataFrame,
+    exercise_dfs: dict[ET, DataFrame],
+    new_dates: Iterable[Any],
+    period: Period,
+) -> DataFrame:
+    """Update rollups after workouts were added to exercise DataFrames.
+
+    Only the periods that the new workouts fall in are rolled up again,
+    the rollups of all other periods are kept as they were.
+
+    Args:
+        rollups_df: Rollups from before the workouts were added.
+        exercise_dfs: Exercise DataFrames with the workouts added.
+        new_dates: Dates of the added workouts.
+        period: Calendar period of the rollups.
+
+    Return:
+        The same rollups as 'compute_rollups' would give for the
+        updated exercise DataFrames.
+    """
+    affected = np.unique(period_starts(list(new_dates), period))
+    if len(affected) == 0:
+        return rollups_df
+
+    exercises_df = pd.concat(
+        [
+            exercise_df[exercise_df["Date"] >= affected[0]].assign(
+                exercise_type=exercise_type.value
+            )
+            for exercise_type, exercise_df in exercise_dfs.items()
+        ],
+        ignore_index=True,
+    )
+    exercises_df = exercises_df[
+        np.isin(period_starts(exercises_df["Date"], period), affected)
+    ]
+    fresh_df = _roll_up(exercises_df, period)
+    logger.info(f"Rolled up {len(affected)} {period.name.lower()}s again")
+
+    kept_df = rollups_df[~rollups_df["period_start"].isin(affected)].copy(deep=False)
+    share_exercise_categories(kept_df, fresh_df)
+
+    return (
+        pd.concat([kept_df, fresh_df], ignore_index=True)
+        .sort_values(ROLLUP_KEYS, kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def _roll_up(exercises_df: DataFrame, period: Period) -> DataFrame:
+    """Group exercise rows of all types on type, exercise and period."""
+    rollups_df = (
+        exercises_df.groupby(
+            [
+                exercises_df["exercise_type"],
+                exercises_df["Exercise"],
+                pd.Series(
+                    period_starts(exercises_df["Date"], period),
+                    index=exercises_df.index,
+                    name="period_start",
+                ),
+            ],
+            observed=True,
+        )
+        .agg(
+            workouts=pd.NamedAgg(column="workout_index", aggfunc="count"),
+            sets=pd.NamedAgg(column="sets", aggfunc="sum"),
+            total_reps=pd.NamedAgg(column="total_reps", aggfunc="sum"),
+            max_weight=pd.NamedAgg(column="max_weight", aggfunc="max"),
+            total_volume=pd.NamedAgg(column="total_volume", aggfunc="sum"),
+        )
+        .reset_index()
+    )
+
+    return rollups_df.astype(
+        {
+            "workouts": "int64",
+            "sets": "int64",
+            "total_reps": "int64",
+            "max_weight": "float64",
+            "total_volume": "float64",
+        }
+    )
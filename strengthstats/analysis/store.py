@@ -0,0 +1,587 @@
+"""Persistent SQLite store of the training data of every user.
+
+The sets, workouts and exercise DataFrames of the latest export of each
+user are written to one embedded SQLite database, one row per DataFrame
+row, together with the content hash of the export they came from. A
+returning user's report can then be served from indexed reads instead
+of parsing the export again, and the series of a single exercise can be
+queried without loading anything else.
+
+Tables:
+
+- sets: One row per set, indexed on (user, Exercise, Date) and on
+  (user, workout_index).
+- workouts: One row per workout, keyed on (user, workout_index).
+- exercises: The prebuilt per-workout aggregates of every exercise,
+  with the exercise type as a column, indexed on (user, Exercise,
+  Date).
+- rollups: The weekly and monthly rollups of every exercise, indexed
+  on (user, period, Exercise, period_start).
+- records: The e1RM, running best and PR flag of every weighted set,
+  indexed on (user, Exercise, Date).
+- exports: The export hash and the column layout and dtypes of the
+  stored DataFrames, so that they are read back exactly as written.
+
+Every table has a fixed set of columns. Columns of a DataFrame that the
+table doesn't have, like set keys or workout fields that are unknown to
+the parser, are stored together as a JSON object in the 'extra_columns'
+column, so that no export can change the schema shared by all users.
+"""
+
+import itertools
+import json
+import logging
+import os
+import sqlite3
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+
+import pandas as pd
+from pandas import DataFrame
+
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.records import compute_records
+from strengthstats.analysis.rollups import Period, compute_rollups
+
+logger = logging.getLogger(__name__)
+
+# Bump when the schema of the database changes
+STORE_FORMAT_VERSION = 4
+DATE_FORMAT = "%Y-%m-%d"
+# Column holding the values of columns a table doesn't have, as JSON
+EXTRA_COLUMNS = "extra_columns"
+
+SCHEMA = f"""
+PRAGMA user_version = {STORE_FORMAT_VERSION};
+CREATE TABLE IF NOT EXISTS exports (
+    user TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    layout TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sets (
+    user TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    workout_index INTEGER NOT NULL,
+    Exercise TEXT NOT NULL,
+    Date TEXT NOT NULL,
+    "Set" INTEGER,
+    reps INTEGER,
+    weight REAL,
+    extraWeight REAL,
+    bodyweight REAL,
+    distanceMeter REAL,
+    height REAL,
+    time INTEGER,
+    {EXTRA_COLUMNS} TEXT,
+    PRIMARY KEY (user, row_index)
+);
+CREATE INDEX IF NOT EXISTS sets_user_exercise_date
+    ON sets (user, Exercise, Date);
+CREATE INDEX IF NOT EXISTS sets_user_workout
+    ON sets (user, workout_index);
+CREATE TABLE IF NOT EXISTS workouts (
+    user TEXT NOT NULL,
+    workout_index INTEGER NOT NULL,
+    Date TEXT NOT NULL,
+    Name TEXT,
+    {EXTRA_COLUMNS} TEXT,
+    PRIMARY KEY (user, workout_index)
+);
+CREATE TABLE IF NOT EXISTS exercises (
+    user TEXT NOT NULL,
+    exercise_type INTEGER NOT NULL,
+    row_index INTEGER NOT NULL,
+    Date TEXT NOT NULL,
+    workout_index INTEGER NOT NULL,
+    Exercise TEXT NOT NULL,
+    sets INTEGER,
+    total_reps INTEGER,
+    max_weight REAL,
+    total_volume REAL,
+    PRIMARY KEY (user, exercise_type, row_index)
+);
+CREATE INDEX IF NOT EXISTS exercises_user_exercise_date
+    ON exercises (user, Exercise, Date);
+CREATE TABLE IF NOT EXISTS rollups (
+    user TEXT NOT NULL,
+    period TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    exercise_type INTEGER NOT NULL,
+    Exercise TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    workouts INTEGER NOT NULL,
+    sets INTEGER NOT NULL,
+    total_reps INTEGER NOT NULL,
+    max_weight REAL,
+    total_volume REAL,
+    PRIMARY KEY (user, period, row_index)
+);
+CREATE INDEX IF NOT EXISTS rollups_user_period_exercise
+    ON rollups (user, period, Exercise, period_start);
+CREATE TABLE IF NOT EXISTS records (
+    user TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    Date TEXT NOT NULL,
+    workout_index INTEGER NOT NULL,
+    Exercise TEXT NOT NULL,
+    "Set" INTEGER,
+    reps INTEGER,
+    weight REAL,
+    e1rm REAL,
+    best_e1rm REAL,
+    is_pr INTEGER NOT NULL,
+    PRIMARY KEY (user, row_index)
+);
+CREATE INDEX IF NOT EXISTS records_user_exercise_date
+    ON records (user, Exercise, Date);
+"""
+TABLES = ("exports", "sets", "workouts", "exercises", "rollups", "records")
+ROLLUP_COLUMNS = [
+    "exercise_type",
+    "Exercise",
+    "period_start",
+    "workouts",
+    "sets",
+    "total_reps",
+    "max_weight",
+    "total_volume",
+]
+RECORD_COLUMNS = [
+    "Date",
+    "workout_index",
+    "Exercise",
+    '"Set"',
+    "reps",
+    "weight",
+    "e1rm",
+    "best_e1rm",
+    "is_pr",
+]
+
+
+class TrainingStore:
+    """SQLite database with the latest export of every user.
+
+    A new connection is opened for every operation, so a store can be
+    shared between threads.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        """Open the database at db_path, creating it if needed."""
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, STORE_FORMAT_VERSION):
+                logger.info(f"Recreating outdated training store {db_path}")
+                for table in TABLES:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection, committing if no exception is raised."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def digest(self, user: str) -> str | None:
+        """Return the hash of the export stored for a user, if any."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT digest FROM exports WHERE user = ?", (user,)
+            ).fetchone()
+
+        return None if row is None else str(row[0])
+
+    def save(
+        self,
+        user: str,
+        digest: str,
+        sets_df: DataFrame,
+        workouts_df: DataFrame,
+        exercise_dfs: dict[ET, DataFrame],
+        rollups: dict[Period, DataFrame] | None = None,
+        records_df: DataFrame | None = None,
+    ) -> None:
+        """Replace the stored export of a user.
+
+        Args:
+            user: Identifies the user, e.g. the session ID.
+            digest: Content hash of the export the DataFrames are from.
+            sets_df: Sets DataFrame of the export.
+            workouts_df: Workouts DataFrame of the export.
+            exercise_dfs: Exercise DataFrames of the export.
+            rollups: Rollups of the exercise DataFrames per period,
+            computed from them if not given.
+            records_df: Records of the sets, from 'compute_records' or
+            'extend_records', computed from sets_df if not given.
+        """
+        if rollups is None:
+            rollups = {
+                period: compute_rollups(exercise_dfs, period) for period in Period
+            }
+        if records_df is None:
+            records_df = compute_records(sets_df)
+        layout = {
+            "sets": _layout(sets_df),
+            "workouts": _layout(workouts_df),
+            "exercises": _layout(next(iter(exercise_dfs.values()))),
+        }
+        exercises_df = pd.concat(
+            [
+                exercise_df.assign(exercise_type=exercise_type.value)
+                for exercise_type, exercise_df in exercise_dfs.items()
+            ]
+        )
+        with self._connect() as conn:
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE user = ?", (user,))
+            conn.execute(
+                "INSERT INTO exports VALUES (?, ?, ?)",
+                (user, digest, json.dumps(layout)),
+            )
+            _insert(conn, "sets", user, sets_df.rename_axis("row_index"))
+            _insert(conn, "workouts", user, workouts_df.rename_axis("workout_index"))
+            _insert(conn, "exercises", user, exercises_df.rename_axis("row_index"))
+            for period, rollups_df in rollups.items():
+                _insert(
+                    conn,
+                    "rollups",
+                    user,
+                    rollups_df.assign(period=period.name).rename_axis("row_index"),
+                )
+            _insert(conn, "records", user, records_df.rename_axis("row_index"))
+
+        logger.info(f"Stored export {digest} of user {user}")
+
+    def delete(self, user: str) -> None:
+        """Remove the stored export of a user, if there is one."""
+        with self._connect() as conn:
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE user = ?", (user,))
+
+        logger.info(f"Deleted the stored export of user {user}")
+
+    def load(
+        self, user: str, digest: str | None = None
+    ) -> tuple[DataFrame, DataFrame, dict[ET, DataFrame]] | None:
+        """Read back the DataFrames stored for a user.
+
+        Args:
+            user: Identifies the user, e.g. the session ID.
+            digest: If given, only return the DataFrames if they are
+            from the export with this content hash.
+
+        Return:
+            The sets, workouts and exercise DataFrames, as they were
+            saved, or None if nothing (matching) is stored.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT digest, layout FROM exports WHERE user = ?", (user,)
+            ).fetchone()
+            if row is None or (digest is not None and row[0] != digest):
+                return None
+            layout = json.loads(row[1])
+
+            sets_df = _select(
+                conn, "sets", user, "row_index", layout["sets"], index="row_index"
+            )
+            workouts_df = _select(
+                conn,
+                "workouts",
+                user,
+                "workout_index",
+                layout["workouts"],
+                index="workout_index",
+            ).rename_axis(layout["workouts"]["index_name"])
+            exercises_df = _select(
+                conn,
+                "exercises",
+                user,
+                "exercise_type, row_index",
+                {
+                    **layout["exercises"],
+                    "columns": ["exercise_type", *layout["exercises"]["columns"]],
+                },
+            )
+
+        exercise_dfs = {
+            exercise_type: exercises_df[
+                exercises_df["exercise_type"] == exercise_type.value
+            ]
+            .drop(columns="exercise_type")
+            .reset_index(drop=True)
+            for exercise_type in ET
+        }
+
+        return sets_df, workouts_df, exercise_dfs
+
+    def exercise_series(
+        self,
+        user: str,
+        exercise_name: str,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[ET, DataFrame] | None:
+        """Query the per-workout aggregates of one exercise.
+
+        Only the rows of that exercise are read, using the index on
+        (user, Exercise, Date). If an exercise was logged as more than
+        one exercise type, the first type in 'ET' is used.
+
+        Args:
+            user: Identifies the user, e.g. the session ID.
+            exercise_name: Name of the exercise.
+            start: If given, leave out workouts before this date.
+            end: If given, leave out workouts after this date.
+
+        Return:
+            The exercise type and a DataFrame with Date, sets,
+            total_reps, max_weight and total_volume ordered by date, or
+            None if the user never did the exercise.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(exercise_type) FROM exercises"
+                " WHERE user = ? AND Exercise = ?",
+                (user, exercise_name),
+            ).fetchone()
+            if row[0] is None:
+                return None
+            exercise_type = ET(row[0])
+
+            query = (
+                "SELECT Date, sets, total_reps, max_weight, total_volume"
+                " FROM exercises WHERE user = ? AND Exercise = ?"
+                " AND exercise_type = ?"
+            )
+            params: list[Any] = [user, exercise_name, exercise_type.value]
+            if start is not None:
+                query += " AND Date >= ?"
+                params.append(start.strftime(DATE_FORMAT))
+            if end is not None:
+                query += " AND Date <= ?"
+                params.append(end.strftime(DATE_FORMAT))
+            series_df = pd.read_sql_query(
+                query + " ORDER BY Date, row_index", conn, params=params
+            )
+
+        series_df["Date"] = pd.to_datetime(series_df["Date"], format=DATE_FORMAT)
+        for column in ("max_weight", "total_volume"):
+            series_df[column] = series_df[column].astype("float64")
+
+        return exercise_type, series_df
+
+    def rollups(
+        self,
+        user: str,
+        period: Period,
+        exercise_name: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> DataFrame:
+        """Query the stored rollups of a user for one period.
+
+        Args:
+            user: Identifies the user, e.g. the session ID.
+            period: Calendar period of the rollups.
+            exercise_name: If given, only return rollups of this
+            exercise, using the index on (user, period, Exercise).
+            start: If given, leave out periods starting before it.
+            end: If given, leave out periods starting after it.
+
+        Return:
+            A DataFrame like from 'compute_rollups', with the exercise
+            names as strings, which is empty if nothing matches.
+        """
+        query = (
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM rollups"
+            " WHERE user = ? AND period = ?"
+        )
+        params: list[Any] = [user, period.name]
+        if exercise_name is not None:
+            query += " AND Exercise = ?"
+            params.append(exercise_name)
+        if start is not None:
+            query += " AND period_start >= ?"
+            params.append(start.strftime(DATE_FORMAT))
+        if end is not None:
+            query += " AND period_start <= ?"
+            params.append(end.strftime(DATE_FORMAT))
+        with self._connect() as conn:
+            rollups_df = pd.read_sql_query(
+                query + " ORDER BY row_index", conn, params=params
+            )
+
+        rollups_df["period_start"] = pd.to_datetime(
+            rollups_df["period_start"], format=DATE_FORMAT
+        )
+        return rollups_df.astype(
+            {
+                "exercise_type": "int64",
+                "workouts": "int64",
+                "sets": "int64",
+                "total_reps": "int64",
+                "max_weight": "float64",
+                "total_volume": "float64",
+            }
+        )
+
+    def records(
+        self,
+        user: str,
+        exercise_name: str | None = None,
+        prs_only: bool = False,
+    ) -> DataFrame:
+        """Query the stored records of a user.
+
+        Args:
+            user: Identifies the user, e.g. the session ID.
+            exercise_name: If given, only return records of this
+            exercise, using the index on (user, Exercise, Date).
+            prs_only: Only return the sets that set a new PR, like
+            'personal_records'.
+
+        Return:
+            A DataFrame like from 'compute_records', with the exercise
+            names as strings, which is empty if nothing matches.
+        """
+        query = f"SELECT {', '.join(RECORD_COLUMNS)} FROM records WHERE user = ?"
+        params: list[Any] = [user]
+        if exercise_name is not None:
+            query += " AND Exercise = ?"
+            params.append(exercise_name)
+        if prs_only:
+            query += " AND is_pr"
+        with self._connect() as conn:
+            records_df = pd.read_sql_query(
+                query + " ORDER BY row_index", conn, params=params
+            )
+
+        records_df["Date"] = pd.to_datetime(records_df["Date"], format=DATE_FORMAT)
+        return records_df.astype(
+            {
+                "workout_index": "int64",
+                "Set": "int64",
+                "reps": "int64",
+                "weight": "float64",
+                "e1rm": "float64",
+                "best_e1rm": "float64",
+                "is_pr": "bool",
+            }
+        )
+
+
+def _layout(df: DataFrame) -> dict[str, Any]:
+    """Describe the columns and dtypes of a DataFrame."""
+    return {
+        "index_name": df.index.name,
+        "columns": [str(column) for column in df.columns],
+        "dtypes": {str(column): str(dtype) for column, dtype in df.dtypes.items()},
+        "categories": {
+            str(column): df[column].cat.categories.tolist()
+            for column, dtype in df.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        },
+    }
+
+
+def _quote(name: str) -> str:
+    """Quote a column name for use in SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    """Return the names of the columns a table was created with."""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _insert(conn: sqlite3.Connection, table: str, user: str, df: DataFrame) -> None:
+    """Insert the rows of a DataFrame.
+
+    Columns the table doesn't have, compared case-sensitively like the
+    DataFrame columns, are stored in the JSON 'extra_columns' column.
+    """
+    df = df.reset_index()
+    table_columns = _table_columns(conn, table) - {"user", EXTRA_COLUMNS}
+
+    columns: dict[str, list[Any]] = {}
+    extra: dict[str, list[Any]] = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime(DATE_FORMAT)
+        # SQLite needs None rather than NaN or NA for missing values
+        values_list = values.astype(object).where(values.notna(), None).tolist()
+        if str(column) in table_columns:
+            columns[str(column)] = values_list
+        else:
+            extra[str(column)] = values_list
+    if extra:
+        columns[EXTRA_COLUMNS] = [
+            json.dumps(
+                {
+                    column: value
+                    for column, value in zip(extra, row)
+                    if value is not None
+                }
+            )
+            for row in zip(*extra.values())
+        ]
+
+    names = ", ".join(_quote(name) for name in ["user", *columns])
+    placeholders = ", ".join("?" * (len(columns) + 1))
+    conn.executemany(
+        f"INSERT INTO {table} ({names}) VALUES ({placeholders})",
+        zip(itertools.repeat(user), *columns.values()),
+    )
+
+
+def _select(
+    conn: sqlite3.Connection,
+    table: str,
+    user: str,
+    order_by: str,
+    layout: dict[str, Any],
+    index: str | None = None,
+) -> DataFrame:
+    """Read the rows of a user back into a DataFrame with its dtypes."""
+    columns = layout["columns"] if index is None else [index, *layout["columns"]]
+    table_columns = _table_columns(conn, table) - {"user", EXTRA_COLUMNS}
+    selected = [column for column in columns if column in table_columns]
+    extra = [column for column in columns if column not in table_columns]
+    if extra:
+        selected.append(EXTRA_COLUMNS)
+    df = pd.read_sql_query(
+        f"SELECT {', '.join(_quote(c) for c in selected)} FROM {table}"
+        f" WHERE user = ? ORDER BY {order_by}",
+        conn,
+        params=(user,),
+    )
+    if extra:
+        rows = [json.loads(value or "{}") for value in df.pop(EXTRA_COLUMNS)]
+        for column in extra:
+            df[column] = [row.get(column) for row in rows]
+        df = df[columns]
+    if index is not None:
+        df = df.set_index(index).rename_axis(None)
+
+    for column, dtype in layout["dtypes"].items():
+        if column in layout["categories"]:
+            df[column] = pd.Categorical(
+                df[column], categories=layout["categories"][column]
+            )
+        elif dtype.startswith("datetime64"):
+            df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+        else:
+            df[column] = df[column].astype(dtype)
+
+    return df
@@ -0,0 +1,255 @@
+"""Generator of synthetic StrengthLog exports.
+
+The generated exports have the same layout as real ones, with a header
+about the user followed by one block per workout, newest first. They
+contain every kind of set found in real exports, so that all exercise
+types are represented:
+
+- Weighted sets with reps, e.g. barbell lifts.
+- Bodyweight sets with reps, with or without extra weight.
+- Timed bodyweight sets, with or without extra weight.
+- Sets with the optional 'distanceMeter' and 'height' keys.
+
+Exports are written one line at a time, so sizes up to millions of sets
+don't need to fit in memory. The same seed always gives the same
+export.
+"""
+
+import csv
+import random
+from collections.abc import Iterator
+from datetime import date, timedelta
+from typing import IO, NamedTuple
+
+from strengthstats.analysis.constants import DIVIDING_LINE
+
+LAST_WORKOUT_DATE = date(2024, 6, 30)
+# Workouts are spread over at most this many days, which keeps the dates
+# of even the largest exports within the range of pandas timestamps.
+MAX_HISTORY_DAYS = 40 * 365
+
+MOVEMENTS = [
+    "Squat",
+    "Deadlift",
+    "Bench Press",
+    "Overhead Press",
+    "Barbell Row",
+    "Lunge",
+    "Leg Press",
+    "Leg Curl",
+    "Leg Extension",
+    "Calf Raise",
+    "Hip Thrust",
+    "Lat Pulldown",
+    "Biceps Curl",
+    "Triceps Extension",
+    "Lateral Raise",
+    "Chest Fly",
+]
+BODYWEIGHT_MOVEMENTS = [
+    "Push-Up",
+    "Chin-Ups",
+    "Pull-Ups",
+    "Bar Dip",
+    "Sit-Up",
+    "Back Extension",
+    "Hanging Leg Raise",
+    "Pistol Squat",
+]
+TIMED_MOVEMENTS = ["Plank", "Side Plank", "Wall Sit", "Dead Hang", "Hollow Hold"]
+VARIATIONS = [
+    "",
+    "Dumbbell ",
+    "Incline ",
+    "Paused ",
+    "Single-arm ",
+    "Cable ",
+    "Machine ",
+    "Banded ",
+]
+
+
+class SetKind(NamedTuple):
+    """How the sets of an exercise are logged."""
+
+    reps: bool
+    weight: bool
+    bodyweight: bool
+    time: bool
+    optional_key: str | None
+
+
+WEIGHTED = SetKind(
+    reps=True, weight=True, bodyweight=False, time=False, optional_key=None
+)
+BODYWEIGHT = SetKind(
+    reps=True, weight=False, bodyweight=True, time=False, optional_key=None
+)
+TIMED = SetKind(reps=False, weight=False, bodyweight=True, time=True, optional_key=None)
+REPS_AND_TIME = SetKind(
+    reps=True, weight=False, bodyweight=True, time=True, optional_key="distanceMeter"
+)
+REPS_AND_HEIGHT = SetKind(
+    reps=True, weight=False, bodyweight=True, time=False, optional_key="height"
+)
+
+
+class Exercise(NamedTuple):
+    """An exercise of the synthetic user and how it progresses."""
+
+    name: str
+    kind: SetKind
+    start_load: int
+    progression: float
+
+
+def make_exercises(count: int, rng: random.Random) -> list[Exercise]:
+    """Create count distinct exercises with a mix of set kinds.
+
+    Args:
+        count: Number of exercises, at most a few hundred are possible.
+        rng: Random number generator to draw the exercises with.
+
+    Return:
+        The exercises, with names unique within the export.
+    """
+    candidates = [
+        (f"{variation}{movement}", kind)
+        for variation in VARIATIONS
+        for movements, kind in [
+            (MOVEMENTS, WEIGHTED),
+            (BODYWEIGHT_MOVEMENTS, BODYWEIGHT),
+            (TIMED_MOVEMENTS, TIMED),
+        ]
+        for movement in movements
+    ]
+    rng.shuffle(candidates)
+    # One exercise of every kind goes first, so that even exports with
+    # few exercises have all kinds of sets
+    firsts = [
+        next(candidate for candidate in candidates if candidate[1] == kind)
+        for kind in (WEIGHTED, BODYWEIGHT, TIMED)
+    ]
+    chosen = [
+        ("Leaning Plank", REPS_AND_TIME),
+        ("Box Jump", REPS_AND_HEIGHT),
+        *firsts,
+        *(candidate for candidate in candidates if candidate not in firsts),
+    ]
+    if count > len(chosen):
+        raise ValueError(f"At most {len(chosen)} exercises can be generated")
+    return [
+        Exercise(
+            name=name,
+            kind=kind,
+            start_load=rng.randint(5, 60) if kind.weight else rng.randint(0, 10),
+            progression=rng.uniform(0.0, 1.0),
+        )
+        for name, kind in chosen[:count]
+    ]
+
+
+def iter_export_rows(
+    n_sets: int, seed: int = 0, n_exercises: int = 40
+) -> Iterator[list[str]]:
+    """Yield the CSV rows of a synthetic export, blank rows included.
+
+    Args:
+        n_sets: Total number of set lines in the export.
+        seed: Seed of the random number generator.
+        n_exercises: Number of distinct exercises to draw from.
+
+    Yield:
+        The fields of every line of the export.
+    """
+    rng = random.Random(seed)
+    exercises = make_exercises(n_exercises, rng)
+    body_weight = rng.randint(55, 100)
+
+    yield ["Name", "Language", "Sex", "Age", "Email"]
+    yield ["Synthetic User", "en", "Female", "-- --", "synthetic@example.com"]
+    yield []
+    yield ["Workouts"]
+    yield DIVIDING_LINE.split(",")
+
+    # Workouts are listed newest first, like in real exports
+    n_workouts = max(1, n_sets // 20)
+    history_days = min(MAX_HISTORY_DAYS, 2 * n_workouts)
+    sets_left = n_sets
+    for workout in range(n_workouts):
+        if workout > 0:
+            yield []
+        age = workout / n_workouts
+        workout_date = LAST_WORKOUT_DATE - timedelta(days=int(age * history_days))
+        yield [
+            f"Program {rng.randint(1, 3)}: Workout {rng.randint(1, 4)}",
+            workout_date.isoformat(),
+            str(body_weight),
+            *(str(rng.randint(-1, 3)) for _ in range(4)),
+        ]
+
+        # The last workout takes the remaining sets
+        workout_sets = sets_left if workout == n_workouts - 1 else min(sets_left, 20)
+        sets_left -= workout_sets
+        while workout_sets > 0:
+            exercise = rng.choice(exercises)
+            n_exercise_sets = min(workout_sets, rng.randint(1, 5))
+            workout_sets -= n_exercise_sets
+            # Loads go up over time, with the oldest workouts at age 1
+            load = exercise.start_load * (1 + exercise.progression * (1 - age))
+            for set_number in range(1, n_exercise_sets + 1):
+                yield _set_row(exercise, set_number, load, body_weight, rng)
+
+
+def _set_row(
+    exercise: Exercise,
+    set_number: int,
+    load: float,
+    body_weight: int,
+    rng: random.Random,
+) -> list[str]:
+    """Return the fields of one set of an exercise."""
+    kind = exercise.kind
+    row = [f"Exercise, {exercise.name}", "Set", str(set_number)]
+    if kind.reps:
+        row += ["reps", str(rng.randint(3, 15))]
+    if kind.weight:
+        row += ["weight", str(round(load / 2.5) * 2.5).removesuffix(".0")]
+    if kind.bodyweight:
+        row += ["bodyweight", str(body_weight)]
+        if kind.optional_key is None:
+            row += ["extraWeight", str(round(load * rng.choice([0, 0, 1])))]
+    if kind.optional_key is not None:
+        row += [kind.optional_key, str(rng.randint(0, 100))]
+    if kind.time:
+        seconds = rng.randint(5, 180)
+        row += ["time", f"00:{seconds // 60:02d}:{seconds % 60:02d}"]
+
+    return row
+
+
+def write_export(
+    export: IO[str], n_sets: int, seed: int = 0, n_exercises: int = 40
+) -> None:
+    """Write a synthetic export to a text file object.
+
+    Args:
+        export: File object opened for writing with newline="".
+        n_sets: Total number of set lines in the export.
+        seed: Seed of the random number generator.
+        n_exercises: Number of distinct exercises to draw from.
+    """
+    writer = csv.writer(export, lineterminator="\n")
+    writer.writerows(iter_export_rows(n_sets, seed, n_exercises))
+    export.write("\n")
+
+
+def generate_export(
+    path: str, n_sets: int, seed: int = 0, n_exercises: int = 40
+) -> None:
+    """Write a synthetic export with n_sets sets to path.
+
+    See 'write_export' for the arguments.
+    """
+    with open(path, "w", newline="") as f:
+        write_export(f, n_sets, seed, n_exercises)
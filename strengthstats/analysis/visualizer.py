@@ -1,19 +1,136 @@
-"""Functions for generating plots."""
+"""Functions for generating plots.
 
+Plots are drawn with matplotlib's object-oriented API on the Agg
+canvas, without pyplot and its global state. Each thread keeps one
+figure that is reused for every plot it renders, only updating the
+plotted data and the labels, so rendering in several threads at once
+is safe and no figure is created per plot.
+
+Series longer than the point budget of a plot are downsampled before
+they are drawn, see 'downsample'.
+"""
+
+import hashlib
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, NamedTuple
 
 import matplotlib
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from strengthstats.analysis.atomic import replacing_file
+from strengthstats.analysis.downsample import downsample_indices
+from strengthstats.analysis.instrumentation import instrument
+from strengthstats.analysis.plotfiles import (
+    fingerprint_path,
+    plot_path,
+    read_fingerprint,
+)
 
 matplotlib.use("Agg")
 
+FIGURE_SIZE = (8, 6)
+# Bump when plots would look different for the same data
+RENDER_VERSION = 1
+
+
+class PlotJob(NamedTuple):
+    """Everything needed to render the plot of one exercise."""
+
+    dates: np.ndarray[Any, Any]
+    volumes: np.ndarray[Any, Any]
+    exercise_name: str
+    unit: str
+    dst_dir: str
+    max_points: int | None = None
+
+
+class ExerciseRenderer:
+    """Renders exercise progress plots, reusing one figure.
+
+    A renderer is not thread-safe on its own, use 'get_renderer' to get
+    the renderer of the current thread.
+    """
+
+    def __init__(self) -> None:
+        """Create the figure, axes and line that plots are drawn on."""
+        self.figure = Figure(figsize=FIGURE_SIZE)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.xaxis_date()
+        self.axes.set_xlabel("Date")
+        (self.line,) = self.axes.plot([], [])
+
+    def render(
+        self,
+        dates: np.ndarray[Any, Any],
+        volumes: np.ndarray[Any, Any],
+        exercise_name: str,
+        unit: str,
+        dst_path: str,
+    ) -> None:
+        """Plot volume over time for an exercise and save it as PNG.
+
+        Args:
+            dates: Dates of the workouts with the exercise.
+            volumes: Total volume of the exercise in each workout.
+            exercise_name: Name of the exercise to plot.
+            unit: Unit to display for the volume (e.g. 'tons').
+            dst_path: Path to save the plot to.
+        """
+        # Matplotlib represents dates as days since the Unix epoch
+        days = (dates - np.datetime64("1970-01-01")) / np.timedelta64(1, "D")
+        self.line.set_data(days, volumes)
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.axes.set_title(f"{exercise_name} progress")
+        self.axes.set_ylabel(f"Volume ({unit})")
+        self.figure.savefig(dst_path)
+
+
+_renderers = threading.local()
+
+_executor: ProcessPoolExecutor | None = None
+_executor_key: tuple[int, int] | None = None
+_executor_lock = threading.Lock()
 
+
+def get_renderer() -> ExerciseRenderer:
+    """Return the renderer of the current thread."""
+    renderer: ExerciseRenderer | None = getattr(_renderers, "renderer", None)
+    if renderer is None:
+        renderer = ExerciseRenderer()
+        _renderers.renderer = renderer
+
+    return renderer
+
+
+def partition_exercises(exercise_df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Split an exercise DataFrame into one DataFrame per exercise.
+
+    This is done with a single grouping, so that plotting an exercise
+    afterwards doesn't need to filter the whole DataFrame again.
+    """
+    return {
+        str(exercise_name): exercise_rows
+        for exercise_name, exercise_rows in exercise_df.groupby(
+            "Exercise", observed=True, sort=False
+        )
+    }
+
+
+@instrument()
 def generate_exercise_plots(
     exercise_df: pd.DataFrame,
     exercise_name: str,
     unit: str,
     dst_dir: str,
+    max_points: int | None = None,
 ) -> None:
     """Write plot of exercise maxes to dst_dir.
 
@@ -25,12 +142,142 @@ def generate_exercise_plots(
         exercise_name: Name of the exerices to plot.
         unit: Unit to display for the volume (e.g. 'tons').
         dst_dir: Directory where to save the plot.
+        max_points: Point budget, see 'plot_exercise_series'.
     """
-    plt.figure(figsize=(8, 6))
     this_exc = exercise_df["Exercise"] == exercise_name
-    plt.plot(exercise_df[this_exc]["Date"], exercise_df[this_exc]["total_volume"])
-    plt.title(f"{exercise_name} progress")
-    plt.xlabel("Date")
-    plt.ylabel(f"Volume ({unit})")
-    plt.savefig(os.path.join(dst_dir, f"{exercise_name}.png"))
-    plt.close()
+    plot_exercise_series(
+        exercise_df.loc[this_exc, "Date"].to_numpy(),
+        exercise_df.loc[this_exc, "total_volume"].to_numpy(),
+        exercise_name,
+        unit,
+        dst_dir,
+        max_points,
+    )
+
+
+def plot_exercise_series(
+    dates: np.ndarray[Any, Any],
+    volumes: np.ndarray[Any, Any],
+    exercise_name: str,
+    unit: str,
+    dst_dir: str,
+    max_points: int | None = None,
+) -> None:
+    """Write plot of the volume series of one exercise to dst_dir.
+
+    Args:
+        dates: Dates of the workouts with the exercise.
+        volumes: Total volume of the exercise in each workout.
+        exercise_name: Name of the exercise to plot.
+        unit: Unit to display for the volume (e.g. 'tons').
+        dst_dir: Directory where to save the plot.
+        max_points: If given, series with more points are downsampled
+        to this many points.
+    """
+    if max_points is not None:
+        kept = downsample_indices(dates, volumes, max_points)
+        dates, volumes = dates[kept], volumes[kept]
+    with replacing_file(plot_path(dst_dir, exercise_name)) as tmp_path:
+        get_renderer().render(dates, volumes, exercise_name, unit, tmp_path)
+
+
+def plot_fingerprint(job: PlotJob) -> str:
+    """Return a fingerprint of everything that determines a plot.
+
+    The fingerprint covers the plotted series, the exercise name, the
+    unit, the point budget, and the render parameters.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(job.dates, dtype="datetime64[ns]").tobytes())
+    digest.update(np.ascontiguousarray(job.volumes, dtype="float64").tobytes())
+    digest.update(
+        repr(
+            (job.exercise_name, job.unit, job.max_points, FIGURE_SIZE, RENDER_VERSION)
+        ).encode()
+    )
+
+    return digest.hexdigest()
+
+
+def is_plot_current(job: PlotJob) -> bool:
+    """Check if the plot of a job was rendered from the same data."""
+    if not os.path.exists(plot_path(job.dst_dir, job.exercise_name)):
+        return False
+
+    return read_fingerprint(job.dst_dir, job.exercise_name) == plot_fingerprint(job)
+
+
+def render_plot_job(job: PlotJob) -> None:
+    """Render the plot of a job and store its fingerprint next to it.
+
+    Both files are replaced atomically, the fingerprint last, so that a
+    fingerprint never describes a PNG that isn't fully written.
+    """
+    plot_exercise_series(
+        job.dates,
+        job.volumes,
+        job.exercise_name,
+        job.unit,
+        job.dst_dir,
+        job.max_points,
+    )
+    with replacing_file(fingerprint_path(job.dst_dir, job.exercise_name)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            f.write(plot_fingerprint(job))
+
+
+@instrument(rows=lambda rendered: rendered)
+def render_plot_jobs(jobs: list[PlotJob], workers: int) -> int:
+    """Render the plots of several exercises, in parallel if possible.
+
+    Plots whose fingerprint matches the one stored next to the existing
+    PNG are skipped, since rendering them again gives the same result.
+
+    With more than one worker, the jobs are spread over a pool of
+    worker processes, each rendering plots on its own. The pool is
+    started with 'spawn', which is safe both in threaded servers and in
+    servers that fork worker processes.
+
+    Args:
+        jobs: One job per exercise, with data for that exercise only.
+        workers: Number of worker processes. With one worker the plots
+        are rendered one after another in the current process.
+
+    Return:
+        The number of plots that were rendered.
+    """
+    jobs = [job for job in jobs if not is_plot_current(job)]
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            render_plot_job(job)
+        return len(jobs)
+
+    # Consume the results so that errors in workers are raised here
+    for _ in _get_executor(workers).map(render_plot_job, jobs):
+        pass
+
+    return len(jobs)
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Return the process pool for this process, creating it if needed.
+
+    A pool inherited from a parent process can't be used after a fork,
+    so a new one is created when the process ID changes.
+    """
+    global _executor, _executor_key
+
+    key = (os.getpid(), workers)
+    with _executor_lock:
+        if _executor is None or _executor_key != key:
+            # Only shut down a pool of this process, whose size changed
+            if _executor is not None and _executor_key is not None:
+                if _executor_key[0] == os.getpid():
+                    _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _executor_key = key
+
+        return _executor
@@ -0,0 +1,414 @@
+"""Command line interface for analyzing many exports in one batch.
+
+Every export is parsed and aggregated in a pool of worker processes,
+and written to its own directory in the output directory:
+
+- exercises.csv: The per-workout aggregates of every exercise, with the
+  exercise type as the first column.
+- workouts.csv: One row per workout, indexed in the order of the
+  export, newest first, unlike the oldest first indices of the web app.
+
+A summary.csv with one row per export, including the error of every
+export that failed, is written next to them. Failures of single exports
+don't stop the batch, but make the command exit with status 1.
+
+Run for example:
+
+    strengthstats exports/ --output analyzed/ --workers 8
+"""
+
+import argparse
+import csv
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.queues import SimpleQueue
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PATTERN = "*.csv"
+SUMMARY_FILE = "summary.csv"
+SUMMARY_COLUMNS = [
+    "export",
+    "status",
+    "workouts",
+    "sets",
+    "exercises",
+    "first_workout",
+    "last_workout",
+    "seconds",
+    "error",
+]
+
+
+class ExportResult(NamedTuple):
+    """Outcome of analyzing one export."""
+
+    export: str
+    workouts: int
+    sets: int
+    exercises: int
+    first_workout: str
+    last_workout: str
+    seconds: float
+    error: str | None = None
+
+
+def find_exports(paths: Sequence[str]) -> list[str]:
+    """Expand directories and glob patterns to a list of export paths.
+
+    Args:
+        paths: Export files, directories with exports, or glob patterns.
+
+    Return:
+        The sorted paths of the exports, without duplicates.
+    """
+    exports = set()
+    for path in paths:
+        if os.path.isdir(path):
+            exports.update(glob.glob(os.path.join(path, EXPORT_PATTERN)))
+        elif glob.has_magic(path):
+            exports.update(glob.glob(path, recursive=True))
+        else:
+            exports.add(path)
+
+    return sorted(exports)
+
+
+def output_dir_names(exports: Sequence[str]) -> list[str]:
+    """Return unique names of the output directories of exports.
+
+    Outputs are named after the export files, with a number appended
+    to the names of files with the same name in different directories.
+    """
+    names = []
+    seen: dict[str, int] = {}
+    for export_path in exports:
+        name = os.path.splitext(os.path.basename(export_path))[0]
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}-{seen[name]}")
+
+    return names
+
+
+def analyze_export(export_path: str, output_dir: str) -> ExportResult:
+    """Parse and aggregate one export and write its outputs.
+
+    This runs in a worker process. Errors are returned in the result
+    instead of raised, so that one bad export doesn't stop the batch.
+
+    Args:
+        export_path: Path to a StrengthLog app exported CSV.
+        output_dir: Directory to write the outputs of the export to.
+
+    Return:
+        What was found in the export, or the error if it failed.
+    """
+    import pandas as pd
+
+    from strengthstats.analysis.preprocessor import (
+        get_all_exercises_dfs,
+        preprocess_data,
+    )
+
+    start = time.perf_counter()
+    try:
+        sets_df, workouts_df = preprocess_data(export_path)
+        exercise_dfs = get_all_exercises_dfs(sets_df)
+
+        exercises_df = pd.concat(
+            [
+                exercise_df.assign(exercise_type=exercise_type.name)
+                for exercise_type, exercise_df in exercise_dfs.items()
+            ],
+            ignore_index=True,
+        )
+        exercises_df.insert(0, "exercise_type", exercises_df.pop("exercise_type"))
+        os.makedirs(output_dir, exist_ok=True)
+        exercises_df.to_csv(os.path.join(output_dir, "exercises.csv"), index=False)
+        workouts_df.to_csv(os.path.join(output_dir, "workouts.csv"))
+    except Exception as e:
+        return _failed(export_path, e, time.perf_counter() - start)
+
+    dates = workouts_df["Date"]
+    return ExportResult(
+        export=export_path,
+        workouts=len(workouts_df),
+        sets=len(sets_df),
+        exercises=int(sets_df["Exercise"].nunique()),
+        first_workout=dates.min().strftime("%Y-%m-%d"),
+        last_workout=dates.max().strftime("%Y-%m-%d"),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def analyze_exports(
+    exports: Sequence[str],
+    output_dir: str,
+    workers: int,
+    analyze: Callable[[str, str], ExportResult] = analyze_export,
+) -> list[ExportResult]:
+    """Analyze exports in a pool of worker processes.
+
+    If a worker process dies, e.g. because it was killed when running
+    out of memory, the pool can't be used anymore. Only the export it
+    was analyzing is then reported as failed, and the exports that were
+    not done yet are analyzed in a new pool. If several exports were
+    being analyzed when the pool broke, each of them is analyzed again
+    in a pool of its own, to find out which one killed its worker.
+
+    Args:
+        exports: Paths of the exports.
+        output_dir: Directory to write one output directory per export
+        to, named after the export file.
+        workers: Number of worker processes. With one worker the exports
+        are analyzed one after another in the current process.
+        analyze: Function analyzing one export, 'analyze_export' by
+        default.
+
+    Return:
+        The results in the order of the exports.
+    """
+    output_dirs = [os.path.join(output_dir, name) for name in output_dir_names(exports)]
+    if workers <= 1:
+        results = []
+        for export_path, export_output_dir in zip(exports, output_dirs):
+            results.append(analyze(export_path, export_output_dir))
+            _log_result(results[-1], len(results), len(exports))
+        return results
+
+    results_by_export: dict[str, ExportResult] = {}
+
+    def add_result(result: ExportResult) -> None:
+        results_by_export[result.export] = result
+        _log_result(result, len(results_by_export), len(exports))
+
+    pending = list(zip(exports, output_dirs))
+    suspects: list[tuple[str, str]] = []
+    while pending or suspects:
+        if suspects:
+            batch, batch_workers = [suspects.pop(0)], 1
+        else:
+            batch, pending, batch_workers = pending, [], workers
+        broken = _analyze_in_pool(batch, batch_workers, analyze, add_result)
+        if broken is None:
+            continue
+
+        error, started, not_started = broken
+        if len(started) == 1:
+            # Only this export can have killed the worker
+            add_result(_failed(started[0][0], error, 0.0))
+            pending.extend(not_started)
+        elif not started:
+            # The workers died before starting on any export
+            for export_path, _ in not_started:
+                add_result(_failed(export_path, error, 0.0))
+        else:
+            suspects.extend(started)
+            pending.extend(not_started)
+
+    return [results_by_export[export_path] for export_path in exports]
+
+
+def _analyze_in_pool(
+    batch: list[tuple[str, str]],
+    workers: int,
+    analyze: Callable[[str, str], ExportResult],
+    add_result: Callable[[ExportResult], None],
+) -> tuple[Exception, list[tuple[str, str]], list[tuple[str, str]]] | None:
+    """Analyze a batch of exports in a new pool of worker processes.
+
+    Return:
+        None if the pool analyzed every export. Otherwise the error that
+        broke the pool, the unfinished exports a worker had started on,
+        and the unfinished exports no worker had started on.
+    """
+    # Spawned workers don't inherit locks or threads of this process
+    context = multiprocessing.get_context("spawn")
+    started_queue: SimpleQueue[str] = context.SimpleQueue()
+    error = None
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(started_queue,),
+    ) as executor:
+        futures = {
+            executor.submit(_analyze_in_worker, analyze, *export): export
+            for export in batch
+        }
+        unfinished = set(batch)
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                error = e
+                continue
+            except Exception as e:
+                result = _failed(futures[future][0], e, 0.0)
+            unfinished.discard(futures[future])
+            add_result(result)
+
+    if error is None:
+        return None
+
+    started_exports = set()
+    while not started_queue.empty():
+        started_exports.add(started_queue.get())
+    started = [
+        export
+        for export in batch
+        if export in unfinished and export[0] in started_exports
+    ]
+    not_started = [
+        export
+        for export in batch
+        if export in unfinished and export[0] not in started_exports
+    ]
+    logger.warning(
+        f"A worker process died while analyzing {len(started)} exports,"
+        f" {len(started) + len(not_started)} exports are unfinished"
+    )
+
+    return error, started, not_started
+
+
+_started_queue: SimpleQueue[str] | None = None
+
+
+def _init_worker(started_queue: SimpleQueue[str]) -> None:
+    """Set up a worker process to report which exports it starts on."""
+    global _started_queue
+
+    _started_queue = started_queue
+
+
+def _analyze_in_worker(
+    analyze: Callable[[str, str], ExportResult], export_path: str, output_dir: str
+) -> ExportResult:
+    """Analyze an export in a worker, reporting that it started."""
+    if _started_queue is not None:
+        _started_queue.put(export_path)
+
+    return analyze(export_path, output_dir)
+
+
+def _failed(export_path: str, error: Exception, seconds: float) -> ExportResult:
+    """Return the result of an export that could not be analyzed."""
+    return ExportResult(
+        export=export_path,
+        workouts=0,
+        sets=0,
+        exercises=0,
+        first_workout="",
+        last_workout="",
+        seconds=seconds,
+        error=f"{type(error).__name__}: {error}",
+    )
+
+
+def _log_result(result: ExportResult, done: int, total: int) -> None:
+    """Log the outcome of one export and the progress of the batch."""
+    if result.error is None:
+        logger.info(
+            f"[{done}/{total}] {result.export}: {result.workouts} workouts,"
+            f" {result.sets} sets in {result.seconds:.2f} s"
+        )
+    else:
+        logger.error(f"[{done}/{total}] {result.export} failed: {result.error}")
+
+
+def write_summary(results: Sequence[ExportResult], path: str) -> None:
+    """Write one row per export with its counts or its error."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        for result in results:
+            writer.writerow(
+                [
+                    result.export,
+                    "ok" if result.error is None else "failed",
+                    result.workouts,
+                    result.sets,
+                    result.exercises,
+                    result.first_workout,
+                    result.last_workout,
+                    f"{result.seconds:.3f}",
+                    result.error or "",
+                ]
+            )
+
+
+def format_throughput(results: Sequence[ExportResult], seconds: float) -> str:
+    """Describe how many exports and sets were analyzed per second."""
+    succeeded = [result for result in results if result.error is None]
+    sets = sum(result.sets for result in succeeded)
+    seconds = max(seconds, 1e-9)
+
+    return (
+        f"Analyzed {len(succeeded)} of {len(results)} exports"
+        f" ({len(results) - len(succeeded)} failed) with {sets} sets"
+        f" in {seconds:.2f} s: {len(results) / seconds:.1f} exports/s,"
+        f" {sets / seconds:.0f} sets/s"
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the command line interface.
+
+    Args:
+        argv: Command line arguments, sys.argv by default.
+
+    Return:
+        The exit status, 1 if any export failed.
+    """
+    parser = argparse.ArgumentParser(
+        prog="strengthstats",
+        description="Parse and aggregate StrengthLog exports in parallel.",
+    )
+    parser.add_argument(
+        "exports",
+        nargs="+",
+        help="Export files, directories with exports, or glob patterns",
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="Directory to write the outputs to"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only log errors")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.ERROR if args.quiet else logging.INFO,
+        format="%(message)s",
+    )
+    exports = find_exports(args.exports)
+    if not exports:
+        parser.error("No exports found")
+
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    results = analyze_exports(exports, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+
+    write_summary(results, os.path.join(args.output, SUMMARY_FILE))
+    print(format_throughput(results, elapsed), file=sys.stderr)
+
+    return 1 if any(result.error is not None for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
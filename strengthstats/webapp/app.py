@@ -1,28 +1,186 @@
-"""Main logic of the web app."""
+"""Main logic of the web app.
 
+The analysis stack, pandas and matplotlib, is only imported when a
+report is first generated, so that starting the app and serving light
+routes like the index page and uploads stays fast. Call 'warm_up' to
+import it ahead of time instead.
+"""
+
+from __future__ import annotations
+
+import importlib
 import os
-from typing import NoReturn
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, NoReturn
 from uuid import uuid4
 
-import pandas as pd
-from flask import Flask, abort, redirect, render_template, request, session, url_for
+from flask import (
+    Flask,
+    abort,
+    g,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    session,
+    url_for,
+)
 from flask.sessions import SessionMixin
 from werkzeug.wrappers.response import Response
 
+from strengthstats.analysis import instrumentation
 from strengthstats.analysis.constants import ET, Units
-from strengthstats.analysis.preprocessor import get_all_exercises_dfs, preprocess_data
-from strengthstats.analysis.visualizer import generate_exercise_plots
+from strengthstats.analysis.exceptions import ExportError
+from strengthstats.webapp.jobs import (
+    QueueFullError,
+    ReportJob,
+    ReportJobQueue,
+    SingleFlight,
+    Stage,
+)
+from strengthstats.webapp.reports import remove_report
+from strengthstats.webapp.storage import UserStorage
+from strengthstats.webapp.uploads import UploadError, UploadTooLargeError, save_upload
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from strengthstats.analysis.rollups import Period
+    from strengthstats.analysis.store import TrainingStore
+    from strengthstats.analysis.visualizer import PlotJob
 
 app = Flask(__name__)
 app.secret_key = "replace_with_something_secure"
 
 
 DATA_FOLDER = "data"
+CACHE_FOLDER = "cache"
 EXPORT_CSV_NAME = "strengthlog_export.csv"
+INGEST_STATE_NAME = "ingest"
+COLUMNS_NAME = "columns"
+REPORT_NAME = "report"
+REPORT_HTML = "report.html"
+UPLOAD_EXTENSIONS = (".csv", ".gz", ".zip")
 app.config["DATA_FOLDER"] = DATA_FOLDER
+app.config["CACHE_FOLDER"] = CACHE_FOLDER
+app.config["CACHE_MAX_BYTES"] = 512 * 1024 * 1024
+# Largest accepted upload as sent, and once decompressed
+app.config["MAX_CONTENT_LENGTH"] = 64 * 1024 * 1024
+app.config["UPLOAD_MAX_BYTES"] = 256 * 1024 * 1024
+app.config["STORE_PATH"] = os.path.join(DATA_FOLDER, "strengthstats.sqlite3")
+# Least recently used user folders are evicted once all of them take
+# more bytes or are more folders than this, and folders unused for
+# longer than the TTL are removed by a sweeper running every interval
+app.config["USER_STORAGE_MAX_BYTES"] = 2 * 1024 * 1024 * 1024
+app.config["USER_STORAGE_MAX_FOLDERS"] = 1000
+app.config["USER_FOLDER_TTL"] = 7 * 24 * 60 * 60
+app.config["USER_STORAGE_SWEEP_INTERVAL"] = 10 * 60
+# Record stage timings for /metrics, optionally with memory peaks, and
+# log how long each stage of a request or report job took
+app.config["METRICS_ENABLED"] = True
+app.config["METRICS_TRACE_MEMORY"] = False
+app.config["METRICS_LOG_STAGES"] = False
+# Plots are rendered when first requested, except for the ones of this
+# many most trained exercises, which are rendered in the background as
+# soon as the report is generated
+app.config["PLOT_PREWARM"] = 3
+# Number of processes pre-rendering plots, 1 renders them in the
+# background thread of the app
+app.config["PLOT_WORKERS"] = min(4, os.cpu_count() or 1)
+# Series with more points are downsampled to this many, both in plots
+# and in the series API
+app.config["SERIES_MAX_POINTS"] = 1000
+# Series in the series API with at most this many points are sent as
+# they are, even if longer than the point budget. None to downsample
+# every series longer than the budget.
+app.config["SERIES_DOWNSAMPLE_THRESHOLD"] = None
+# Draw charts in the browser from the series API instead of as PNGs
+app.config["CLIENT_SIDE_CHARTS"] = False
+# Reports generated at the same time, and at most queued or running
+app.config["REPORT_WORKERS"] = 2
+app.config["REPORT_MAX_PENDING"] = 32
+SERIES_COLUMNS = ["total_volume", "max_weight", "total_reps"]
+# Plots are cached for a year when requested by the URL with their
+# fingerprint, which changes whenever they do
+PLOT_MAX_AGE = 365 * 24 * 60 * 60
+# Counts of rollups are integers, the other columns may be missing
+ROLLUP_COUNT_COLUMNS = ["workouts", "sets", "total_reps"]
+ROLLUP_VALUE_COLUMNS = ["max_weight", "total_volume"]
+# Columns of records besides the exercise and date, which may be missing
+RECORD_VALUE_COLUMNS = ["reps", "weight", "e1rm", "best_e1rm"]
+# Modules imported on first use, see 'warm_up'
+ANALYSIS_MODULES = [
+    "pandas",
+    "strengthstats.analysis.cache",
+    "strengthstats.analysis.columnar",
+    "strengthstats.analysis.downsample",
+    "strengthstats.analysis.incremental",
+    "strengthstats.analysis.records",
+    "strengthstats.analysis.rollups",
+    "strengthstats.analysis.store",
+    "strengthstats.analysis.visualizer",
+]
 if not os.path.exists(DATA_FOLDER):
     os.mkdir(DATA_FOLDER)
 
+instrumentation.configure(
+    enabled=app.config["METRICS_ENABLED"],
+    trace_memory=app.config["METRICS_TRACE_MEMORY"],
+)
+_stores: dict[str, TrainingStore] = {}
+_storages: dict[str, UserStorage] = {}
+_storages_lock = threading.Lock()
+report_jobs = ReportJobQueue(
+    max_workers=app.config["REPORT_WORKERS"],
+    max_pending=app.config["REPORT_MAX_PENDING"],
+)
+plot_renders = SingleFlight()
+report_renders = SingleFlight()
+plot_prewarmer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot-prewarm")
+store_saves = SingleFlight()
+store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-writer")
+
+
+@app.before_request
+def start_collecting_stages() -> None:
+    """Collect the pipeline stages run while handling the request."""
+    if app.config["METRICS_LOG_STAGES"]:
+        g.stage_records = instrumentation.start_collecting()
+
+
+@app.before_request
+def touch_user_folder() -> None:
+    """Mark the folder of the session as used, so it isn't evicted."""
+    if "id" in session:
+        get_storage().touch(session["id"])
+
+
+@app.teardown_request
+def log_stages(_: BaseException | None) -> None:
+    """Log how long each pipeline stage of the request took."""
+    stage_records = g.pop("stage_records", None)
+    if stage_records is None:
+        return
+    instrumentation.stop_collecting(stage_records)
+    if stage_records:
+        app.logger.info(
+            f"Stages of {request.path}:"
+            f" {instrumentation.format_stages(stage_records)}"
+        )
+
+
+@app.route("/metrics")
+def get_metrics() -> Response:
+    """Return pipeline stage metrics in the Prometheus text format."""
+    return Response(
+        instrumentation.render_prometheus(),
+        mimetype="text/plain; version=0.0.4",
+    )
+
 
 @app.route("/")
 def index() -> str:
@@ -38,61 +196,725 @@ def upload_strenghlog_export() -> Response:
         app.logger.warning("Something went wrong with submitting the file")
         return redirect(url_for("index"))
     f = request.files["strengthlog_csv"]
-    if f.filename == "" or not f.filename.endswith(".csv"):
-        app.logger.warning("The file does not have the .csv extension")
+    if f.filename == "" or not f.filename.endswith(UPLOAD_EXTENSIONS):
+        app.logger.warning("The file does not have a .csv, .gz or .zip extension")
         return redirect(url_for("index"))
 
     # Save the file to disk for use in report generation
     ensure_user_folder(session)
-    session["csv_path"] = os.path.join(session["user_folder"], EXPORT_CSV_NAME)
-    f.save(session["csv_path"])
+    csv_path = os.path.join(session["user_folder"], EXPORT_CSV_NAME)
+    try:
+        digest = save_upload(f.stream, csv_path, app.config["UPLOAD_MAX_BYTES"])
+    except UploadTooLargeError as e:
+        app.logger.warning(f"Rejected upload: {e}")
+        abort(413, str(e))
+    except (UploadError, ExportError) as e:
+        app.logger.warning(f"Rejected upload: {e}")
+        abort(400, str(e))
+    session["csv_path"] = csv_path
     app.logger.info(f"Saved/overwrote CSV file {session['csv_path']}")
+    remove_report(os.path.join(session["user_folder"], REPORT_NAME))
+    get_storage().record_change(session["id"])
+
+    session["export_digest"] = digest
+    try:
+        submit_report_job(session)
+    except QueueFullError:
+        abort(503, "Too many reports are being generated, please try again later")
 
     return redirect(url_for("generate_report"))
 
 
 @app.route("/report")
-def generate_report() -> str | NoReturn:
-    """Generate report."""
+def generate_report() -> str | Response | NoReturn:
+    """Show the report, or its progress while it is being generated.
+
+    Sessions without an export, e.g. because their user folder was
+    evicted, are sent back to the homepage to upload it (again). Exports
+    that turn out to be unusable only while generating the report, e.g.
+    without any workouts, are rejected like bad uploads.
+    """
     if "csv_path" not in session or not os.path.exists(session["csv_path"]):
-        abort(500, "No CSV file found for this session")
+        if "csv_path" in session:
+            app.logger.info(f"Export of session {session['id']} is gone")
+            session.pop("csv_path")
+            session.pop("export_digest", None)
+        return redirect(url_for("index"))
+
+    job = report_jobs.get(report_job_key(session))
+    if job is None:
+        # E.g. the server restarted since the export was uploaded
+        try:
+            job = submit_report_job(session)
+        except QueueFullError:
+            abort(503, "Too many reports are being generated, please try again later")
+
+    if job.stage == Stage.FAILED:
+        if isinstance(job.exception, ExportError):
+            abort(400, str(job.exception))
+        abort(500, f"The report could not be generated: {job.error}")
+    if job.stage != Stage.DONE:
+        return render_template("report_pending.html", stage=job.stage.name.lower())
+
+    return report_response(job)
+
+
+def report_response(job: ReportJob) -> Response:
+    """Return the report of a finished job, compressed if accepted.
+
+    The report is rendered and compressed once, then stored in the user
+    folder under a key covering the export, the result of the job and
+    the report template. Concurrent first views render it only once.
+    """
+    from strengthstats.webapp.reports import (
+        ENCODINGS,
+        read_report,
+        report_key,
+        write_report,
+    )
+
+    report_dir = os.path.join(session["user_folder"], REPORT_NAME)
+    template_path = os.path.join(app.root_path, str(app.template_folder), REPORT_HTML)
+    key = report_key(job.key, job.result, os.path.getmtime(template_path))
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+
+    data = read_report(report_dir, key, encoding)
+    if data is None:
+
+        def render() -> str:
+            html = render_template(REPORT_HTML, **job.result)
+            try:
+                write_report(report_dir, key, html)
+            except OSError as e:
+                app.logger.warning(f"Couldn't store the report in {report_dir}: {e}")
+            else:
+                get_storage().record_change(session["id"])
+            return html
+
+        html = report_renders.run(key, render)
+        data = read_report(report_dir, key, encoding)
+        if data is None:
+            data, encoding = html.encode(), None
+
+    response = Response(data, mimetype="text/html")
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(f"{key}-{encoding or 'identity'}")
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
+
+
+@app.route("/report/status")
+def get_report_status() -> Response | tuple[Response, int]:
+    """Return the stage of the report job of the session as JSON."""
+    job = report_jobs.get(report_job_key(session)) if "csv_path" in session else None
+    if job is None:
+        return jsonify(error="No report is being generated for this session"), 404
+
+    return jsonify(stage=job.stage.name.lower(), error=job.error)
+
+
+def report_job_key(session: SessionMixin) -> tuple[str, str]:
+    """Return the key of the report job for the export of a session."""
+    return session["id"], export_digest(session)
+
+
+def export_digest(session: SessionMixin) -> str:
+    """Return the content hash of the export of a session."""
+    if "export_digest" not in session:
+        from strengthstats.analysis.cache import hash_export
+
+        session["export_digest"] = hash_export(session["csv_path"])
+
+    return str(session["export_digest"])
+
+
+def submit_report_job(session: SessionMixin) -> ReportJob:
+    """Queue generating the report for the export of a session.
+
+    Raises:
+        QueueFullError: If too many reports are already queued.
+    """
+    user = session["id"]
+    csv_path = session["csv_path"]
+    user_folder = session["user_folder"]
+
+    return report_jobs.submit(
+        report_job_key(session),
+        lambda job: run_report_job(job, user, csv_path, user_folder),
+    )
+
+
+def run_report_job(
+    job: ReportJob, user: str, csv_path: str, user_folder: str
+) -> dict[str, Any]:
+    """Parse and aggregate an export and generate its plots.
+
+    This runs in a background thread, outside of any request.
+
+    Return:
+        Keyword arguments for rendering the report template.
+    """
+    with instrumentation.collect_stages() as stage_records:
+        job.set_stage(Stage.PARSE)
+        sets_df, _, exercise_dfs = load_export(
+            user,
+            csv_path,
+            user_folder,
+            on_aggregate=lambda: job.set_stage(Stage.AGGREGATE),
+            store_in_background=True,
+        )
+
+        if app.config["CLIENT_SIDE_CHARTS"]:
+            result: dict[str, Any] = {
+                "exercise_names": sorted(
+                    str(exercise_name)
+                    for exercise_df in exercise_dfs.values()
+                    for exercise_name in exercise_df["Exercise"].unique()
+                )
+            }
+        else:
+            from strengthstats.analysis.visualizer import plot_fingerprint
+
+            job.set_stage(Stage.PLOT)
+            plots_dir = os.path.join(user_folder, "plots")
+            plot_jobs = plan_plots(sets_df, exercise_dfs, plots_dir)
+            plot_prewarmer.submit(
+                prewarm_plots, user, plot_jobs[: app.config["PLOT_PREWARM"]]
+            )
+            result = {
+                "plots": {
+                    plot_job.exercise_name: plot_fingerprint(plot_job)
+                    for plot_job in plot_jobs
+                }
+            }
+    get_storage().record_change(user)
 
-    sets_df, _ = preprocess_data(session["csv_path"])
-    exercise_dfs = get_all_exercises_dfs(sets_df)
+    if app.config["METRICS_LOG_STAGES"]:
+        app.logger.info(
+            f"Stages of report job {job.key}:"
+            f" {instrumentation.format_stages(stage_records)}"
+        )
+
+    return result
+
+
+@app.route("/plots/<path:exercise_name>.png")
+def get_plot(exercise_name: str) -> Response | tuple[Response, int]:
+    """Return the plot of an exercise of the session as PNG.
+
+    Plots are rendered on their first request, and again when requested
+    with the fingerprint of newer data than they were rendered from.
+    Concurrent requests for the same plot render it only once.
+
+    The fingerprint of the plot is its strong ETag, so that browsers
+    revalidating it get an empty 304 response while it is unchanged.
+    Reports link to plots with their fingerprint in the 'v' query
+    parameter, those URLs are cached as immutable.
+    """
+    from strengthstats.analysis.plotfiles import plot_path, read_fingerprint
+
+    if "user_folder" not in session:
+        return jsonify(error="No plots found for this session"), 404
     plots_dir = os.path.join(session["user_folder"], "plots")
-    generate_plots(sets_df, exercise_dfs, plots_dir, session)
-    app.logger.info(f"Generated and saved plots to {plots_dir}")
+    path = plot_path(plots_dir, exercise_name)
+    fingerprint = read_fingerprint(plots_dir, exercise_name)
+    version = request.args.get("v")
+    if not os.path.exists(path) or (version is not None and version != fingerprint):
+        fingerprint = render_session_plot(exercise_name, plots_dir) or fingerprint
+    if not os.path.exists(path):
+        return jsonify(error=f"No plot of an exercise named {exercise_name}"), 404
+
+    response = send_file(
+        os.path.abspath(path), mimetype="image/png", etag=fingerprint or True
+    )
+    if fingerprint is not None and request.args.get("v") == fingerprint:
+        response.headers["Cache-Control"] = (
+            f"private, max-age={PLOT_MAX_AGE}, immutable"
+        )
+    else:
+        response.headers["Cache-Control"] = "private, no-cache"
+
+    return response
+
+
+def render_session_plot(exercise_name: str, plots_dir: str) -> str | None:
+    """Render the plot of an exercise of the session from the store.
+
+    Return:
+        The fingerprint of the plot, or None if the session has no
+        export or the export has no such exercise.
+    """
+    from strengthstats.analysis.visualizer import PlotJob, plot_fingerprint
+
+    if "csv_path" not in session or not os.path.exists(session["csv_path"]):
+        return None
+
+    store = get_store()
+    if store.digest(session["id"]) != export_digest(session):
+        load_export(session["id"], session["csv_path"], session["user_folder"])
+    found = store.exercise_series(session["id"], exercise_name)
+    if found is None:
+        return None
+    exercise_type, exercise_rows = found
+
+    job = PlotJob(
+        dates=exercise_rows["Date"].to_numpy(),
+        volumes=exercise_rows["total_volume"].to_numpy(),
+        exercise_name=exercise_name,
+        unit=Units.short[exercise_type],
+        dst_dir=plots_dir,
+        max_points=app.config["SERIES_MAX_POINTS"],
+    )
+    os.makedirs(plots_dir, exist_ok=True)
+    if render_plot(job):
+        get_storage().record_change(session["id"])
+
+    return plot_fingerprint(job)
+
+
+@app.route("/api/exercises/<path:exercise_name>")
+def get_exercise_series(exercise_name: str) -> Response | tuple[Response, int]:
+    """Return the per-workout series of an exercise as JSON.
+
+    The series are returned column-wise, with one list per column, so
+    that charts can be drawn in the browser. The optional 'start' and
+    'end' query parameters, formatted as YYYY-MM-DD, limit the series to
+    workouts within that date range.
+
+    Long series are downsampled to the 'SERIES_MAX_POINTS' setting, or
+    to the smaller number of points given by the optional 'max_points'
+    query parameter, keeping the shape of the volume series. Series
+    with at most 'SERIES_DOWNSAMPLE_THRESHOLD' points, if set, are kept
+    whole.
+    """
+    import pandas as pd
+
+    from strengthstats.analysis.downsample import MIN_POINTS, downsample_indices
+
+    if "csv_path" not in session or not os.path.exists(session["csv_path"]):
+        return jsonify(error="No CSV file found for this session"), 404
+
+    try:
+        start = _parse_date_arg("start")
+        end = _parse_date_arg("end")
+    except ValueError:
+        return jsonify(error="Dates must be formatted as YYYY-MM-DD"), 400
+    try:
+        max_points = int(
+            request.args.get("max_points", app.config["SERIES_MAX_POINTS"])
+        )
+    except ValueError:
+        return jsonify(error="max_points must be an integer"), 400
+    if max_points < MIN_POINTS:
+        return jsonify(error=f"max_points must be at least {MIN_POINTS}"), 400
+    max_points = min(max_points, app.config["SERIES_MAX_POINTS"])
+
+    store = get_store()
+    if store.digest(session["id"]) != export_digest(session):
+        load_export(session["id"], session["csv_path"], session["user_folder"])
+    found = store.exercise_series(session["id"], exercise_name, start, end)
+    if found is None:
+        return jsonify(error=f"No exercise named {exercise_name}"), 404
+    exercise_type, exercise_rows = found
+    kept = downsample_indices(
+        exercise_rows["Date"].to_numpy(),
+        exercise_rows["total_volume"].to_numpy(),
+        max_points,
+        threshold=app.config["SERIES_DOWNSAMPLE_THRESHOLD"],
+    )
+    exercise_rows = exercise_rows.iloc[kept]
 
-    return render_template("report.html")
+    series: dict[str, Any] = {
+        "exercise": exercise_name,
+        "exercise_type": exercise_type.name,
+        "unit": Units.short[exercise_type],
+        "Date": exercise_rows["Date"].dt.strftime("%Y-%m-%d").tolist(),
+    }
+    for column in SERIES_COLUMNS:
+        values = exercise_rows[column].astype("float64")
+        series[column] = [None if pd.isna(v) else v for v in values.tolist()]
 
+    return jsonify(series)
 
-def generate_plots(
+
+@app.route("/api/rollups/<period>")
+def get_rollups(period: str) -> Response | tuple[Response, int]:
+    """Return the weekly or monthly rollups of the exercises as JSON.
+
+    The period is 'week' or 'month'. Rollups are returned column-wise,
+    like exercise series, for all exercises or only the one given by the
+    optional 'exercise' query parameter. The optional 'start' and 'end'
+    query parameters limit them to periods starting within that range.
+    """
+    import pandas as pd
+
+    from strengthstats.analysis.rollups import Period
+
+    if "csv_path" not in session or not os.path.exists(session["csv_path"]):
+        return jsonify(error="No CSV file found for this session"), 404
+    if period.upper() not in Period.__members__:
+        return jsonify(error="The period must be 'week' or 'month'"), 404
+
+    try:
+        start = _parse_date_arg("start")
+        end = _parse_date_arg("end")
+    except ValueError:
+        return jsonify(error="Dates must be formatted as YYYY-MM-DD"), 400
+
+    store = get_store()
+    if store.digest(session["id"]) != export_digest(session):
+        load_export(session["id"], session["csv_path"], session["user_folder"])
+    rollups_df = store.rollups(
+        session["id"],
+        Period[period.upper()],
+        request.args.get("exercise"),
+        start,
+        end,
+    )
+
+    rollups: dict[str, Any] = {
+        "period": period.lower(),
+        "exercise": rollups_df["Exercise"].tolist(),
+        "exercise_type": [ET(value).name for value in rollups_df["exercise_type"]],
+        "period_start": rollups_df["period_start"].dt.strftime("%Y-%m-%d").tolist(),
+    }
+    for column in ROLLUP_COUNT_COLUMNS:
+        rollups[column] = rollups_df[column].astype("int64").tolist()
+    for column in ROLLUP_VALUE_COLUMNS:
+        values = rollups_df[column].astype("float64")
+        rollups[column] = [None if pd.isna(v) else v for v in values.tolist()]
+
+    return jsonify(rollups)
+
+
+@app.route("/api/records")
+def get_records() -> Response | tuple[Response, int]:
+    """Return the estimated one-rep maxes of the weighted sets as JSON.
+
+    Records are returned column-wise, like exercise series, in the order
+    the sets were done, for all exercises or only the one given by the
+    optional 'exercise' query parameter. With 'prs_only=1', only the
+    sets that set a new personal record are returned.
+    """
+    import pandas as pd
+
+    if "csv_path" not in session or not os.path.exists(session["csv_path"]):
+        return jsonify(error="No CSV file found for this session"), 404
+
+    store = get_store()
+    if store.digest(session["id"]) != export_digest(session):
+        load_export(session["id"], session["csv_path"], session["user_folder"])
+    records_df = store.records(
+        session["id"],
+        request.args.get("exercise"),
+        prs_only=request.args.get("prs_only", "0").lower() in ("1", "true"),
+    )
+
+    records: dict[str, Any] = {
+        "exercise": records_df["Exercise"].tolist(),
+        "Date": records_df["Date"].dt.strftime("%Y-%m-%d").tolist(),
+        "is_pr": records_df["is_pr"].tolist(),
+    }
+    for column in RECORD_VALUE_COLUMNS:
+        values = records_df[column].astype("float64")
+        records[column] = [None if pd.isna(v) else v for v in values.tolist()]
+
+    return jsonify(records)
+
+
+def _parse_date_arg(name: str) -> datetime | None:
+    """Parse an optional YYYY-MM-DD date from the query string."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def get_store() -> TrainingStore:
+    """Return the training store of the app, opening it if needed."""
+    from strengthstats.analysis.store import TrainingStore
+
+    store_path = app.config["STORE_PATH"]
+    if store_path not in _stores:
+        _stores[store_path] = TrainingStore(store_path)
+
+    return _stores[store_path]
+
+
+def get_storage() -> UserStorage:
+    """Return the manager of the user folders in the data folder.
+
+    The first call for a data folder starts the background sweeper of
+    expired user folders.
+    """
+    data_folder = app.config["DATA_FOLDER"]
+    with _storages_lock:
+        if data_folder not in _storages:
+            # E.g. an export cache or a store kept in the data folder
+            exclude = [
+                os.path.relpath(path, data_folder).split(os.sep)[0]
+                for path in (app.config["CACHE_FOLDER"], app.config["STORE_PATH"])
+            ]
+            storage = UserStorage(
+                data_folder,
+                max_bytes=app.config["USER_STORAGE_MAX_BYTES"],
+                max_folders=app.config["USER_STORAGE_MAX_FOLDERS"],
+                ttl_seconds=app.config["USER_FOLDER_TTL"],
+                on_evict=forget_user,
+                exclude=exclude,
+            )
+            storage.start_sweeper(app.config["USER_STORAGE_SWEEP_INTERVAL"])
+            _storages[data_folder] = storage
+
+        return _storages[data_folder]
+
+
+def forget_user(user: str) -> None:
+    """Remove what is kept of a user beside their evicted folder.
+
+    Only training stores that are already open are cleared, so that
+    evicting doesn't import the analysis stack.
+    """
+    for store in list(_stores.values()):
+        store.delete(user)
+    report_jobs.forget(lambda key: isinstance(key, tuple) and key[0] == user)
+
+
+@instrumentation.instrument(rows=lambda frames: len(frames[0]))
+def load_export(
+    user: str,
+    csv_path: str,
+    user_folder: str,
+    on_aggregate: Callable[[], None] | None = None,
+    store_in_background: bool = False,
+) -> tuple[pd.DataFrame, pd.DataFrame, dict[ET, pd.DataFrame]]:
+    """Load the sets, workouts and exercise DataFrames of an export.
+
+    The DataFrames are memory-mapped from the columnar files in the user
+    folder if they hold the same export, so that all processes serving
+    the user share them. Otherwise they are taken from the export cache
+    if an export with identical content has been processed before, or
+    from the training store if it is the export the user uploaded last
+    time. Otherwise the export is ingested, which only parses workouts
+    that were not in the previous export of the same user, and the
+    result is added to the cache. The columnar files are then replaced.
+    The training store is updated whenever it doesn't already have the
+    export, with the rollups and records kept by the ingestion if there
+    are any.
+
+    Ingested DataFrames index workouts oldest first, see 'incremental',
+    and the other sources hold DataFrames that were ingested as well.
+
+    Saving to the training store takes longer than ingesting, so the
+    report job leaves it to a background thread with
+    store_in_background, instead of making the report wait for it.
+    """
+    from strengthstats.analysis.cache import ExportCache, hash_export
+    from strengthstats.analysis.columnar import open_frames, write_frames
+    from strengthstats.analysis.incremental import (
+        ingest_export,
+        load_records,
+        load_rollups,
+    )
+
+    cache = ExportCache(app.config["CACHE_FOLDER"], app.config["CACHE_MAX_BYTES"])
+    store = get_store()
+    digest = hash_export(csv_path)
+    columns_dir = os.path.join(user_folder, COLUMNS_NAME)
+
+    rollups = records_df = None
+    frames = open_frames(columns_dir, digest)
+    if frames is not None:
+        app.logger.info(f"Memory-mapped export {digest} from {columns_dir}")
+    else:
+        frames = cache.get(digest)
+        if frames is not None:
+            app.logger.info(f"Loaded export {digest} from cache")
+        else:
+            frames = store.load(user, digest)
+            if frames is not None:
+                app.logger.info(f"Loaded export {digest} from the training store")
+            else:
+                state_dir = os.path.join(user_folder, INGEST_STATE_NAME)
+                frames = ingest_export(csv_path, state_dir, on_aggregate)
+                rollups = load_rollups(state_dir)
+                records_df = load_records(state_dir)
+            cache.put(digest, *frames)
+        write_frames(columns_dir, digest, *frames)
+
+    if store.digest(user) != digest:
+        if store_in_background:
+            future = store_writer.submit(
+                save_export, user, digest, frames, rollups, records_df, csv_path
+            )
+            future.add_done_callback(_log_failed_save)
+        else:
+            save_export(user, digest, frames, rollups, records_df)
+
+    return frames
+
+
+@instrumentation.instrument()
+def save_export(
+    user: str,
+    digest: str,
+    frames: tuple[pd.DataFrame, pd.DataFrame, dict[ET, pd.DataFrame]],
+    rollups: dict[Period, pd.DataFrame] | None = None,
+    records_df: pd.DataFrame | None = None,
+    csv_path: str | None = None,
+) -> None:
+    """Save an export to the training store, unless it already has it.
+
+    Concurrent calls for the same export save it only once, e.g. a
+    request needing the store while a background thread is saving.
+
+    Args:
+        csv_path: If given, the export is only saved if this file still
+        has the digest, i.e. it was not replaced by a newer upload while
+        the save was queued.
+    """
+    from strengthstats.analysis.cache import hash_export
+
+    store = get_store()
+
+    def save() -> None:
+        if store.digest(user) == digest:
+            return
+        if csv_path is not None and hash_export(csv_path) != digest:
+            app.logger.info(f"Not storing outdated export {digest} of {user}")
+            return
+        store.save(user, digest, *frames, rollups=rollups, records_df=records_df)
+
+    store_saves.run((store.db_path, user, digest), save)
+
+
+def _log_failed_save(future: Future[None]) -> None:
+    """Log the error of a save to the store done in the background."""
+    error = future.exception()
+    if error is not None:
+        app.logger.error("Saving to the training store failed", exc_info=error)
+
+
+@instrumentation.instrument(rows=len)
+def plan_plots(
     sets_df: pd.DataFrame,
     exercise_dfs: dict[ET, pd.DataFrame],
     plots_dir: str,
-    session: SessionMixin,
-) -> None:
-    """Generate plots for user session and save."""
-    exercise_type_map = {}
+) -> list[PlotJob]:
+    """Plan the plot of every exercise of a user, without rendering.
+
+    If an exercise was logged as more than one exercise type, the first
+    type in 'ET' is plotted, like in the training store.
+
+    Return:
+        One plot job per exercise with sets, most trained exercises
+        first.
+    """
+    from strengthstats.analysis.visualizer import PlotJob, partition_exercises
+
+    exercise_type_map: dict[str, ET] = {}
     for exercise_type, exercice_df in exercise_dfs.items():
-        for exercise_name in exercice_df["Exercise"]:
-            exercise_type_map[exercise_name] = exercise_type
+        for exercise_name in exercice_df["Exercise"].unique():
+            exercise_type_map.setdefault(exercise_name, exercise_type)
 
-    top_ten_exercises = list(sets_df["Exercise"].value_counts(sort=True)[:10].index)
-    for exercise_name in top_ten_exercises:
+    exercise_counts = sets_df["Exercise"].value_counts(sort=True)
+    # Categories of exercises without any sets are counted as zero
+    exercise_counts = exercise_counts[exercise_counts > 0]
+    exercise_partitions: dict[ET, dict[str, pd.DataFrame]] = {}
+    plot_jobs = []
+    for exercise_name in exercise_counts.index:
         exc_type = exercise_type_map.get(exercise_name)
         if exc_type is None:
             app.logger.warning(
                 f"Couldn't find exercise type for exercise {exercise_name}"
             )
             continue
-        generate_exercise_plots(
-            exercise_df=exercise_dfs[exc_type],
-            exercise_name=exercise_name,
-            unit=Units.short[exc_type],
-            dst_dir=plots_dir,
+        if exc_type not in exercise_partitions:
+            exercise_partitions[exc_type] = partition_exercises(exercise_dfs[exc_type])
+        exercise_rows = exercise_partitions[exc_type][exercise_name]
+        plot_jobs.append(
+            PlotJob(
+                dates=exercise_rows["Date"].to_numpy(),
+                volumes=exercise_rows["total_volume"].to_numpy(),
+                exercise_name=exercise_name,
+                unit=Units.short[exc_type],
+                dst_dir=plots_dir,
+                max_points=app.config["SERIES_MAX_POINTS"],
+            )
         )
 
+    return plot_jobs
+
+
+def render_plot(job: PlotJob) -> bool:
+    """Render a plot unless it is current, once for concurrent callers.
+
+    Return:
+        Whether the plot was rendered by this or a concurrent call, as
+        opposed to left as it was because its data didn't change.
+    """
+    from strengthstats.analysis.visualizer import (
+        is_plot_current,
+        plot_fingerprint,
+        render_plot_job,
+    )
+
+    def render() -> bool:
+        if is_plot_current(job):
+            return False
+        render_plot_job(job)
+        return True
+
+    key = (os.path.abspath(job.dst_dir), job.exercise_name, plot_fingerprint(job))
+    return plot_renders.run(key, render)
+
+
+@instrumentation.instrument(rows=lambda rendered: rendered)
+def prewarm_plots(user: str, plot_jobs: list[PlotJob]) -> int:
+    """Render plots of a user ahead of their first request.
+
+    This runs in a background thread, outside of any request. The plots
+    are rendered in parallel by up to 'PLOT_WORKERS' processes, while
+    plots requested in the meantime are rendered by their request.
+
+    Return:
+        The number of plots that were rendered.
+    """
+    from strengthstats.analysis.visualizer import render_plot_jobs
+
+    try:
+        rendered = render_plot_jobs(plot_jobs, workers=app.config["PLOT_WORKERS"])
+    except Exception:
+        app.logger.exception(f"Pre-rendering the plots of {user} failed")
+        return 0
+    app.logger.info(f"Pre-rendered {rendered} of {len(plot_jobs)} plots")
+    if rendered:
+        get_storage().record_change(user)
+
+    return rendered
+
+
+def warm_up(background: bool = False) -> None:
+    """Import the analysis stack before the first report needs it.
+
+    E.g. call this from the post-fork hook of the server, so that the
+    first report generated by a worker doesn't wait for the imports.
+
+    Args:
+        background: Import in a background thread and return at once.
+    """
+    if background:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+        return
+
+    for module in ANALYSIS_MODULES:
+        importlib.import_module(module)
+    app.logger.info("Imported the analysis stack")
+
 
 def ensure_user_folder(session: SessionMixin) -> None:
     """Ensure folder structure for user data exists when session starts.
@@ -0,0 +1,214 @@
+"""Background jobs generating reports.
+
+Generating a report means parsing the export, aggregating it and
+rendering plots, which can take seconds for a large export. Instead of
+doing that inside the upload request, a job is queued on a small pool
+of worker threads, and the report page polls the status of the job
+until it is done.
+
+Jobs are identified by a key, typically the session ID together with
+a hash of the export, so that submitting the same export again while
+its job is still queued or running doesn't start a second job.
+
+Work done inside requests, like rendering a plot on demand, is
+de-duplicated the same way with 'SingleFlight'.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from enum import Enum, auto
+from typing import Any, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Stage(Enum):
+    """Class holding the stages a report job goes through."""
+
+    QUEUED = auto()
+    PARSE = auto()
+    AGGREGATE = auto()
+    PLOT = auto()
+    DONE = auto()
+    FAILED = auto()
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already queued or running."""
+
+
+class ReportJob:
+    """State of one report job."""
+
+    def __init__(self, key: Hashable) -> None:
+        """Create a job that has not started yet."""
+        self.key = key
+        self.stage = Stage.QUEUED
+        self.error: str | None = None
+        # What the job failed with, to tell bad exports from bugs
+        self.exception: Exception | None = None
+        self.result: Any = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job is done or failed."""
+        return self.stage in (Stage.DONE, Stage.FAILED)
+
+    def set_stage(self, stage: Stage) -> None:
+        """Record that the job moved on to another stage."""
+        self.stage = stage
+
+
+class ReportJobQueue:
+    """Bounded pool of worker threads running report jobs.
+
+    At most max_workers jobs run at the same time, and at most
+    max_pending jobs are queued or running. The state of the most recent
+    finished jobs is kept so that their status can still be polled.
+    """
+
+    def __init__(
+        self, max_workers: int, max_pending: int, max_finished: int = 1000
+    ) -> None:
+        """Create a queue, worker threads are started on demand."""
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="report-job"
+        )
+        self._jobs: OrderedDict[Hashable, ReportJob] = OrderedDict()
+        self._futures: set[Future[None]] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, func: Callable[[ReportJob], Any]) -> ReportJob:
+        """Queue a job, unless one with the same key is already queued.
+
+        Args:
+            key: Identifies the job, e.g. the session and export hash.
+            func: Function doing the work. It gets the job, to update
+            its stage, and its return value is stored as the result.
+
+        Return:
+            The new job, or the existing job with the same key if that
+            job has not failed.
+
+        Raises:
+            QueueFullError: If max_pending jobs are already in flight.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.stage != Stage.FAILED:
+                return job
+
+            pending = sum(not job.finished for job in self._jobs.values())
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} report jobs are already queued")
+
+            job = ReportJob(key)
+            self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._forget_finished()
+
+        future = self._executor.submit(self._run, job, func)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard_future)
+
+        return job
+
+    def get(self, key: Hashable) -> ReportJob | None:
+        """Return the job with the given key, if there is one."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def forget(self, matches: Callable[[Hashable], bool]) -> None:
+        """Drop the finished jobs whose key matches, e.g. of a session.
+
+        Jobs that are queued or running are kept.
+        """
+        with self._lock:
+            for key in [key for key, job in self._jobs.items() if job.finished]:
+                if matches(key):
+                    del self._jobs[key]
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait until the jobs queued or running now have finished.
+
+        Args:
+            timeout: Most seconds to wait, or None to wait as long as it
+            takes.
+
+        Return:
+            Whether all of the jobs finished within the timeout.
+        """
+        with self._lock:
+            futures = list(self._futures)
+        _, not_done = wait(futures, timeout)
+
+        return not not_done
+
+    def _discard_future(self, future: Future[None]) -> None:
+        """Stop tracking the future of a finished job."""
+        with self._lock:
+            self._futures.discard(future)
+
+    def _run(self, job: ReportJob, func: Callable[[ReportJob], Any]) -> None:
+        """Run a job in a worker thread and record how it ended."""
+        try:
+            job.result = func(job)
+        except Exception as e:
+            logger.exception(f"Report job {job.key} failed")
+            job.error = str(e)
+            job.exception = e
+            job.set_stage(Stage.FAILED)
+        else:
+            job.set_stage(Stage.DONE)
+
+    def _forget_finished(self) -> None:
+        """Drop the oldest finished jobs beyond max_finished."""
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
+
+
+class SingleFlight:
+    """Runs a function once per key for all concurrent callers.
+
+    The first caller with a key runs the function, callers with the same
+    key arriving while it runs wait for it and get the same result or
+    exception. Once it finished, the next caller runs it again.
+    """
+
+    def __init__(self) -> None:
+        """Create an instance without any calls in flight."""
+        self._calls: dict[Hashable, Future[Any]] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, func: Callable[[], T]) -> T:
+        """Run func, unless a call with the same key is in flight.
+
+        Return:
+            The return value of func, from this or the concurrent call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            running = future is None
+            if future is None:
+                future = self._calls[key] = Future()
+
+        if running:
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+
+        result: T = future.result()
+        return result
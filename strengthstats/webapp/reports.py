@@ -0,0 +1,127 @@
+"""Cache of rendered reports, stored precompressed.
+
+Rendering the report template and compressing the result is done once
+per export and render configuration, instead of on every view. The HTML
+is stored in the user folder as is, gzip compressed and, if the optional
+'brotli' package is installed, brotli compressed, so that every client
+can be sent the smallest variant it accepts without compressing it per
+request.
+
+A report is stored under a key covering everything it was rendered
+from. Looking it up with any other key, e.g. after a new export was
+uploaded, misses, and storing a new report replaces the old one.
+"""
+
+import gzip
+import hashlib
+import importlib
+import logging
+import os
+import shutil
+from collections.abc import Callable
+from types import ModuleType
+from typing import Any
+
+from strengthstats.analysis.atomic import make_temp_dir, replace_directory
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = "report.html"
+KEY_FILE = "key"
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def _import_brotli() -> ModuleType | None:
+    """Return the brotli module, or None if it isn't installed."""
+    try:
+        return importlib.import_module("brotli")
+    except ImportError:
+        return None
+
+
+brotli = _import_brotli()
+
+
+def _compressors() -> dict[str, tuple[str, Callable[[bytes], bytes]]]:
+    """Return the file extension and compressor of every encoding."""
+    compressors: dict[str, tuple[str, Callable[[bytes], bytes]]] = {
+        "gzip": (".gz", lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0)),
+    }
+    if brotli is not None:
+        compressors["br"] = (
+            ".br",
+            lambda data: brotli.compress(data, quality=BROTLI_QUALITY),
+        )
+
+    return compressors
+
+
+COMPRESSORS = _compressors()
+# Most preferred first, for when a client accepts several equally
+ENCODINGS = sorted(COMPRESSORS, key=["br", "gzip"].index)
+
+
+def report_key(*parts: Any) -> str:
+    """Return the key of a report rendered from the given parts.
+
+    Args:
+        parts: Everything the report depends on, with a stable repr,
+        e.g. the export hash and render settings.
+    """
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def write_report(directory: str, key: str, html: str) -> None:
+    """Store a rendered report and its compressed variants.
+
+    The files are written to a temporary directory that then replaces
+    the old one, so that readers never see a partially written report.
+
+    Args:
+        directory: Directory of the report, e.g. in the user folder.
+        key: Key of the report, see 'report_key'.
+        html: The rendered report.
+    """
+    tmp_dir = make_temp_dir(directory)
+    data = html.encode()
+    with open(os.path.join(tmp_dir, REPORT_FILE), "wb") as f:
+        f.write(data)
+    for extension, compress in COMPRESSORS.values():
+        with open(os.path.join(tmp_dir, REPORT_FILE + extension), "wb") as f:
+            f.write(compress(data))
+    with open(os.path.join(tmp_dir, KEY_FILE), "w") as f:
+        f.write(key)
+
+    if replace_directory(tmp_dir, directory):
+        logger.info(f"Stored report {key} in {directory}")
+
+
+def read_report(directory: str, key: str, encoding: str | None) -> bytes | None:
+    """Read a stored report in an encoding.
+
+    Args:
+        directory: Directory passed to 'write_report'.
+        key: Key of the report.
+        encoding: One of 'ENCODINGS', or None for the uncompressed
+        report.
+
+    Return:
+        The encoded report, or None if no report with the key is
+        stored.
+    """
+    extension = "" if encoding is None else COMPRESSORS[encoding][0]
+    try:
+        with open(os.path.join(directory, KEY_FILE)) as f:
+            if f.read() != key:
+                return None
+        with open(os.path.join(directory, REPORT_FILE + extension), "rb") as f:
+            return f.read()
+    except OSError:
+        # E.g. replaced by a newer report in the meantime
+        return None
+
+
+def remove_report(directory: str) -> None:
+    """Remove a stored report, if there is one."""
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,232 @@
+"""Quota and TTL management of the per-session user folders.
+
+Every session gets a folder in the data folder, holding the uploaded
+export, its plots and the files derived from it. Left alone, these
+folders would pile up forever, so the storage manager keeps them within
+quotas:
+
+- A folder not used for longer than the TTL is removed by a background
+  sweeper.
+- If the folders take more than a number of bytes in total, or if there
+  are more than a number of folders, the least recently used ones are
+  removed until both quotas are met.
+
+Like entries of the export cache, a folder is marked as used by setting
+its modification time, so the last access of every folder survives
+restarts and is shared between processes. Sizes of folders are kept in
+memory, and measured again whenever a folder is known to have changed.
+
+Only folders are managed. Files in the data folder, like the training
+store, folders starting with a dot and excluded folders, like an export
+cache kept in the data folder, are left alone.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+from collections.abc import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+def folder_size(path: str) -> int:
+    """Return the total size in bytes of the files in a folder tree."""
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except OSError:
+                # Removed while walking, e.g. a replaced temporary file
+                pass
+
+    return total
+
+
+class UserStorage:
+    """Keeps the user folders in a data folder within quotas."""
+
+    def __init__(
+        self,
+        data_dir: str,
+        max_bytes: int,
+        max_folders: int,
+        ttl_seconds: float,
+        on_evict: Callable[[str], None] | None = None,
+        exclude: Iterable[str] = (),
+    ) -> None:
+        """Manage the user folders in data_dir.
+
+        Args:
+            data_dir: Folder with one folder per user.
+            max_bytes: Most bytes all user folders may take together.
+            max_folders: Most user folders there may be.
+            ttl_seconds: Time after its last use that a folder expires.
+            on_evict: Called with the name of every removed folder, e.g.
+            to remove other data of that user.
+            exclude: Names of folders in data_dir that are not user
+            folders.
+        """
+        self.data_dir = data_dir
+        self.max_bytes = max_bytes
+        self.max_folders = max_folders
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.exclude = frozenset(exclude)
+        self._sizes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._sweeper: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def touch(self, user: str) -> None:
+        """Mark the folder of a user as used now, if it exists."""
+        try:
+            os.utime(os.path.join(self.data_dir, user))
+        except FileNotFoundError:
+            pass
+
+    def record_change(self, user: str) -> None:
+        """Measure the folder of a user again after it was changed.
+
+        The folder is marked as used, and least recently used folders
+        are evicted if the quotas are exceeded, except this one.
+        """
+        size = folder_size(os.path.join(self.data_dir, user))
+        with self._lock:
+            self._sizes[user] = size
+        self.touch(user)
+        self.enforce_quota(keep=[user])
+
+    def enforce_quota(self, keep: Iterable[str] = ()) -> list[str]:
+        """Evict least recently used folders until within the quotas.
+
+        Args:
+            keep: Folders that should not be evicted.
+
+        Return:
+            The names of the evicted folders.
+        """
+        keep = set(keep)
+        with self._lock:
+            folders = self._scan()
+            total_bytes = sum(size for _, size, _ in folders)
+            count = len(folders)
+            evicted = []
+            for _, size, user in sorted(folders):
+                if total_bytes <= self.max_bytes and count <= self.max_folders:
+                    break
+                if user in keep:
+                    continue
+                self._remove(user)
+                total_bytes -= size
+                count -= 1
+                evicted.append(user)
+
+        if evicted:
+            logger.info(
+                f"Evicted {len(evicted)} user folders to stay within quota,"
+                f" {count} folders with {total_bytes} bytes left"
+            )
+        self._notify(evicted)
+
+        return evicted
+
+    def sweep(self, now: float | None = None) -> list[str]:
+        """Evict expired folders, then enforce the quotas.
+
+        Args:
+            now: Current time as a Unix timestamp, time.time() by
+            default.
+
+        Return:
+            The names of the evicted folders.
+        """
+        deadline = (time.time() if now is None else now) - self.ttl_seconds
+        with self._lock:
+            expired = [
+                user for last_used, _, user in self._scan() if last_used < deadline
+            ]
+            for user in expired:
+                self._remove(user)
+
+        if expired:
+            logger.info(f"Evicted {len(expired)} expired user folders")
+        self._notify(expired)
+
+        return expired + self.enforce_quota()
+
+    def start_sweeper(self, interval: float) -> None:
+        """Sweep in a background thread every interval seconds."""
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_periodically,
+                args=(interval,),
+                name="user-storage-sweeper",
+                daemon=True,
+            )
+            self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """Stop the background sweeper, if it is running."""
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+
+    def _sweep_periodically(self, interval: float) -> None:
+        """Sweep until stopped, logging rather than raising errors."""
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception(f"Sweeping user folders in {self.data_dir} failed")
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        """List the last use, size and name of every user folder.
+
+        Must be called with the lock held. Folders that are not known
+        yet are measured, and forgotten folders are dropped.
+        """
+        folders = []
+        try:
+            entries = list(os.scandir(self.data_dir))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name in self.exclude:
+                continue
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                last_used = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            size = self._sizes.get(entry.name)
+            if size is None:
+                size = self._sizes[entry.name] = folder_size(entry.path)
+            folders.append((last_used, size, entry.name))
+
+        present = {user for _, _, user in folders}
+        for user in list(self._sizes):
+            if user not in present:
+                del self._sizes[user]
+
+        return folders
+
+    def _remove(self, user: str) -> None:
+        """Remove the folder of a user, with the lock held."""
+        shutil.rmtree(os.path.join(self.data_dir, user), ignore_errors=True)
+        self._sizes.pop(user, None)
+
+    def _notify(self, evicted: list[str]) -> None:
+        """Call 'on_evict' for every evicted folder."""
+        if self.on_evict is None:
+            return
+        for user in evicted:
+            try:
+                self.on_evict(user)
+            except Exception:
+                logger.exception(f"Cleaning up after evicting {user} failed")
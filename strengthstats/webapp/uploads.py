@@ -0,0 +1,163 @@
+"""Validation and storage of uploaded exports.
+
+Uploads are checked while they are being read, before anything is
+kept: the export may be gzip or zip compressed, only the first few KB
+are read to check that it looks like a StrengthLog export, and the
+decompressed size is capped so that a small compressed upload can't
+fill the disk. A rejected upload never replaces a previously saved
+export.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import zipfile
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import IO, cast
+
+from strengthstats.analysis.constants import DIVIDING_LINE
+from strengthstats.analysis.exceptions import NotAnExportError
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGIC = b"PK\x03\x04"
+# The divider follows a short header with the name and email of the user
+SNIFF_BYTES = 8 * 1024
+CHUNK_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """Base class for uploads that can't be accepted."""
+
+
+class UploadTooLargeError(UploadError):
+    """Raised when an upload is too large once decompressed."""
+
+
+class UnsupportedUploadError(UploadError):
+    """Raised when an upload is an archive that can't be read."""
+
+
+def save_upload(stream: IO[bytes], dst_path: str, max_bytes: int) -> str:
+    """Check an uploaded export and save it, decompressed, to dst_path.
+
+    Args:
+        stream: Seekable binary stream of the uploaded file, as plain
+        CSV, gzip, or a zip archive with a single CSV file.
+        dst_path: Path to save the decompressed CSV to. It is only
+        replaced once the whole upload has been accepted.
+        max_bytes: Largest accepted size of the decompressed CSV.
+
+    Return:
+        SHA-256 hex digest of the saved CSV, the same as 'hash_export'
+        gives, computed while saving so the file isn't read again.
+
+    Raises:
+        UploadTooLargeError: If the CSV is larger than max_bytes.
+        UnsupportedUploadError: If the upload is an unexpected archive.
+        NotAnExportError: If the CSV is not a StrengthLog export.
+    """
+    with open_upload(stream, max_bytes) as export:
+        head = export.read(SNIFF_BYTES)
+        sniff_export(head)
+
+        dst_dir = os.path.dirname(os.path.abspath(dst_path))
+        with tempfile.NamedTemporaryFile(dir=dst_dir, delete=False) as tmp:
+            try:
+                size = 0
+                digest = hashlib.sha256()
+                chunk = head
+                while chunk:
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLargeError(
+                            f"The export is larger than {max_bytes} bytes"
+                        )
+                    tmp.write(chunk)
+                    digest.update(chunk)
+                    chunk = export.read(CHUNK_BYTES)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+
+    os.replace(tmp.name, dst_path)
+    logger.info(f"Saved {size} byte export to {dst_path}")
+
+    return digest.hexdigest()
+
+
+@contextmanager
+def open_upload(stream: IO[bytes], max_bytes: int) -> Iterator[IO[bytes]]:
+    """Open an upload for reading, decompressing it if needed.
+
+    The compression is detected from the first bytes of the upload,
+    not from its file name.
+
+    Raises:
+        UploadTooLargeError: If a zip archive declares a CSV file
+        larger than max_bytes.
+        UnsupportedUploadError: If the upload is a corrupt archive, or a
+        zip archive without exactly one CSV file.
+    """
+    magic = stream.read(len(ZIP_MAGIC))
+    stream.seek(0)
+
+    if magic.startswith(GZIP_MAGIC):
+        with gzip.GzipFile(fileobj=stream, mode="rb") as export:
+            try:
+                yield cast(IO[bytes], export)
+            except (gzip.BadGzipFile, EOFError, zlib.error) as e:
+                raise UnsupportedUploadError(f"Corrupt gzip file: {e}") from e
+    elif magic == ZIP_MAGIC:
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                member = _single_csv_member(archive)
+                if member.file_size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"The export is larger than {max_bytes} bytes"
+                    )
+                with archive.open(member) as export:
+                    yield export
+        except (zipfile.BadZipFile, zlib.error) as e:
+            raise UnsupportedUploadError(f"Corrupt zip file: {e}") from e
+    else:
+        yield stream
+
+
+def sniff_export(head: bytes) -> None:
+    """Check that the start of a file looks like a StrengthLog export.
+
+    Raises:
+        NotAnExportError: If the dividing line between the header and
+        the workouts is not among the first lines.
+    """
+    if b"\x00" in head:
+        raise NotAnExportError("The file is not a CSV file")
+
+    # The head may end in the middle of a character or a line
+    text = head.decode("utf-8-sig", errors="ignore")
+    if DIVIDING_LINE not in text.splitlines():
+        raise NotAnExportError(
+            "The CSV file does not appear to be a StrengthLog app export file"
+        )
+
+
+def _single_csv_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Return the only CSV file in a zip archive."""
+    members = [
+        member
+        for member in archive.infolist()
+        if not member.is_dir() and member.filename.lower().endswith(".csv")
+    ]
+    if len(members) != 1:
+        raise UnsupportedUploadError(
+            f"Expected one CSV file in the zip archive, found {len(members)}"
+        )
+
+    return members[0]
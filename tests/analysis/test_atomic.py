@@ -0,0 +1,62 @@
+"""Tests for atomic.py."""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from strengthstats.analysis.atomic import (
+    make_temp_dir,
+    replace_directory,
+    replacing_file,
+)
+
+
+def write_directory(directory, content):
+    """Write a directory with one file, replacing it atomically."""
+    tmp_dir = make_temp_dir(directory)
+    with open(os.path.join(tmp_dir, "data.txt"), "w") as f:
+        f.write(content)
+    return replace_directory(tmp_dir, directory)
+
+
+def test_replace_directory_concurrently():
+    """Test that writers racing for a directory don't fail."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        directory = os.path.join(tempdir, "columns")
+        assert write_directory(directory, "old")
+        assert write_directory(directory, "new")
+        with open(os.path.join(directory, "data.txt")) as f:
+            assert f.read() == "new"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(lambda _: write_directory(directory, "same"), range(200))
+            )
+        assert any(results)
+        with open(os.path.join(directory, "data.txt")) as f:
+            assert f.read() == "same"
+        # Temporary directories of writers that lost are dropped
+        assert os.listdir(tempdir) == ["columns"]
+
+
+def test_replacing_file():
+    """Test that a file is only replaced once it is fully written."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "plot.png")
+        with replacing_file(path) as tmp_path:
+            assert os.path.dirname(tmp_path) == tempdir
+            assert tmp_path.endswith(".png")
+            with open(tmp_path, "w") as f:
+                f.write("old")
+
+        with pytest.raises(ValueError):
+            with replacing_file(path) as tmp_path:
+                with open(tmp_path, "w") as f:
+                    f.write("partial")
+                raise ValueError("Rendering failed")
+
+        with open(path) as f:
+            assert f.read() == "old"
+        assert os.listdir(tempdir) == ["plot.png"]
@@ -0,0 +1,74 @@
+"""Tests for cache.py."""
+
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from strengthstats.analysis.cache import ExportCache, hash_export
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.preprocessor import get_all_exercises_dfs, preprocess_data
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def test_hash_export():
+    """Test that identical content gives identical digests."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        copy_path = os.path.join(tempdir, "copy.csv")
+        shutil.copy(TEST_DATA, copy_path)
+        assert hash_export(copy_path) == hash_export(TEST_DATA)
+
+        with open(copy_path, "a") as f:
+            f.write("\n")
+        assert hash_export(copy_path) != hash_export(TEST_DATA)
+
+
+def test_export_cache_roundtrip():
+    """Test that cached DataFrames are loaded back unchanged."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    digest = hash_export(TEST_DATA)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache = ExportCache(tempdir, max_bytes=10 * 1024 * 1024)
+        assert cache.get(digest) is None
+
+        cache.put(digest, sets_df, workouts_df, exercise_dfs)
+        cached = cache.get(digest)
+
+        assert cached is not None
+        cached_sets_df, cached_workouts_df, cached_exercise_dfs = cached
+        pd.testing.assert_frame_equal(cached_sets_df, sets_df)
+        pd.testing.assert_frame_equal(cached_workouts_df, workouts_df)
+        assert list(cached_exercise_dfs.keys()) == list(ET)
+        for exercise_type in ET:
+            pd.testing.assert_frame_equal(
+                cached_exercise_dfs[exercise_type], exercise_dfs[exercise_type]
+            )
+
+
+def test_export_cache_evicts_least_recently_used():
+    """Test that the oldest entries are evicted when over the limit."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache = ExportCache(tempdir, max_bytes=10 * 1024 * 1024)
+        cache.put("first", sets_df, workouts_df, exercise_dfs)
+        cache.put("second", sets_df, workouts_df, exercise_dfs)
+        entry_size = sum(
+            entry.stat().st_size for entry in os.scandir(cache._entry_dir("first"))
+        )
+
+        # Make "first" the most recently used entry
+        os.utime(cache._entry_dir("second"), (0, 0))
+        assert cache.get("first") is not None
+
+        cache.max_bytes = entry_size * 2
+        cache.put("third", sets_df, workouts_df, exercise_dfs)
+
+        assert cache.get("first") is not None
+        assert cache.get("second") is None
+        assert cache.get("third") is not None
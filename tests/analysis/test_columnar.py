@@ -0,0 +1,113 @@
+"""Tests for columnar.py."""
+
+import os
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from strengthstats.analysis.cache import load_frames, save_frames
+from strengthstats.analysis.columnar import (
+    open_frames,
+    read_columns,
+    read_digest,
+    write_columns,
+    write_frames,
+)
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.preprocessor import get_all_exercises_dfs, preprocess_data
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def is_memory_mapped(array):
+    """Check if an array is a view of a memory-mapped file."""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_open_frames_roundtrip():
+    """Test that written DataFrames are memory-mapped back unchanged."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        columns_dir = os.path.join(tempdir, "columns")
+        assert open_frames(columns_dir) is None
+
+        write_frames(columns_dir, "digest-1", sets_df, workouts_df, exercise_dfs)
+        assert read_digest(columns_dir) == "digest-1"
+        assert open_frames(columns_dir, "digest-2") is None
+
+        opened = open_frames(columns_dir, "digest-1")
+        assert opened is not None
+        opened_sets_df, opened_workouts_df, opened_exercise_dfs = opened
+        pd.testing.assert_frame_equal(opened_sets_df, sets_df)
+        pd.testing.assert_frame_equal(opened_workouts_df, workouts_df)
+        for exercise_type in ET:
+            pd.testing.assert_frame_equal(
+                opened_exercise_dfs[exercise_type], exercise_dfs[exercise_type]
+            )
+
+        # Columns are not copied into memory
+        assert is_memory_mapped(opened_sets_df["weight"].to_numpy())
+        assert is_memory_mapped(opened_sets_df["Exercise"].cat.codes.to_numpy())
+        assert is_memory_mapped(opened_sets_df["Date"].to_numpy())
+
+        # Writing the export again replaces it
+        write_frames(
+            columns_dir, "digest-2", sets_df.iloc[:3], workouts_df, exercise_dfs
+        )
+        opened = open_frames(columns_dir, "digest-2")
+        assert opened is not None
+        assert len(opened[0]) == 3
+
+
+def test_write_frames_from_pickles_without_warnings():
+    """Test that unpickled frames are written without NumPy warnings.
+
+    Unpickled datetime arrays have (empty) metadata on their dtype,
+    which 'np.save' warns about.
+    """
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        save_frames(tempdir, sets_df, workouts_df, exercise_dfs)
+        frames = load_frames(tempdir)
+        assert frames[0]["Date"].to_numpy().dtype.metadata is not None
+
+        columns_dir = os.path.join(tempdir, "columns")
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            write_frames(columns_dir, "digest-1", *frames)
+
+        opened = open_frames(columns_dir, "digest-1")
+        assert opened is not None
+        pd.testing.assert_frame_equal(opened[0], sets_df)
+
+
+def test_read_columns_copy_on_write():
+    """Test that changing an opened DataFrame leaves the files as is."""
+    df = pd.DataFrame(
+        {
+            "value": [1.5, np.nan, 3.0],
+            "count": pd.array([1, None, 3], dtype="Int32"),
+            "name": pd.array(["a", None, "a"], dtype="string"),
+        },
+        index=[5, 7, 9],
+    )
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        columns_dir = os.path.join(tempdir, "frame")
+        write_columns(columns_dir, df)
+
+        opened_df = read_columns(columns_dir)
+        pd.testing.assert_frame_equal(opened_df, df)
+        opened_df.loc[5, "value"] = 100.0
+
+        pd.testing.assert_frame_equal(read_columns(columns_dir), df)
@@ -0,0 +1,48 @@
+"""Tests for downsample.py."""
+
+import numpy as np
+import pytest
+
+from strengthstats.analysis.downsample import downsample_indices, lttb_indices
+
+
+def test_lttb_indices_keeps_shape():
+    """Test that LTTB keeps the ends and the extremes of a series."""
+    x = np.arange(1000, dtype="float64")
+    y = np.sin(x / 50)
+    y[500] = 10
+
+    indices = lttb_indices(x, y, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0
+    assert indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+    assert 500 in indices
+    # Peaks and dips of the sine are kept within a bucket's width
+    for extreme in (np.argmax(y[600:]) + 600, np.argmin(y)):
+        assert np.min(np.abs(indices - extreme)) <= 10
+
+
+def test_lttb_indices_with_dates():
+    """Test that dates can be downsampled like numbers."""
+    dates = np.arange("2020-01-01", "2024-01-01", dtype="datetime64[D]")
+    values = np.arange(len(dates), dtype="float64") % 7
+
+    indices = lttb_indices(dates.astype("datetime64[ns]"), values, 50)
+
+    assert len(indices) == 50
+    with pytest.raises(ValueError):
+        lttb_indices(dates, values, 2)
+
+
+def test_downsample_indices_threshold():
+    """Test that series within the threshold are left untouched."""
+    x = np.arange(100, dtype="float64")
+
+    np.testing.assert_array_equal(downsample_indices(x, x, 100), np.arange(100))
+    np.testing.assert_array_equal(
+        downsample_indices(x, x, 10, threshold=200), np.arange(100)
+    )
+    assert len(downsample_indices(x, x, 10)) == 10
+    assert len(downsample_indices(x, x, 10, threshold=50)) == 10
@@ -0,0 +1,173 @@
+"""Tests for incremental.py."""
+
+import os
+import tempfile
+
+import pandas as pd
+
+from strengthstats.analysis import incremental
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.incremental import (
+    ingest_export,
+    load_records,
+    load_rollups,
+)
+from strengthstats.analysis.preprocessor import (
+    DIVIDING_LINE,
+    get_all_exercises_dfs,
+    preprocess_data,
+)
+from strengthstats.analysis.records import compute_records
+from strengthstats.analysis.rollups import Period, compute_rollups
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def write_export(path, workouts):
+    """Write an export with only the given workouts of the test data."""
+    with open(TEST_DATA) as f:
+        header, body = f.read().split(DIVIDING_LINE)
+    raw_workouts = body.strip().split("\n\n")
+    with open(path, "w") as f:
+        f.write(header + DIVIDING_LINE + "\n")
+        f.write("\n\n".join(workouts(raw_workouts)) + "\n")
+
+
+def assert_frames_equal(actual, expected):
+    """Assert that two tuples of ingested DataFrames are equal."""
+    actual_sets_df, actual_workouts_df, actual_exercise_dfs = actual
+    expected_sets_df, expected_workouts_df, expected_exercise_dfs = expected
+    pd.testing.assert_frame_equal(actual_sets_df, expected_sets_df)
+    pd.testing.assert_frame_equal(actual_workouts_df, expected_workouts_df)
+    for exercise_type in ET:
+        pd.testing.assert_frame_equal(
+            actual_exercise_dfs[exercise_type],
+            expected_exercise_dfs[exercise_type],
+        )
+
+
+def full_parse(path, workouts):
+    """Parse the given workouts from scratch, oldest first."""
+    write_export(path, lambda raw_workouts: workouts(raw_workouts)[::-1])
+    sets_df, workouts_df = preprocess_data(path)
+    return sets_df, workouts_df, get_all_exercises_dfs(sets_df)
+
+
+def test_ingest_export_appends_prepended_workouts():
+    """Test that new workouts at the start of an export are appended."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        export_path = os.path.join(tempdir, "export.csv")
+        expected_path = os.path.join(tempdir, "expected.csv")
+        state_dir = os.path.join(tempdir, "ingest")
+
+        write_export(export_path, lambda workouts: workouts[2:])
+        first = ingest_export(export_path, state_dir)
+        assert_frames_equal(first, full_parse(expected_path, lambda w: w[2:]))
+
+        write_export(export_path, lambda workouts: workouts)
+        second = ingest_export(export_path, state_dir)
+        assert_frames_equal(second, full_parse(expected_path, lambda w: w))
+
+        # Indices count from the oldest workout, so they are kept
+        assert list(second[1].index) == [0, 1, 2, 3]
+        assert second[1].at[1, "Name"] == first[1].at[1, "Name"]
+        assert second[1]["Date"].is_monotonic_increasing
+
+        rollups = load_rollups(state_dir)
+        assert rollups is not None
+        for period in Period:
+            pd.testing.assert_frame_equal(
+                rollups[period], compute_rollups(second[2], period)
+            )
+
+        # Records are extended with the new sets instead of recomputed
+        records_df = load_records(state_dir)
+        assert records_df is not None
+        pd.testing.assert_frame_equal(
+            records_df, compute_records(second[0]), check_categorical=False
+        )
+
+
+def test_ingest_export_only_reads_new_blocks_again(monkeypatch):
+    """Test that only the blocks of new workouts are read twice."""
+    read_offsets = []
+
+    def read_workout_blocks(export, offsets):
+        read_offsets.append(list(offsets))
+        return original(export, read_offsets[-1])
+
+    original = incremental.read_workout_blocks
+    monkeypatch.setattr(incremental, "read_workout_blocks", read_workout_blocks)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        export_path = os.path.join(tempdir, "export.csv")
+        state_dir = os.path.join(tempdir, "ingest")
+
+        write_export(export_path, lambda workouts: workouts[1:])
+        ingest_export(export_path, state_dir)
+        write_export(export_path, lambda workouts: workouts)
+        ingest_export(export_path, state_dir)
+
+    # All workouts oldest first, and then only the new one
+    assert len(read_offsets) == 2
+    assert len(read_offsets[0]) == 3
+    assert read_offsets[0] == sorted(read_offsets[0], reverse=True)
+    assert len(read_offsets[1]) == 1
+
+
+def test_ingest_export_numbers_workouts_oldest_first():
+    """Test that workout indices are reversed compared to a full parse.
+
+    'preprocess_data' numbers workouts in file order, newest first,
+    while ingestion numbers them oldest first, so that the indices of
+    earlier workouts don't change when new ones are added.
+    """
+    with tempfile.TemporaryDirectory() as tempdir:
+        sets_df, workouts_df, _ = ingest_export(
+            TEST_DATA, os.path.join(tempdir, "ingest")
+        )
+    parsed_sets_df, parsed_workouts_df = preprocess_data(TEST_DATA)
+
+    last = len(workouts_df) - 1
+    pd.testing.assert_frame_equal(
+        workouts_df, parsed_workouts_df.iloc[::-1].rename(index=lambda i: last - i)
+    )
+    for workout_index, workout in workouts_df.iterrows():
+        exercises = sets_df.loc[sets_df["workout_index"] == workout_index, "Exercise"]
+        parsed_exercises = parsed_sets_df.loc[
+            parsed_sets_df["workout_index"] == last - workout_index, "Exercise"
+        ]
+        assert exercises.tolist() == parsed_exercises.tolist()
+        assert (sets_df.loc[exercises.index, "Date"] == workout["Date"]).all()
+
+
+def test_ingest_export_reuses_unchanged_export():
+    """Test that ingesting the same export again parses nothing."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        export_path = os.path.join(tempdir, "export.csv")
+        state_dir = os.path.join(tempdir, "ingest")
+
+        write_export(export_path, lambda workouts: workouts)
+        first = ingest_export(export_path, state_dir)
+        second = ingest_export(export_path, state_dir)
+        assert_frames_equal(second, first)
+
+
+def test_ingest_export_rebuilds_after_edits():
+    """Test that editing an old workout falls back to a full rebuild."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        export_path = os.path.join(tempdir, "export.csv")
+        state_dir = os.path.join(tempdir, "ingest")
+
+        write_export(export_path, lambda workouts: workouts[:3])
+        ingest_export(export_path, state_dir)
+
+        def edited(workouts):
+            return [workouts[0].replace("reps,10", "reps,11"), *workouts[1:]]
+
+        write_export(export_path, edited)
+        ingested = ingest_export(export_path, state_dir)
+
+        expected = full_parse(os.path.join(tempdir, "expected.csv"), edited)
+        assert_frames_equal(ingested, expected)
+        assert (ingested[0]["reps"] == 11).any()
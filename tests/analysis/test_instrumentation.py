@@ -0,0 +1,110 @@
+"""Tests for instrumentation.py."""
+
+import threading
+
+import numpy as np
+import pytest
+
+from strengthstats.analysis import instrumentation
+from strengthstats.analysis.instrumentation import (
+    collect_stages,
+    configure,
+    instrument,
+    render_prometheus,
+    track,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    """Start every test without metrics, and restore the settings."""
+    instrumentation.reset()
+    yield
+    configure()
+    instrumentation.reset()
+
+
+@instrument(rows=len)
+def make_rows(n):
+    """Return a list with n rows."""
+    return list(range(n))
+
+
+def test_instrument_records_stages():
+    """Test that durations and rows of calls end up in the metrics."""
+    with collect_stages() as records:
+        make_rows(3)
+        with track("outer") as record:
+            make_rows(4)
+            record.rows = 1
+
+    assert [record.stage for record in records] == ["make_rows", "make_rows", "outer"]
+    assert records[2].seconds >= records[1].seconds
+
+    metrics = render_prometheus()
+    assert "# TYPE strengthstats_stage_duration_seconds histogram" in metrics
+    assert (
+        'strengthstats_stage_duration_seconds_bucket{stage="make_rows",le="+Inf"} 2'
+        in metrics
+    )
+    assert 'strengthstats_stage_duration_seconds_count{stage="outer"} 1' in metrics
+    assert 'strengthstats_stage_rows_total{stage="make_rows"} 7' in metrics
+    assert 'strengthstats_stage_rows_total{stage="outer"} 1' in metrics
+
+
+def test_instrument_disabled():
+    """Test that nothing is recorded when disabled."""
+    configure(enabled=False)
+    with collect_stages() as records:
+        assert make_rows(3) == [0, 1, 2]
+
+    assert records == []
+    assert "make_rows" not in render_prometheus()
+
+
+def test_track_memory_peaks():
+    """Test that peaks of nested stages are attributed to both."""
+    configure(trace_memory=True)
+    with collect_stages() as records:
+        with track("outer"):
+            big = np.ones(4 * 1024 * 1024, dtype="uint8")
+            del big
+            with track("inner"):
+                small = np.ones(1024 * 1024, dtype="uint8")
+                del small
+
+    inner, outer = records
+    assert 1024 * 1024 <= inner.peak_bytes < 2 * 1024 * 1024
+    assert outer.peak_bytes >= 4 * 1024 * 1024
+    assert 'strengthstats_stage_peak_bytes{stage="outer"}' in render_prometheus()
+
+
+def test_track_memory_peaks_of_threads():
+    """Test that stages overlapping in two threads keep their peaks."""
+    configure(trace_memory=True)
+    records = {}
+    main_allocated = threading.Event()
+    other_started = threading.Event()
+    main_done = threading.Event()
+
+    def run_other_stage():
+        main_allocated.wait(10)
+        with track("other") as record:
+            other_started.set()
+            main_done.wait(10)
+        records["other"] = record
+
+    thread = threading.Thread(target=run_other_stage)
+    thread.start()
+    # The other stage starts while this one runs, and ends after it
+    with track("main") as record:
+        big = np.ones(4 * 1024 * 1024, dtype="uint8")
+        del big
+        main_allocated.set()
+        other_started.wait(10)
+    main_done.set()
+    thread.join()
+    records["main"] = record
+
+    assert records["main"].peak_bytes >= 4 * 1024 * 1024
+    assert records["other"].peak_bytes < 1024 * 1024
@@ -0,0 +1,25 @@
+"""Tests for the names of the files of rendered plots."""
+
+import os
+
+from strengthstats.analysis.plotfiles import (
+    fingerprint_path,
+    plot_file_stem,
+    plot_path,
+    read_fingerprint,
+)
+
+
+def test_plot_file_stem():
+    """Test that unsafe characters in exercise names are encoded."""
+    assert plot_file_stem("Bench Press (Barbell)") == "Bench Press (Barbell)"
+    assert plot_file_stem("Curl 50/50") == "Curl 50%2F50"
+    assert plot_file_stem("100% Squat?") == "100%25 Squat%3F"
+    assert plot_file_stem("../store") == "%2E.%2Fstore"
+    assert plot_file_stem("Søren's \\ press") == "Søren's %5C press"
+
+    assert plot_path("plots", "Curl 50/50") == os.path.join("plots", "Curl 50%2F50.png")
+    assert fingerprint_path("plots", "Squat") == os.path.join(
+        "plots", "Squat.fingerprint"
+    )
+    assert read_fingerprint("plots-that-dont-exist", "Squat") is None
@@ -1,18 +1,28 @@
 """Tests for preprocessing.py."""
 
 from datetime import datetime
+from io import BytesIO, StringIO
 
 import numpy as np
 import pandas as pd
+import pytest
 
 from strengthstats.analysis.constants import ET
+from strengthstats.analysis.exceptions import NotAnExportError, NoWorkoutsError
 from strengthstats.analysis.preprocessor import (
+    DIVIDING_LINE,
+    SetColumns,
     add_anyweight_column,
     divide_up_csv_lines,
     get_all_exercises_dfs,
+    index_workout_blocks,
+    iter_workout_blocks,
+    parse_durations,
     preprocess_data,
+    preprocess_export,
     preprocess_sets,
     preprocess_workouts,
+    read_workout_blocks,
     separate_sets_by_exercise_type,
 )
 
@@ -132,6 +142,11 @@ def test_preprocess_data():
     # Spot check
     assert sets.at[5, "Exercise"] == "Back Extension"
     assert sets.at[5, "Set"] == 1
+    assert sets["Exercise"].dtype == "category"
+    assert sets["workout_index"].dtype == "int8"
+    assert sets["reps"].dtype == "int8"
+    assert sets["time"].dtype == "Int32"
+    assert sets.at[56, "time"] == 5
     assert sets.at[5, "reps"] == 15
     assert sets.at[5, "bodyweight"] == 70
     assert sets.at[5, "extraWeight"] == 10
@@ -160,6 +175,77 @@ def test_divide_up_csv_lines():
     assert actual_workouts_lines == WORKOUTS_LINES
 
 
+def test_iter_workout_blocks():
+    """Test that the export is split into one block per workout."""
+    with open(TEST_DATA, "rb") as f:
+        blocks = list(iter_workout_blocks(f))
+
+    assert len(blocks) == 4
+    assert blocks[1].workout == [
+        "Program 1: Workout 2",
+        "2024-01-08",
+        "70",
+        "1",
+        "-1",
+        "1",
+        "-1",
+    ]
+    assert len(blocks[1].sets) == 10
+    assert blocks[1].sets[0] == [
+        "Exercise, Deadlift",
+        "Set",
+        "1",
+        "reps",
+        "10",
+        "weight",
+        "100",
+    ]
+
+
+def test_read_workout_blocks_by_offset():
+    """Test that blocks are read again by offset in any order."""
+    with open(TEST_DATA, "rb") as f:
+        raw_content = f.read()
+
+    # With a byte order mark, Windows line endings and non-ASCII names
+    for content in (
+        raw_content,
+        b"\xef\xbb\xbf" + raw_content.replace(b"Squat", "Kn\u00e4b\u00f6j".encode()),
+        raw_content.replace(b"\n", b"\r\n"),
+    ):
+        export = BytesIO(content)
+        offsets, blocks = zip(*index_workout_blocks(export))
+        expected = list(iter_workout_blocks(BytesIO(content)))
+        assert list(blocks) == expected
+        assert list(read_workout_blocks(export, offsets[::-1])) == expected[::-1]
+
+
+def test_preprocess_export_rejects_other_files():
+    """Test that bad files raise exceptions instead of exiting."""
+    with pytest.raises(NotAnExportError):
+        preprocess_export(StringIO("Date,Weight\n2024-01-01,70\n"))
+
+    with open(TEST_DATA) as f:
+        header = f.read().split("\n\n")[0]
+    with pytest.raises(NoWorkoutsError):
+        preprocess_export(StringIO(f"{header}\n\nWorkouts\n{DIVIDING_LINE}\n"))
+
+
+def test_preprocess_export():
+    """Test that streamed parsing matches parsing the divided lines."""
+    sets_lines, workouts_lines = divide_up_csv_lines(TEST_DATA)
+    expected_workouts = preprocess_workouts(workouts_lines)
+    expected_sets = preprocess_sets(sets_lines, expected_workouts)
+
+    with open(TEST_DATA, "rb") as f:
+        raw_content = f.read()
+
+    for export in (BytesIO(raw_content), StringIO(raw_content.decode())):
+        sets, workouts = preprocess_export(export)
+        pd.testing.assert_frame_equal(sets, expected_sets)
+        pd.testing.assert_frame_equal(workouts, expected_workouts)
+
+
 def test_preprocess_workouts():
     """Test that DataFrame looks as expected given correct lines."""
     workouts_df = preprocess_workouts(WORKOUTS_LINES)
@@ -203,6 +289,51 @@ def test_preprocess_sets():
     assert pd.isna(sets_df.at[5, "height"])
 
 
+def test_parse_durations():
+    """Test that durations are converted to seconds."""
+    durations = np.array(["00:01:00", None, "01:02:03"], dtype=object)
+    seconds = parse_durations(durations)
+
+    assert seconds.dtype == "Int32"
+    assert seconds[0] == 60
+    assert pd.isna(seconds[1])
+    assert seconds[2] == 3723
+
+    # Durations not padded to two digits per part
+    seconds = parse_durations(np.array(["1:02:03", "10:00"], dtype=object))
+    assert list(seconds) == [3723, 600]
+
+
+def test_set_columns():
+    """Test that set rows are collected column by column."""
+    workouts_df = pd.DataFrame({"Date": [datetime(2024, 1, 1), datetime(2024, 1, 2)]})
+    set_columns = SetColumns(capacity=1)
+    set_columns.append(0, ["Exercise, Squat", "Set", "1", "reps", "5", "weight", "60"])
+    set_columns.append(0, ["Exercise, Plank", "Set", "1", "time", "00:01:00"])
+    set_columns.append(1, ["Exercise, Row", "Set", "1", "reps", "8", "tempo", "3010"])
+
+    sets_df = set_columns.to_dataframe(workouts_df)
+
+    assert len(set_columns) == 3
+    assert list(sets_df.columns) == [
+        "workout_index",
+        "Exercise",
+        "Set",
+        "reps",
+        "weight",
+        "time",
+        "tempo",
+        "Date",
+    ]
+    assert list(sets_df.index) == [0, 2]
+    assert list(sets_df["Exercise"]) == ["Squat", "Row"]
+    assert sets_df.at[0, "weight"] == 60
+    assert pd.isna(sets_df.at[2, "weight"])
+    assert pd.isna(sets_df.at[0, "tempo"])
+    assert sets_df.at[2, "tempo"] == "3010"
+    assert sets_df.at[2, "Date"] == datetime(2024, 1, 2)
+
+
 def test_separate_sets_by_exercise_type():
     """Test exercises are correctly split into the right categories."""
     sec30 = pd.Timedelta(seconds=30)
@@ -260,7 +391,7 @@ def test_separate_sets_by_exercise_type():
 
 def test_generate_exercises_dataframe():
     """Test that expected columns exist and have expected values."""
-    sec30 = pd.Timedelta(seconds=30)
+    sec30 = 30
     day1 = datetime(year=2024, month=1, day=1)
     day2 = datetime(year=2024, month=1, day=2)
     sets_df = pd.DataFrame(
@@ -301,6 +432,10 @@ def test_generate_exercises_dataframe():
     exercise_dfs = get_all_exercises_dfs(sets_df)
 
     assert list(exercise_dfs[ET.WREPS].columns) == EXPECTED_EXERCISE_COLUMNS
+    for exercise_df in exercise_dfs.values():
+        pd.testing.assert_index_equal(
+            exercise_df.index, pd.RangeIndex(len(exercise_df))
+        )
 
     # Spot check one row in weight-reps DataFrame
     assert exercise_dfs[ET.WREPS].at[3, "Date"] == datetime(year=2024, month=1, day=2)
@@ -324,7 +459,7 @@ def test_generate_exercises_dataframe():
     assert exercise_dfs[ET.TIME].at[0, "sets"] == 1
     assert exercise_dfs[ET.TIME].at[0, "total_reps"] == 0
     assert pd.isnull(exercise_dfs[ET.TIME].at[0, "max_weight"])
-    assert exercise_dfs[ET.TIME].at[0, "total_volume"] == pd.Timedelta(seconds=30)
+    assert exercise_dfs[ET.TIME].at[0, "total_volume"] == 30
 
     # Check weight-time DataFrame"
     assert exercise_dfs[ET.WTIME].at[0, "Date"] == datetime(year=2024, month=1, day=1)
@@ -332,7 +467,66 @@ def test_generate_exercises_dataframe():
     assert exercise_dfs[ET.WTIME].at[0, "sets"] == 2
     assert exercise_dfs[ET.WTIME].at[0, "total_reps"] == 0
     assert exercise_dfs[ET.WTIME].at[0, "max_weight"] == 10
-    assert exercise_dfs[ET.WTIME].at[0, "total_volume"] == pd.Timedelta(minutes=10)
+    assert exercise_dfs[ET.WTIME].at[0, "total_volume"] == 600
+
+
+def get_all_exercises_dfs_per_type(sets_df):
+    """Aggregate each exercise type on its own, like before one groupby.
+
+    Exercise names are grouped as strings, so that exercises within a
+    workout are ordered by name.
+    """
+    sets_df = sets_df.astype({"Exercise": "string"})
+    split_sets_dfs = separate_sets_by_exercise_type(sets_df)
+    for exercise_type, type_sets_df in split_sets_dfs.items():
+        if exercise_type in (ET.WREPS, ET.WTIME):
+            add_anyweight_column(type_sets_df)
+        else:
+            type_sets_df["anyWeight"] = np.nan
+        amount = type_sets_df["time"].astype("float64")
+        if exercise_type in (ET.REPS, ET.WREPS):
+            amount = type_sets_df["reps"].astype("float64")
+        if exercise_type in (ET.WREPS, ET.WTIME):
+            amount = amount * type_sets_df["anyWeight"]
+        type_sets_df["volume"] = np.nan if exercise_type == ET.OTHER else amount
+
+    return {
+        exercise_type: type_sets_df.groupby(["Date", "workout_index", "Exercise"])
+        .agg(
+            sets=pd.NamedAgg(column="Set", aggfunc="max"),
+            total_reps=pd.NamedAgg(column="reps", aggfunc="sum"),
+            max_weight=pd.NamedAgg(column="anyWeight", aggfunc="max"),
+            total_volume=pd.NamedAgg(column="volume", aggfunc="sum"),
+        )
+        .reset_index()
+        for exercise_type, type_sets_df in split_sets_dfs.items()
+    }
+
+
+def test_get_all_exercises_dfs_matches_per_type_aggregation():
+    """Test that one groupby gives the rows of the per-type groupbys.
+
+    Exercise names are categorical, with categories in the order they
+    are first seen, but rows must still be ordered by name.
+    """
+    sets_df, _ = preprocess_data(TEST_DATA)
+    assert not sets_df["Exercise"].cat.categories.is_monotonic_increasing
+
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    expected_dfs = get_all_exercises_dfs_per_type(sets_df)
+    for exercise_type in ET:
+        exercise_df = exercise_dfs[exercise_type]
+        pd.testing.assert_frame_equal(
+            exercise_df.astype({"Exercise": "string"}),
+            expected_dfs[exercise_type],
+            check_dtype=False,
+            check_index_type=False,
+        )
+        # The categories of the sets DataFrame are kept
+        pd.testing.assert_index_equal(
+            exercise_df["Exercise"].cat.categories,
+            sets_df["Exercise"].cat.categories,
+        )
 
 
 def test_add_anyweight_column():
@@ -0,0 +1,95 @@
+"""Tests for records.py."""
+
+import numpy as np
+import pandas as pd
+
+from strengthstats.analysis.preprocessor import preprocess_data
+from strengthstats.analysis.records import (
+    Formula,
+    compute_records,
+    estimate_one_rep_max,
+    extend_records,
+    personal_records,
+)
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def test_estimate_one_rep_max():
+    """Test the Epley and Brzycki formulas."""
+    weight = np.array([100, 100, 100, 100])
+    reps = np.array([1, 10, 37, np.nan])
+
+    np.testing.assert_allclose(
+        estimate_one_rep_max(weight, reps, Formula.EPLEY),
+        [100, 100 * (1 + 10 / 30), 100 * (1 + 37 / 30), np.nan],
+    )
+    np.testing.assert_allclose(
+        estimate_one_rep_max(weight, reps, Formula.BRZYCKI),
+        [100, 100 * 36 / 27, np.nan, np.nan],
+    )
+
+
+def test_compute_records():
+    """Test that running PRs are found per exercise."""
+    sets_df, _ = preprocess_data(TEST_DATA)
+    records_df = compute_records(sets_df)
+
+    assert records_df["Date"].is_monotonic_increasing
+    squat = records_df[records_df["Exercise"] == "Squat"]
+    assert squat["e1rm"].round(2).tolist() == [
+        133.33,
+        123.33,
+        123.33,
+        133.33,
+        123.33,
+        135.67,
+        146.67,
+        123.33,
+        135.67,
+    ]
+    assert squat["best_e1rm"].round(2).tolist() == [
+        133.33,
+        133.33,
+        133.33,
+        133.33,
+        133.33,
+        135.67,
+        146.67,
+        146.67,
+        146.67,
+    ]
+    # Equaling a PR is not a new PR
+    assert squat["is_pr"].tolist() == [
+        True,
+        False,
+        False,
+        False,
+        False,
+        True,
+        True,
+        False,
+        False,
+    ]
+
+    prs = personal_records(records_df)
+    assert prs.loc[prs["Exercise"] == "Deadlift", "weight"].tolist() == [100, 105]
+    # Bodyweight exercises count with their extra weight
+    assert "Push-Up" in prs["Exercise"].tolist()
+    assert "Chin-Ups" not in records_df["Exercise"].tolist()
+
+
+def test_extend_records():
+    """Test that extending records matches computing them at once."""
+    sets_df, _ = preprocess_data(TEST_DATA)
+    expected = compute_records(sets_df)
+
+    is_old = sets_df["Date"] <= "2024-01-01"
+    old_records_df = compute_records(sets_df[is_old])
+    extended = extend_records(old_records_df, sets_df[~is_old])
+    pd.testing.assert_frame_equal(extended, expected)
+
+    # Sets from before the earlier records need everything recomputed
+    new_records_df = compute_records(sets_df[~is_old])
+    extended = extend_records(new_records_df, sets_df[is_old])
+    pd.testing.assert_frame_equal(extended, expected)
@@ -0,0 +1,76 @@
+"""Tests for rollups.py."""
+
+import numpy as np
+import pandas as pd
+
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.preprocessor import get_all_exercises_dfs, preprocess_data
+from strengthstats.analysis.rollups import (
+    Period,
+    compute_rollups,
+    period_starts,
+    refresh_rollups,
+)
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def test_period_starts():
+    """Test that weeks start on Monday and months on their first day."""
+    dates = pd.to_datetime(["2024-01-01", "2024-01-07", "2024-01-08", "2024-02-29"])
+
+    np.testing.assert_array_equal(
+        period_starts(dates, Period.WEEK),
+        pd.to_datetime(["2024-01-01", "2024-01-01", "2024-01-08", "2024-02-26"]),
+    )
+    np.testing.assert_array_equal(
+        period_starts(dates, Period.MONTH),
+        pd.to_datetime(["2024-01-01", "2024-01-01", "2024-01-01", "2024-02-01"]),
+    )
+
+
+def test_compute_rollups():
+    """Test that exercises are rolled up per type and period."""
+    sets_df, _ = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    rollups_df = compute_rollups(exercise_dfs, Period.MONTH)
+    squat = rollups_df[rollups_df["Exercise"] == "Squat"]
+    assert squat.to_dict("records") == [
+        {
+            "exercise_type": ET.WREPS.value,
+            "Exercise": "Squat",
+            "period_start": pd.Timestamp("2024-01-01"),
+            "workouts": 3,
+            "sets": 9,
+            "total_reps": 72,
+            "max_weight": 110.0,
+            "total_volume": 7440.0,
+        }
+    ]
+    # Push-ups with and without extra weight are rolled up separately
+    push_ups = rollups_df[rollups_df["Exercise"] == "Push-Up"]
+    assert push_ups["exercise_type"].tolist() == [ET.REPS.value, ET.WREPS.value]
+
+    rollups_df = compute_rollups(exercise_dfs, Period.WEEK)
+    squat = rollups_df[rollups_df["Exercise"] == "Squat"]
+    assert squat["period_start"].tolist() == list(
+        pd.to_datetime(["2024-01-01", "2024-01-08", "2024-01-15"])
+    )
+
+
+def test_refresh_rollups():
+    """Test that refreshing the periods of new workouts is enough."""
+    sets_df, _ = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    old_exercise_dfs = {
+        exercise_type: exercise_df[exercise_df["Date"] < "2024-01-08"]
+        for exercise_type, exercise_df in exercise_dfs.items()
+    }
+    new_dates = pd.to_datetime(["2024-01-08", "2024-01-15"])
+
+    for period in Period:
+        rollups_df = refresh_rollups(
+            compute_rollups(old_exercise_dfs, period), exercise_dfs, new_dates, period
+        )
+        pd.testing.assert_frame_equal(rollups_df, compute_rollups(exercise_dfs, period))
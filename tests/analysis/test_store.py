@@ -0,0 +1,177 @@
+"""Tests for store.py."""
+
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.preprocessor import get_all_exercises_dfs, preprocess_data
+from strengthstats.analysis.records import compute_records
+from strengthstats.analysis.rollups import Period, compute_rollups
+from strengthstats.analysis.store import TrainingStore
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def test_training_store_roundtrip():
+    """Test that stored DataFrames are read back unchanged."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = TrainingStore(os.path.join(tempdir, "store.sqlite3"))
+        assert store.load("user-1") is None
+
+        store.save("user-1", "digest-1", sets_df, workouts_df, exercise_dfs)
+        assert store.digest("user-1") == "digest-1"
+        assert store.load("user-1", "digest-2") is None
+        assert store.load("user-2") is None
+
+        # The store is read back by a new instance, as after a restart
+        stored = TrainingStore(store.db_path).load("user-1", "digest-1")
+        assert stored is not None
+        stored_sets_df, stored_workouts_df, stored_exercise_dfs = stored
+        pd.testing.assert_frame_equal(stored_sets_df, sets_df)
+        pd.testing.assert_frame_equal(stored_workouts_df, workouts_df)
+        for exercise_type in ET:
+            pd.testing.assert_frame_equal(
+                stored_exercise_dfs[exercise_type], exercise_dfs[exercise_type]
+            )
+
+
+def test_training_store_replaces_export():
+    """Test that saving again replaces the export of that user only."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    new_sets_df = sets_df.iloc[:5].assign(newKey=1.5)
+    new_sets_df["Date"] = new_sets_df.pop("Date")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = TrainingStore(os.path.join(tempdir, "store.sqlite3"))
+        store.save("user-1", "digest-1", sets_df, workouts_df, exercise_dfs)
+        store.save("user-2", "digest-1", sets_df, workouts_df, exercise_dfs)
+        store.save("user-1", "digest-2", new_sets_df, workouts_df, exercise_dfs)
+
+        stored = store.load("user-1", "digest-2")
+        assert stored is not None
+        pd.testing.assert_frame_equal(stored[0], new_sets_df)
+        stored = store.load("user-2", "digest-1")
+        assert stored is not None
+        pd.testing.assert_frame_equal(stored[0], sets_df)
+
+        store.delete("user-1")
+        assert store.digest("user-1") is None
+        assert store.exercise_series("user-1", "Squat") is None
+        assert store.digest("user-2") == "digest-1"
+
+
+def test_training_store_unknown_keys_dont_change_schema():
+    """Test that unknown set keys are stored without new columns."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    # 'set' differs from the 'Set' column only in case
+    new_sets_df = sets_df.assign(set=3, tempo="3-1-1")
+    new_sets_df.loc[new_sets_df.index[0], "tempo"] = None
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = TrainingStore(os.path.join(tempdir, "store.sqlite3"))
+        with sqlite3.connect(store.db_path) as conn:
+            schema = conn.execute("PRAGMA table_info(sets)").fetchall()
+        store.save("user-1", "digest-1", new_sets_df, workouts_df, exercise_dfs)
+        store.save("user-2", "digest-1", sets_df, workouts_df, exercise_dfs)
+
+        with sqlite3.connect(store.db_path) as conn:
+            assert conn.execute("PRAGMA table_info(sets)").fetchall() == schema
+        stored = store.load("user-1")
+        assert stored is not None
+        pd.testing.assert_frame_equal(stored[0], new_sets_df)
+        stored = store.load("user-2")
+        assert stored is not None
+        pd.testing.assert_frame_equal(stored[0], sets_df)
+
+
+def test_training_store_exercise_series():
+    """Test that exercise series are queried through the index."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = TrainingStore(os.path.join(tempdir, "store.sqlite3"))
+        store.save("user-1", "digest-1", sets_df, workouts_df, exercise_dfs)
+
+        exercise_type, series_df = store.exercise_series(
+            "user-1", "Squat", start=datetime(2024, 1, 2)
+        )
+        assert exercise_type == ET.WREPS
+        assert series_df["Date"].tolist() == [
+            pd.Timestamp("2024-01-08"),
+            pd.Timestamp("2024-01-15"),
+        ]
+        assert series_df["total_volume"].tolist() == [2470.0, 2570.0]
+
+        exercise_type, series_df = store.exercise_series("user-1", "Push-Up")
+        assert exercise_type == ET.REPS
+        assert series_df["max_weight"].isna().all()
+
+        assert store.exercise_series("user-1", "Snatch") is None
+        assert store.exercise_series("user-2", "Squat") is None
+
+        with sqlite3.connect(store.db_path) as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM exercises"
+                " WHERE user = 'user-1' AND Exercise = 'Squat' AND Date >= '2024'"
+            ).fetchall()
+        assert "exercises_user_exercise_date" in str(plan)
+
+
+def test_training_store_rollups():
+    """Test that rollups are stored with the export and queried."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = TrainingStore(os.path.join(tempdir, "store.sqlite3"))
+        store.save("user-1", "digest-1", sets_df, workouts_df, exercise_dfs)
+
+        for period in Period:
+            expected = compute_rollups(exercise_dfs, period)
+            expected["Exercise"] = expected["Exercise"].astype(object)
+            pd.testing.assert_frame_equal(store.rollups("user-1", period), expected)
+
+        rollups_df = store.rollups(
+            "user-1", Period.WEEK, "Squat", start=datetime(2024, 1, 2)
+        )
+        assert rollups_df["period_start"].tolist() == [
+            pd.Timestamp("2024-01-08"),
+            pd.Timestamp("2024-01-15"),
+        ]
+        assert store.rollups("user-2", Period.WEEK).empty
+
+
+def test_training_store_records():
+    """Test that records are stored with the export and queried."""
+    sets_df, workouts_df = preprocess_data(TEST_DATA)
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = TrainingStore(os.path.join(tempdir, "store.sqlite3"))
+        store.save("user-1", "digest-1", sets_df, workouts_df, exercise_dfs)
+
+        expected = compute_records(sets_df)
+        expected["Exercise"] = expected["Exercise"].astype(object)
+        pd.testing.assert_frame_equal(
+            store.records("user-1"), expected, check_dtype=False
+        )
+
+        prs_df = store.records("user-1", "Squat", prs_only=True)
+        assert prs_df["Date"].tolist() == [
+            pd.Timestamp("2024-01-01"),
+            pd.Timestamp("2024-01-08"),
+            pd.Timestamp("2024-01-15"),
+        ]
+        assert prs_df["weight"].tolist() == [100.0, 110.0, 110.0]
+        assert prs_df["is_pr"].all()
+        assert store.records("user-2").empty
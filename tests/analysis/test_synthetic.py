@@ -0,0 +1,58 @@
+"""Tests for synthetic.py."""
+
+import io
+
+from strengthstats.analysis.constants import ET
+from strengthstats.analysis.preprocessor import (
+    get_all_exercises_dfs,
+    iter_workout_blocks,
+    preprocess_export,
+)
+from strengthstats.analysis.synthetic import write_export
+
+
+def synthetic_export(n_sets, seed=0, n_exercises=40):
+    """Return a synthetic export as text."""
+    export = io.StringIO()
+    write_export(export, n_sets, seed=seed, n_exercises=n_exercises)
+    return export.getvalue()
+
+
+def test_write_export_is_seeded():
+    """Test that the same seed gives the same export."""
+    assert synthetic_export(500, seed=1) == synthetic_export(500, seed=1)
+    assert synthetic_export(500, seed=1) != synthetic_export(500, seed=2)
+
+
+def test_write_export_can_be_parsed():
+    """Test that exports have the requested sets, of every kind."""
+    export = synthetic_export(1000, n_exercises=60)
+
+    blocks = list(iter_workout_blocks(io.StringIO(export)))
+    assert sum(len(block.sets) for block in blocks) == 1000
+    dates = [block.workout[1] for block in blocks]
+    assert dates == sorted(dates, reverse=True)
+    keys = {key for block in blocks for row in block.sets for key in row[3::2]}
+    assert keys == {
+        "reps",
+        "weight",
+        "bodyweight",
+        "extraWeight",
+        "time",
+        "distanceMeter",
+        "height",
+    }
+
+    sets_df, workouts_df = preprocess_export(io.StringIO(export))
+    assert len(workouts_df) == len(blocks)
+    assert sets_df["Exercise"].nunique() > 40
+    exercise_dfs = get_all_exercises_dfs(sets_df)
+    for exercise_type in (ET.REPS, ET.WREPS, ET.OTHER):
+        assert not exercise_dfs[exercise_type].empty
+
+
+def test_write_export_small():
+    """Test that exports with fewer sets than a workout still work."""
+    blocks = list(iter_workout_blocks(io.StringIO(synthetic_export(3))))
+    assert len(blocks) == 1
+    assert len(blocks[0].sets) == 3
@@ -1,12 +1,24 @@
 """Tests for visualizer, for generating plots."""
 
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pathlib import Path
-from unittest.mock import patch
 
 import pandas as pd
+import pytest
+from matplotlib.dates import num2date
 
-from strengthstats.analysis.visualizer import generate_exercise_plots
+from strengthstats.analysis.visualizer import (
+    PlotJob,
+    generate_exercise_plots,
+    get_renderer,
+    is_plot_current,
+    partition_exercises,
+    plot_exercise_series,
+    render_plot_job,
+    render_plot_jobs,
+)
 
 
 def test_generate_exercise_plots():
@@ -35,23 +47,143 @@ def test_generate_exercise_plots():
         ),
     )
     exercise_name = "Deadlift"
-    dst_dir = Path("/path/to/nowhere")
     unit = "ton"
 
-    expected_x_values = pd.Series([day1, day2, day3, day4])
-    expected_y_values = pd.Series([3000, 3300, 3300, 3600])
+    expected_x_values = [day1, day2, day3, day4]
+    expected_y_values = [3000, 3300, 3300, 3600]
 
-    with patch("strengthstats.analysis.visualizer.plt") as plotmock:
-        generate_exercise_plots(deadlift_df, exercise_name, unit, dst_dir)
+    with tempfile.TemporaryDirectory() as tempdir:
+        generate_exercise_plots(deadlift_df, exercise_name, unit, tempdir)
 
-        plotmock.figure.assert_called_once_with(figsize=(8, 6))
+        assert os.path.exists(os.path.join(tempdir, "Deadlift.png"))
 
-        actual_x_values = plotmock.plot.call_args[0][0]
-        actual_y_values = plotmock.plot.call_args[0][1]
-        assert actual_x_values.equals(expected_x_values)
-        assert actual_y_values.equals(expected_y_values)
+    renderer = get_renderer()
+    actual_x_values = num2date(renderer.line.get_xdata())
+    actual_y_values = list(renderer.line.get_ydata())
+    assert [x.replace(tzinfo=None) for x in actual_x_values] == expected_x_values
+    assert actual_y_values == expected_y_values
 
-        plotmock.title.assert_called_once_with("Deadlift progress")
-        plotmock.xlabel.assert_called_once_with("Date")
-        plotmock.ylabel.assert_called_once_with("Volume (ton)")
-        plotmock.savefig.assert_called_once_with("/path/to/nowhere/Deadlift.png")
+    assert renderer.axes.get_title() == "Deadlift progress"
+    assert renderer.axes.get_xlabel() == "Date"
+    assert renderer.axes.get_ylabel() == "Volume (ton)"
+
+
+def test_get_renderer_per_thread():
+    """Test that each thread reuses its own renderer."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        renderers = list(executor.map(lambda _: id(get_renderer()), range(2)))
+
+    assert get_renderer() is get_renderer()
+    assert id(get_renderer()) not in renderers
+
+
+def test_partition_exercises():
+    """Test splitting an exercise DataFrame by exercise name."""
+    day1 = datetime(year=2024, month=1, day=1)
+    exercise_df = pd.DataFrame(
+        [(day1, "Deadlift", 3000), (day1, "Squat", 2000), (day1, "Deadlift", 10)],
+        columns=pd.Index(["Date", "Exercise", "total_volume"]),
+    )
+
+    partitions = partition_exercises(exercise_df)
+
+    assert list(partitions) == ["Deadlift", "Squat"]
+    assert list(partitions["Deadlift"]["total_volume"]) == [3000, 10]
+    assert list(partitions["Squat"]["total_volume"]) == [2000]
+
+
+def test_render_plot_jobs():
+    """Test rendering plots serially and in worker processes."""
+    day1 = datetime(year=2024, month=1, day=1)
+    day2 = datetime(year=2024, month=1, day=2)
+    exercise_df = pd.DataFrame(
+        [
+            (day1, "Deadlift", 3000),
+            (day2, "Deadlift", 3300),
+            (day1, "Squat", 2000),
+            (day2, "Squat", 2200),
+        ],
+        columns=pd.Index(["Date", "Exercise", "total_volume"]),
+    )
+
+    for workers in (1, 2):
+        with tempfile.TemporaryDirectory() as tempdir:
+            jobs = [
+                PlotJob(
+                    exercise_rows["Date"].to_numpy(),
+                    exercise_rows["total_volume"].to_numpy(),
+                    exercise_name,
+                    "kg",
+                    tempdir,
+                )
+                for exercise_name, exercise_rows in partition_exercises(
+                    exercise_df
+                ).items()
+            ]
+            render_plot_jobs(jobs, workers=workers)
+
+            assert os.path.exists(os.path.join(tempdir, "Deadlift.png"))
+            assert os.path.exists(os.path.join(tempdir, "Squat.png"))
+
+
+def test_render_plot_jobs_skips_unchanged_plots():
+    """Test that plots are only rendered again when data changed."""
+    day1 = datetime(year=2024, month=1, day=1)
+    day2 = datetime(year=2024, month=1, day=2)
+    dates = pd.Series([day1, day2]).to_numpy()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        job = PlotJob(dates, pd.Series([100, 110]).to_numpy(), "Squat", "kg", tempdir)
+        assert not is_plot_current(job)
+        assert render_plot_jobs([job], workers=1) == 1
+        assert is_plot_current(job)
+        assert render_plot_jobs([job], workers=1) == 0
+
+        changed_job = job._replace(volumes=pd.Series([100, 120]).to_numpy())
+        assert not is_plot_current(changed_job)
+        assert render_plot_jobs([changed_job], workers=1) == 1
+
+        other_unit_job = changed_job._replace(unit="lb")
+        assert not is_plot_current(other_unit_job)
+
+        downsampled_job = changed_job._replace(max_points=100)
+        assert not is_plot_current(downsampled_job)
+
+
+def test_render_plot_job_replaces_files_atomically(monkeypatch):
+    """Test that a failed render keeps the previous plot files."""
+    dates = pd.Series([datetime(2024, 1, 1), datetime(2024, 1, 2)]).to_numpy()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        job = PlotJob(dates, pd.Series([100, 110]).to_numpy(), "Squat", "kg", tempdir)
+        render_plot_job(job)
+        assert sorted(os.listdir(tempdir)) == ["Squat.fingerprint", "Squat.png"]
+        with open(os.path.join(tempdir, "Squat.png"), "rb") as f:
+            png = f.read()
+
+        def fail_after_writing(self, *args):
+            with open(args[-1], "wb") as f:
+                f.write(b"partial")
+            raise OSError("Disk full")
+
+        monkeypatch.setattr(type(get_renderer()), "render", fail_after_writing)
+        with pytest.raises(OSError):
+            render_plot_job(job._replace(volumes=pd.Series([100, 120]).to_numpy()))
+
+        assert sorted(os.listdir(tempdir)) == ["Squat.fingerprint", "Squat.png"]
+        with open(os.path.join(tempdir, "Squat.png"), "rb") as f:
+            assert f.read() == png
+        assert is_plot_current(job)
+
+
+def test_plot_exercise_series_downsamples():
+    """Test that long series are downsampled to the point budget."""
+    dates = pd.date_range("2020-01-01", periods=2000).to_numpy()
+    volumes = pd.Series(range(2000), dtype="float64").to_numpy() % 100
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        plot_exercise_series(dates, volumes, "Squat", "kg", tempdir, max_points=200)
+        assert len(get_renderer().line.get_xdata()) == 200
+
+        plot_exercise_series(dates[:150], volumes[:150], "Squat", "kg", tempdir, 200)
+        assert len(get_renderer().line.get_xdata()) == 150
@@ -0,0 +1,105 @@
+"""Tests for cli.py."""
+
+import csv
+import os
+import tempfile
+
+import pandas as pd
+
+from strengthstats.analysis.synthetic import generate_export
+from strengthstats.cli import (
+    analyze_export,
+    analyze_exports,
+    find_exports,
+    format_throughput,
+    main,
+)
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def read_summary(output_dir):
+    """Read the summary rows of a batch, keyed by export."""
+    with open(os.path.join(output_dir, "summary.csv")) as f:
+        return {row["export"]: row for row in csv.DictReader(f)}
+
+
+def test_find_exports():
+    """Test that directories and glob patterns are expanded."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        for name in ("a.csv", "b.csv", "notes.txt"):
+            open(os.path.join(tempdir, name), "w").close()
+
+        a_path = os.path.join(tempdir, "a.csv")
+        b_path = os.path.join(tempdir, "b.csv")
+        assert find_exports([tempdir]) == [a_path, b_path]
+        assert find_exports([os.path.join(tempdir, "b*"), a_path]) == [a_path, b_path]
+
+
+def test_main_reports_failures_without_aborting():
+    """Test that a bad export fails alone and the batch continues."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        exports_dir = os.path.join(tempdir, "exports")
+        os.mkdir(exports_dir)
+        generate_export(os.path.join(exports_dir, "synthetic.csv"), 200)
+        with open(os.path.join(exports_dir, "broken.csv"), "w") as f:
+            f.write("not,an,export\n")
+        output_dir = os.path.join(tempdir, "output")
+
+        for workers in (1, 2):
+            status = main(
+                [exports_dir, TEST_DATA, "-o", output_dir, "-w", str(workers), "-q"]
+            )
+            assert status == 1
+
+            summary = read_summary(output_dir)
+            broken = summary[os.path.join(exports_dir, "broken.csv")]
+            assert broken["status"] == "failed"
+            assert broken["error"].startswith("NotAnExportError")
+            sample = summary[TEST_DATA]
+            assert sample["status"] == "ok"
+            assert sample["workouts"] == "4"
+            assert sample["first_workout"] == "2023-12-15"
+
+            exercises_df = pd.read_csv(
+                os.path.join(output_dir, "sample_export", "exercises.csv")
+            )
+            squat = exercises_df[exercises_df["Exercise"] == "Squat"]
+            assert squat["exercise_type"].tolist() == ["WREPS"] * 3
+            assert os.path.exists(os.path.join(output_dir, "synthetic", "workouts.csv"))
+
+        assert main([TEST_DATA, "-o", output_dir, "-w", "1", "-q"]) == 0
+
+
+def analyze_or_crash(export_path, output_dir):
+    """Analyze an export, or kill the worker if it is crash.csv."""
+    if os.path.basename(export_path) == "crash.csv":
+        os._exit(1)
+    return analyze_export(export_path, output_dir)
+
+
+def test_analyze_exports_survives_dying_worker():
+    """Test that a killed worker only fails the export it analyzed."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        exports = []
+        for name in ("a", "b", "crash", "c", "d", "e"):
+            exports.append(os.path.join(tempdir, f"{name}.csv"))
+            generate_export(exports[-1], 100)
+
+        results = analyze_exports(
+            exports, os.path.join(tempdir, "output"), 2, analyze=analyze_or_crash
+        )
+
+        assert [result.export for result in results] == exports
+        failed = [result.export for result in results if result.error is not None]
+        assert failed == [os.path.join(tempdir, "crash.csv")]
+        assert results[2].error.startswith("BrokenProcessPool")
+        assert all(result.sets > 0 for result in results if result.error is None)
+
+
+def test_format_throughput():
+    """Test the throughput statistics printed after a batch."""
+    assert format_throughput([], 2.0) == (
+        "Analyzed 0 of 0 exports (0 failed) with 0 sets in 2.00 s:"
+        " 0.0 exports/s, 0 sets/s"
+    )
@@ -1,18 +1,78 @@
 """Tests for the main app logic."""
 
+import gzip
+import html
+import io
 import os
+import re
+import subprocess
+import sys
 import tempfile
+import textwrap
+import time
 from datetime import datetime
+from urllib.parse import unquote
 
 import numpy as np
 import pandas as pd
+import pytest
+from flask import url_for
 
-from strengthstats.analysis.constants import ET
-from strengthstats.webapp.app import generate_plots
+from strengthstats.analysis.constants import DIVIDING_LINE, ET
+from strengthstats.analysis.plotfiles import fingerprint_path, plot_path
+from strengthstats.analysis.visualizer import PlotJob
+from strengthstats.webapp import app as webapp
+from strengthstats.webapp.app import (
+    app,
+    get_storage,
+    plan_plots,
+    prewarm_plots,
+    render_plot,
+)
 
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
 
-def test_generate_plots():
-    """Test that plots get generated and saved correctly."""
+
+@pytest.fixture
+def tempdir(monkeypatch):
+    """Point the data, cache and store of the app to a temporary folder.
+
+    Background work of the app is waited for before the folder is
+    removed, and the stores and storage managers opened in it are
+    dropped.
+    """
+    with tempfile.TemporaryDirectory() as tempdir:
+        monkeypatch.setitem(app.config, "DATA_FOLDER", tempdir)
+        monkeypatch.setitem(app.config, "CACHE_FOLDER", os.path.join(tempdir, "cache"))
+        monkeypatch.setitem(
+            app.config, "STORE_PATH", os.path.join(tempdir, "store.sqlite3")
+        )
+        monkeypatch.setattr(webapp, "_stores", {})
+        monkeypatch.setattr(webapp, "_storages", {})
+        try:
+            yield tempdir
+        finally:
+            assert webapp.report_jobs.wait(timeout=60)
+            # Plots are pre-warmed one batch after the other
+            webapp.plot_prewarmer.submit(lambda: None).result(timeout=60)
+            webapp.store_writer.submit(lambda: None).result(timeout=60)
+            for storage in webapp._storages.values():
+                storage.stop_sweeper()
+
+
+def wait_for_report(client, timeout=30):
+    """Poll the report status until the report job has finished."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get("/report/status").json
+        if status["stage"] in ("done", "failed"):
+            return status
+        time.sleep(0.05)
+    raise TimeoutError("The report job did not finish in time")
+
+
+def test_plan_plots():
+    """Test that plots are planned, and rendered once when requested."""
     day1 = datetime(year=2024, month=1, day=1)
     day2 = datetime(year=2024, month=1, day=2)
     day3 = datetime(year=2024, month=1, day=3)
@@ -59,14 +119,371 @@ def test_generate_plots():
         )
     }
     with tempfile.TemporaryDirectory() as tempdir:
-        session = {
-            "id": "test-id",
-            "user_folder": tempdir,
-        }
-        generate_plots(
+        plot_jobs = plan_plots(
             sets_df=sets_df,
             exercise_dfs=exercise_dfs,
             plots_dir=tempdir,
-            session=session,
         )
+        assert [job.exercise_name for job in plot_jobs] == ["Deadlift"]
+        assert os.listdir(tempdir) == []
+
+        assert render_plot(plot_jobs[0])
         assert os.path.exists(os.path.join(tempdir, "Deadlift.png"))
+        assert not render_plot(plot_jobs[0])
+
+
+def test_prewarm_plots_in_worker_processes(tempdir, monkeypatch):
+    """Test that plots are pre-rendered by a pool of processes."""
+    monkeypatch.setitem(app.config, "PLOT_WORKERS", 2)
+    user_folder = os.path.join(tempdir, "prewarm")
+    plots_dir = os.path.join(user_folder, "plots")
+    os.makedirs(plots_dir)
+    dates = pd.Series([datetime(2024, 1, 1), datetime(2024, 1, 2)]).to_numpy()
+    plot_jobs = [
+        PlotJob(dates, np.array([100.0, 110.0]), exercise_name, "kg", plots_dir)
+        for exercise_name in ["Squat", "Deadlift", "Bench Press"]
+    ]
+
+    assert prewarm_plots("prewarm", plot_jobs) == 3
+    for plot_job in plot_jobs:
+        assert os.path.exists(plot_path(plots_dir, plot_job.exercise_name))
+    assert prewarm_plots("prewarm", plot_jobs) == 0
+
+
+def test_get_exercise_series(tempdir):
+    """Test that exercise series are returned column-wise as JSON."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["id"] = "exercise-series"
+        session["csv_path"] = TEST_DATA
+        session["user_folder"] = tempdir
+
+    response = client.get("/api/exercises/Squat")
+    assert response.status_code == 200
+    assert os.path.exists(os.path.join(tempdir, "columns", "manifest.json"))
+    assert response.json == {
+        "exercise": "Squat",
+        "exercise_type": "WREPS",
+        "unit": "kg",
+        "Date": ["2024-01-01", "2024-01-08", "2024-01-15"],
+        "total_volume": [2400.0, 2470.0, 2570.0],
+        "max_weight": [100.0, 110.0, 110.0],
+        "total_reps": [24.0, 24.0, 24.0],
+    }
+
+    response = client.get("/api/exercises/Squat?start=2024-01-02&end=2024-01-10")
+    assert response.json["Date"] == ["2024-01-08"]
+
+    response = client.get("/api/exercises/Push-Up")
+    assert response.json["exercise_type"] == "REPS"
+    assert response.json["max_weight"] == [None, None]
+
+    response = client.get("/api/exercises/Squat?max_points=3")
+    assert response.json["Date"] == ["2024-01-01", "2024-01-08", "2024-01-15"]
+    assert client.get("/api/exercises/Squat?max_points=2").status_code == 400
+    assert client.get("/api/exercises/Squat?max_points=lots").status_code == 400
+
+    assert client.get("/api/exercises/Squat?start=yesterday").status_code == 400
+    assert client.get("/api/exercises/Snatch").status_code == 404
+
+    metrics = client.get("/metrics")
+    assert metrics.mimetype == "text/plain"
+    assert 'strengthstats_stage_rows_total{stage="load_export"}' in metrics.text
+
+
+def test_get_rollups(tempdir):
+    """Test that rollups are returned column-wise as JSON."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["id"] = "rollups"
+        session["csv_path"] = TEST_DATA
+        session["user_folder"] = tempdir
+
+    response = client.get("/api/rollups/month?exercise=Squat")
+    assert response.status_code == 200
+    assert response.json == {
+        "period": "month",
+        "exercise": ["Squat"],
+        "exercise_type": ["WREPS"],
+        "period_start": ["2024-01-01"],
+        "workouts": [3],
+        "sets": [9],
+        "total_reps": [72],
+        "max_weight": [110.0],
+        "total_volume": [7440.0],
+    }
+
+    assert all(type(value) is int for value in response.json["workouts"])
+
+    response = client.get("/api/rollups/week?start=2024-01-15")
+    assert set(response.json["period_start"]) == {"2024-01-15"}
+
+    assert client.get("/api/rollups/year").status_code == 404
+    assert client.get("/api/rollups/week?end=tomorrow").status_code == 400
+
+
+def test_get_records(tempdir):
+    """Test that records and PRs are returned column-wise as JSON."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["id"] = "records"
+        session["csv_path"] = TEST_DATA
+        session["user_folder"] = tempdir
+
+    response = client.get("/api/records?exercise=Squat")
+    assert response.status_code == 200
+    assert len(response.json["Date"]) == 9
+    assert response.json["is_pr"].count(True) == 3
+
+    response = client.get("/api/records?exercise=Squat&prs_only=1")
+    assert response.json == {
+        "exercise": ["Squat", "Squat", "Squat"],
+        "Date": ["2024-01-01", "2024-01-08", "2024-01-15"],
+        "is_pr": [True, True, True],
+        "reps": [10.0, 7.0, 10.0],
+        "weight": [100.0, 110.0, 110.0],
+        "e1rm": [100.0 * (1 + 10 / 30), 110.0 * (1 + 7 / 30), 110.0 * (1 + 10 / 30)],
+        "best_e1rm": [
+            100.0 * (1 + 10 / 30),
+            110.0 * (1 + 7 / 30),
+            110.0 * (1 + 10 / 30),
+        ],
+    }
+
+
+def test_generate_report_client_side_charts(tempdir, monkeypatch):
+    """Test that the report links every exercise to its series."""
+    monkeypatch.setitem(app.config, "CLIENT_SIDE_CHARTS", True)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["id"] = "client-side-charts"
+        session["csv_path"] = TEST_DATA
+        session["user_folder"] = tempdir
+
+    client.get("/report")
+    assert wait_for_report(client)["stage"] == "done"
+    response = client.get("/report")
+    assert response.status_code == 200
+    assert b'data-series-url="/api/exercises/Squat"' in response.data
+    assert b'data-series-url="/api/exercises/Bench%20Press"' in response.data
+    assert not os.path.exists(os.path.join(tempdir, "plots"))
+
+
+def test_upload_generates_report_in_background(tempdir):
+    """Test that uploading queues the report and /report shows it."""
+    client = app.test_client()
+    assert client.get("/report/status").status_code == 404
+
+    with open(TEST_DATA, "rb") as f:
+        response = client.post(
+            "/upload_csv",
+            data={"strengthlog_csv": (io.BytesIO(f.read()), "export.csv")},
+        )
+    assert response.status_code == 302
+    assert response.location == "/report"
+
+    assert wait_for_report(client) == {"stage": "done", "error": None}
+    # The report doesn't wait for the export to be saved to the store
+    webapp.store_writer.submit(lambda: None).result(timeout=60)
+    assert webapp.get_store().digest(session_id(client)) is not None
+    response = client.get("/report")
+    assert response.status_code == 200
+    assert b"This page will contain the report" in response.data
+    # Every exercise is listed, and its plot rendered when requested
+    urls = re.findall(r'src="(/plots/[^"]+)"', response.text)
+    assert len(urls) > 10
+    assert urls[0].startswith("/plots/Squat.png?v=")
+    with client.session_transaction() as session:
+        plots_dir = os.path.join(session["user_folder"], "plots")
+    response = client.get(html.unescape(urls[-1]))
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert "immutable" in response.headers["Cache-Control"]
+    exercise_name = unquote(urls[-1].split(".png")[0].removeprefix("/plots/"))
+    assert os.path.exists(plot_path(plots_dir, exercise_name))
+
+
+def test_get_plot(tempdir):
+    """Test that plots are served with their fingerprint as ETag."""
+    plots_dir = os.path.join(tempdir, "plots")
+    os.mkdir(plots_dir)
+    exercise_name = "Curl 50/50 #2?"
+    with open(plot_path(plots_dir, exercise_name), "wb") as f:
+        f.write(b"PNG data")
+    with open(fingerprint_path(plots_dir, exercise_name), "w") as f:
+        f.write("fingerprint-1")
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_folder"] = tempdir
+
+    with app.test_request_context():
+        url = url_for("get_plot", exercise_name=exercise_name, v="fingerprint-1")
+    assert url == "/plots/Curl%2050/50%20%232%3F.png?v=fingerprint-1"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == b"PNG data"
+    assert response.mimetype == "image/png"
+    assert response.headers["ETag"] == '"fingerprint-1"'
+    assert "immutable" in response.headers["Cache-Control"]
+    last_modified = response.headers["Last-Modified"]
+
+    response = client.get(url, headers={"If-None-Match": '"fingerprint-1"'})
+    assert response.status_code == 304
+    assert response.data == b""
+    response = client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    # Outdated or unversioned URLs must be revalidated
+    response = client.get(url.replace("fingerprint-1", "fingerprint-0"))
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert client.get("/plots/Squat.png").status_code == 404
+    assert client.get("/plots/..%2Fstore.png").status_code == 404
+
+
+def test_evicted_session_uploads_again(tempdir):
+    """Test that a session whose folder was evicted can upload again."""
+    client = app.test_client()
+    with open(TEST_DATA, "rb") as f:
+        data = f.read()
+    client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(data), "export.csv")},
+    )
+    assert wait_for_report(client)["stage"] == "done"
+    assert session_id(client) in os.listdir(tempdir)
+
+    storage = get_storage()
+    storage.ttl_seconds = 0
+    assert storage.sweep() == [session_id(client)]
+    assert session_id(client) not in os.listdir(tempdir)
+    assert os.path.exists(os.path.join(tempdir, "cache"))
+
+    response = client.get("/report")
+    assert response.status_code == 302
+    assert response.location == "/"
+    assert client.get("/report/status").status_code == 404
+
+    response = client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(data), "export.csv")},
+    )
+    assert response.location == "/report"
+    assert wait_for_report(client)["stage"] == "done"
+    assert client.get("/report").status_code == 200
+
+
+def session_id(client):
+    """Return the session ID of a test client."""
+    with client.session_transaction() as session:
+        return session["id"]
+
+
+def test_report_is_cached_precompressed(tempdir):
+    """Test that the report is served compressed until a new upload."""
+    client = app.test_client()
+    with open(TEST_DATA, "rb") as f:
+        data = f.read()
+    client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(data), "export.csv")},
+    )
+    assert wait_for_report(client)["stage"] == "done"
+
+    response = client.get("/report", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.content_encoding == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    html = gzip.decompress(response.data).decode()
+    assert "This page will contain the report" in html
+
+    response = client.get("/report")
+    assert response.content_encoding is None
+    assert response.text == html
+    etag = response.headers["ETag"]
+    response = client.get("/report", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    with client.session_transaction() as session:
+        report_dir = os.path.join(session["user_folder"], "report")
+    assert os.path.exists(os.path.join(report_dir, "report.html.gz"))
+    client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(data[:-1]), "export.csv")},
+    )
+    assert not os.path.exists(report_dir)
+
+
+def test_upload_rejects_bad_files(tempdir, monkeypatch):
+    """Test that bad uploads get an HTTP error instead of a report."""
+    client = app.test_client()
+
+    response = client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(b"Date,Weight\n"), "export.csv")},
+    )
+    assert response.status_code == 400
+
+    monkeypatch.setitem(app.config, "UPLOAD_MAX_BYTES", 100)
+    with open(TEST_DATA, "rb") as f:
+        data = gzip.compress(f.read())
+    response = client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(data), "export.csv.gz")},
+    )
+    assert response.status_code == 413
+
+
+def test_upload_rejects_export_without_workouts(tempdir):
+    """Test that a header-only export gets an HTTP error, not a 500."""
+    client = app.test_client()
+    with open(TEST_DATA, "rb") as f:
+        header = f.read().split(b"\n\n")[0]
+    data = header + b"\n\nWorkouts\n" + DIVIDING_LINE.encode() + b"\n"
+
+    response = client.post(
+        "/upload_csv",
+        data={"strengthlog_csv": (io.BytesIO(data), "export.csv")},
+    )
+    assert response.status_code == 302
+    status = wait_for_report(client)
+    assert status["stage"] == "failed"
+    assert "does not contain any workouts" in status["error"]
+
+    response = client.get("/report")
+    assert response.status_code == 400
+    assert b"does not contain any workouts" in response.data
+
+
+def test_light_routes_dont_import_analysis_stack():
+    """Test that pandas and matplotlib are only imported when needed."""
+    script = textwrap.dedent(f"""
+        import io, sys, tempfile
+
+        import strengthstats.webapp.app as webapp
+
+        def heavy_modules():
+            return {{"pandas", "matplotlib"}} & set(sys.modules)
+
+        assert not heavy_modules(), heavy_modules()
+
+        webapp.app.config["DATA_FOLDER"] = tempfile.mkdtemp()
+        # Generating the report needs pandas, so leave it out
+        webapp.run_report_job = lambda *args: {{}}
+        client = webapp.app.test_client()
+        assert client.get("/").status_code == 200
+        with open("{os.path.abspath(TEST_DATA)}", "rb") as f:
+            data = {{"strengthlog_csv": (io.BytesIO(f.read()), "export.csv")}}
+        assert client.post("/upload_csv", data=data).status_code == 302
+        assert client.get("/metrics").status_code == 200
+        assert not heavy_modules(), heavy_modules()
+
+        webapp.warm_up()
+        assert heavy_modules() == {{"pandas", "matplotlib"}}
+        """)
+    with tempfile.TemporaryDirectory() as tempdir:
+        subprocess.run(
+            [sys.executable, "-c", script],
+            check=True,
+            cwd=tempdir,
+            env={**os.environ, "PYTHONPATH": os.getcwd()},
+        )
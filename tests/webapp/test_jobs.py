@@ -0,0 +1,122 @@
+"""Tests for jobs.py."""
+
+import threading
+import time
+
+import pytest
+
+from strengthstats.webapp.jobs import (
+    QueueFullError,
+    ReportJobQueue,
+    SingleFlight,
+    Stage,
+)
+
+
+def wait_until_finished(job, timeout=10):
+    """Wait for a job to be done or to fail."""
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, "The job did not finish in time"
+        time.sleep(0.01)
+
+
+def test_report_job_queue_runs_job_once_per_key():
+    """Test that submitting a running job again returns the same job."""
+    queue = ReportJobQueue(max_workers=1, max_pending=4)
+    release = threading.Event()
+    calls = []
+
+    def work(job):
+        calls.append(job.key)
+        job.set_stage(Stage.PLOT)
+        release.wait(10)
+        return {"plots": 3}
+
+    job = queue.submit("a", work)
+    assert queue.submit("a", work) is job
+    assert queue.get("a") is job
+    assert queue.get("b") is None
+
+    release.set()
+    wait_until_finished(job)
+    assert job.stage == Stage.DONE
+    assert job.result == {"plots": 3}
+    assert queue.submit("a", work) is job
+    assert calls == ["a"]
+
+
+def test_report_job_queue_records_failures():
+    """Test that failed jobs keep their error and can be retried."""
+    queue = ReportJobQueue(max_workers=1, max_pending=4)
+
+    def fail(job):
+        raise ValueError("Broken export")
+
+    job = queue.submit("a", fail)
+    wait_until_finished(job)
+    assert job.stage == Stage.FAILED
+    assert job.error == "Broken export"
+    assert isinstance(job.exception, ValueError)
+
+    retry = queue.submit("a", lambda job: None)
+    assert retry is not job
+    wait_until_finished(retry)
+    assert retry.stage == Stage.DONE
+
+
+def test_report_job_queue_is_bounded():
+    """Test that too many jobs in flight are rejected."""
+    queue = ReportJobQueue(max_workers=1, max_pending=2, max_finished=1)
+    release = threading.Event()
+
+    first = queue.submit("a", lambda job: release.wait(10))
+    queue.submit("b", lambda job: release.wait(10))
+    with pytest.raises(QueueFullError):
+        queue.submit("c", lambda job: None)
+    assert not queue.wait(timeout=0.01)
+
+    release.set()
+    assert queue.wait(timeout=10)
+    assert first.finished and queue.get("b").finished
+    queue.submit("c", lambda job: None)
+    # Only the most recent finished job is kept
+    assert queue.get("a") is None
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    """Test that concurrent calls with one key share a single run."""
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def render():
+        calls.append(threading.current_thread().name)
+        started.set()
+        release.wait(10)
+        return "plot.png"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight.run("Squat", render))
+        )
+        for _ in range(4)
+    ]
+    threads[0].start()
+    assert started.wait(10)
+    for thread in threads[1:]:
+        thread.start()
+    # Give the other callers time to join the call in flight
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert results == ["plot.png"] * 4
+    assert len(calls) == 1
+
+    # Finished calls are run again, and exceptions reach the caller
+    with pytest.raises(ZeroDivisionError):
+        single_flight.run("Squat", lambda: 1 / 0)
+    assert single_flight.run("Squat", lambda: "new.png") == "new.png"
@@ -0,0 +1,41 @@
+"""Tests for the cache of rendered reports."""
+
+import gzip
+import os
+import tempfile
+
+from strengthstats.webapp.reports import (
+    ENCODINGS,
+    read_report,
+    remove_report,
+    report_key,
+    write_report,
+)
+
+
+def test_report_roundtrip():
+    """Test that reports are stored precompressed and found by key."""
+    html = "<html><body>" + "<p>Squat progress</p>" * 100 + "</body></html>"
+    key = report_key(("session", "digest-1"), {"plots": {"Squat": "1"}})
+    assert key != report_key(("session", "digest-2"), {"plots": {"Squat": "1"}})
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        report_dir = os.path.join(tempdir, "report")
+        assert read_report(report_dir, key, None) is None
+
+        write_report(report_dir, key, html)
+        assert read_report(report_dir, key, None) == html.encode()
+        assert "gzip" in ENCODINGS
+        compressed = read_report(report_dir, key, "gzip")
+        assert gzip.decompress(compressed) == html.encode()
+        assert len(compressed) < len(html) / 10
+        assert read_report(report_dir, "other-key", "gzip") is None
+
+        # A newer report replaces the old one
+        write_report(report_dir, "other-key", "<html></html>")
+        assert read_report(report_dir, key, None) is None
+        assert read_report(report_dir, "other-key", None) == b"<html></html>"
+        assert os.listdir(tempdir) == ["report"]
+
+        remove_report(report_dir)
+        assert os.listdir(tempdir) == []
@@ -0,0 +1,96 @@
+"""Tests for the quota and TTL management of user folders."""
+
+import os
+import tempfile
+import time
+
+from strengthstats.webapp.storage import UserStorage, folder_size
+
+
+def make_folder(data_dir, name, size, last_used):
+    """Create a user folder holding size bytes, last used then."""
+    os.makedirs(os.path.join(data_dir, name, "plots"))
+    with open(os.path.join(data_dir, name, "plots", "plot.png"), "wb") as f:
+        f.write(b"x" * size)
+    os.utime(os.path.join(data_dir, name), (last_used, last_used))
+
+
+def test_enforce_quota_evicts_least_recently_used():
+    """Test that the oldest folders are evicted until within quota."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        now = time.time()
+        for age, name in enumerate(["newest", "middle", "oldest"]):
+            make_folder(data_dir, name, 100, now - age * 60)
+        assert folder_size(os.path.join(data_dir, "oldest")) == 100
+
+        evicted_users = []
+        storage = UserStorage(
+            data_dir,
+            max_bytes=250,
+            max_folders=10,
+            ttl_seconds=3600,
+            on_evict=evicted_users.append,
+        )
+        assert storage.enforce_quota() == ["oldest"]
+        assert evicted_users == ["oldest"]
+        assert sorted(os.listdir(data_dir)) == ["middle", "newest"]
+
+        # Touching the older folder makes the other one the oldest
+        storage.touch("middle")
+        storage.max_folders = 1
+        assert storage.enforce_quota() == ["newest"]
+        assert os.listdir(data_dir) == ["middle"]
+
+
+def test_record_change_keeps_changed_folder():
+    """Test that a folder growing past the quota is not evicted."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        now = time.time()
+        make_folder(data_dir, "other", 100, now)
+        make_folder(data_dir, "uploader", 10, now - 60)
+        # Leave files, dot folders and excluded folders alone
+        make_folder(data_dir, ".tmp-upload", 1000, now - 600)
+        make_folder(data_dir, "cache", 1000, now - 600)
+        with open(os.path.join(data_dir, "store.sqlite3"), "wb") as f:
+            f.write(b"x" * 1000)
+
+        storage = UserStorage(
+            data_dir,
+            max_bytes=200,
+            max_folders=10,
+            ttl_seconds=3600,
+            exclude=["cache"],
+        )
+        assert storage.enforce_quota() == []
+
+        with open(os.path.join(data_dir, "uploader", "export.csv"), "wb") as f:
+            f.write(b"x" * 150)
+        storage.record_change("uploader")
+        assert sorted(os.listdir(data_dir)) == [
+            ".tmp-upload",
+            "cache",
+            "store.sqlite3",
+            "uploader",
+        ]
+
+
+def test_sweep_evicts_expired_folders():
+    """Test that the sweeper removes folders unused for the TTL."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        now = time.time()
+        make_folder(data_dir, "fresh", 10, now - 60)
+        make_folder(data_dir, "expired", 10, now - 7200)
+
+        storage = UserStorage(
+            data_dir, max_bytes=1000, max_folders=10, ttl_seconds=3600
+        )
+        assert storage.sweep(now) == ["expired"]
+        assert os.listdir(data_dir) == ["fresh"]
+
+        storage.start_sweeper(interval=0.01)
+        storage.ttl_seconds = 0
+        deadline = time.monotonic() + 10
+        while os.listdir(data_dir) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        storage.stop_sweeper()
+        assert os.listdir(data_dir) == []
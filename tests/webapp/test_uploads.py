@@ -0,0 +1,88 @@
+"""Tests for uploads.py."""
+
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+
+import pytest
+
+from strengthstats.analysis.cache import hash_export
+from strengthstats.analysis.exceptions import NotAnExportError
+from strengthstats.webapp.uploads import (
+    UnsupportedUploadError,
+    UploadTooLargeError,
+    save_upload,
+)
+
+TEST_DATA = "tests/analysis/resources/sample_export.csv"
+
+
+def read_test_data():
+    """Return the raw bytes of the test export."""
+    with open(TEST_DATA, "rb") as f:
+        return f.read()
+
+
+def zip_bytes(files):
+    """Return a zip archive with the given file names and contents."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return archive.getvalue()
+
+
+@pytest.mark.parametrize(
+    "compress",
+    [
+        lambda data: data,
+        gzip.compress,
+        lambda data: zip_bytes({"export/strengthlog.csv": data}),
+    ],
+    ids=["plain", "gzip", "zip"],
+)
+def test_save_upload(compress):
+    """Test that uploads are saved as decompressed CSV."""
+    data = read_test_data()
+    with tempfile.TemporaryDirectory() as tempdir:
+        dst_path = os.path.join(tempdir, "export.csv")
+        digest = save_upload(io.BytesIO(compress(data)), dst_path, max_bytes=len(data))
+
+        with open(dst_path, "rb") as f:
+            assert f.read() == data
+        assert digest == hash_export(TEST_DATA)
+        assert os.listdir(tempdir) == ["export.csv"]
+
+
+def test_save_upload_rejects_bad_uploads():
+    """Test that rejected uploads keep the previously saved export."""
+    data = read_test_data()
+    with tempfile.TemporaryDirectory() as tempdir:
+        dst_path = os.path.join(tempdir, "export.csv")
+        with open(dst_path, "wb") as f:
+            f.write(b"previous")
+
+        with pytest.raises(UploadTooLargeError):
+            save_upload(io.BytesIO(data), dst_path, max_bytes=len(data) - 1)
+        with pytest.raises(UploadTooLargeError):
+            bomb = gzip.compress(data + b"\n" * 10_000_000)
+            save_upload(io.BytesIO(bomb), dst_path, max_bytes=1_000_000)
+        with pytest.raises(UploadTooLargeError):
+            archive = zip_bytes({"export.csv": data})
+            save_upload(io.BytesIO(archive), dst_path, max_bytes=len(data) - 1)
+        with pytest.raises(NotAnExportError):
+            save_upload(io.BytesIO(b"Date,Weight\n2024-01-01,70\n"), dst_path, 100)
+        with pytest.raises(NotAnExportError):
+            save_upload(io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00"), dst_path, 100)
+        with pytest.raises(UnsupportedUploadError):
+            archive = zip_bytes({"a.csv": data, "b.csv": data})
+            save_upload(io.BytesIO(archive), dst_path, max_bytes=len(data))
+        with pytest.raises(UnsupportedUploadError):
+            truncated = gzip.compress(data)[:-20]
+            save_upload(io.BytesIO(truncated), dst_path, max_bytes=len(data))
+
+        with open(dst_path, "rb") as f:
+            assert f.read() == b"previous"
+        assert os.listdir(tempdir) == ["export.csv"]